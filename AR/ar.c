@@ -9,8 +9,12 @@
 #include "nb.h"
 #include "hmm.h"
 #include "crf.h"
+#include <pthread.h>
 #include <unistd.h>
+#include <sys/socket.h>
+#include <sys/stat.h>
 #include <sys/times.h>
+#include <sys/un.h>
 
 // Top level function for activity recognition algorithm.
 int main(int argc, char *argv[]) {
@@ -22,7 +26,10 @@ int main(int argc, char *argv[]) {
 	clktck = sysconf(_SC_CLK_TCK); // Determine start time of program
 	startTime = times(&tmsstart);
 	srand(startTime);
+	if ((argc > 1) && (strcmp(argv[1], "-server") == 0))
+		return (Server(argc, argv)); // Stay resident and answer requests
 	printf("AR version 1.0\n\n");
+	results = stdout;
 	fp = Init(argc, argv); // Initialize variables and parameters
 	printf("After Init()\n");
 	ReadData(fp); // Read and store sensor events
@@ -34,7 +41,7 @@ int main(int argc, char *argv[]) {
 		Summarize();
 	Ar(); // Activity recognition
 	if (mode != TRAIN)
-		PrintResults();
+		PrintResults(&folds[numfolds - 1]);
 	Finish();
 
 	endTime = times(&tmsend); // Report time of AR program
@@ -43,10 +50,119 @@ int main(int argc, char *argv[]) {
 	return (0);
 }
 
+// Keep the program resident and answer a sequence of requests read from
+// standard input, or from each connection to a Unix socket when the
+// -socket option is given.  Each request is a line
+//   request <parameter file length> <data file length>
+// followed by the contents of the parameter file and of the data file.
+// Each session starts with a "ready AR version 1.0" line.
+// The reply holds one "<date> <time>    <activity>" line for each
+// classified event and ends with "done <right> <wrong>", or is a single
+// "error <message>" line.  In standard input mode the progress messages
+// are moved to standard error so that standard output only carries
+// replies.
+int Server(int argc, char *argv[]) {
+	FILE *in, *out;
+	int fd, sock;
+	struct sockaddr_un addr;
+
+	server = 1;
+	socketpath[0] = '\0';
+	ReadOptions(argc, argv, 2);
+	if (socketpath[0] == '\0') {
+		fflush(stdout);
+		out = fdopen(dup(1), "w");
+		dup2(2, 1);
+		Serve(argc, argv, stdin, out);
+		fclose(out);
+	} else {
+		sock = socket(AF_UNIX, SOCK_STREAM, 0);
+		memset(&addr, 0, sizeof(addr));
+		addr.sun_family = AF_UNIX;
+		strncpy(addr.sun_path, socketpath, sizeof(addr.sun_path) - 1);
+		unlink(socketpath);
+		if ((sock < 0)
+				|| (bind(sock, (struct sockaddr *) &addr, sizeof(addr)) < 0)
+				|| (listen(sock, 1) < 0)) {
+			printf("Error opening socket %s\n", socketpath);
+			exit(1);
+		}
+		while ((fd = accept(sock, NULL, NULL)) >= 0) {
+			in = fdopen(fd, "r");
+			out = fdopen(dup(fd), "w");
+			Serve(argc, argv, in, out);
+			fclose(in);
+			fclose(out);
+		}
+		close(sock);
+		unlink(socketpath);
+	}
+
+	return (0);
+}
+
+// Answer the requests read from in until it is closed, writing the
+// replies to out.
+void Serve(int argc, char *argv[], FILE *in, FILE *out) {
+	FILE *cfp, *dfp;
+	char buffer[MAXBUFFER], *config, *data;
+	long clength, dlength;
+
+	results = out;
+	// Tell the client this ar has server mode before the first request
+	fprintf(out, "ready AR version 1.0\n");
+	fflush(out);
+	while (fgets(buffer, MAXBUFFER, in) != NULL) {
+		if (sscanf(buffer, "request %ld %ld", &clength, &dlength) != 2) {
+			fprintf(out, "error bad request\n");
+			fflush(out);
+			return;
+		}
+		config = (char *) malloc((clength + 1) * sizeof(char));
+		data = (char *) malloc((dlength + 1) * sizeof(char));
+		if ((fread(config, 1, clength, in) != clength)
+				|| (fread(data, 1, dlength, in) != dlength)) {
+			free(config);
+			free(data);
+			return;
+		}
+		if ((clength == 0) || (dlength == 0)) {
+			fprintf(out, "error empty request\n");
+		} else {
+			cfp = fmemopen(config, clength, "r");
+			dfp = fmemopen(data, dlength, "r");
+			Request(argc, argv, cfp, dfp, dlength);
+			fclose(cfp);
+			fclose(dfp);
+		}
+		fflush(out);
+		free(config);
+		free(data);
+	}
+}
+
+// Train and test a model on a single request of size bytes of data.  The
+// model state is rebuilt from the defaults for every request.
+void Request(int argc, char *argv[], FILE *cfp, FILE *dfp, long size) {
+	InitDefaults();
+	ReadOptions(argc, argv, 2);
+	ReadHeader(cfp);
+	InitEvents(size);
+	InitModel();
+	ReadData(dfp);
+	if (mode != TEST)
+		SelectFeatures();
+	Ar();
+	if (mode != TRAIN)
+		PrintResults(&folds[numfolds - 1]);
+	fprintf(results, "done %d %d\n", totalright, totalwrong);
+	Finish();
+}
+
 // Initialize parameters and data structures.
 FILE *Init(int argc, char *argv[]) {
 	FILE *fp;
-	int i, j;
+	struct stat st;
 
 	printf("Init()\n");
 	if (argc > 2) {
@@ -59,21 +175,9 @@ FILE *Init(int argc, char *argv[]) {
 		printf("Reading data from standard input\n");
 		fp = stdin;
 	}
-	model = NB; // Set default values for global variables
-	strcpy(modelfilename, ".model");
-	numactivities = 1;
-	numfeatures = 5;
-	numphysicalsensors = 1;
-	numsensors = 1;
-	eval = 1;
-	partitiontype = 1;
-	outputlevel = 1;
-	evnum = 0;
-	stream = 0;
-	mode = BOTH;
-	CRFtrainiterations = 30;
+	InitDefaults(); // Set default values for global variables
 	printf("before ReadOptions()\n");
-	ReadOptions(argc, argv); // Process command-line options
+	ReadOptions(argc, argv, 3); // Process command-line options
 	printf("before ReadHeader()\n");
 	ReadHeader(fp); // Process header file
 	printf("before fclose()\n");
@@ -90,139 +194,272 @@ FILE *Init(int argc, char *argv[]) {
 		fp = stdin;
 	}
 
+	// Size the event buffers from the data file when it is a regular file
+	if ((fstat(fileno(fp), &st) == 0) && S_ISREG(st.st_mode))
+		InitEvents(st.st_size);
+	else
+		InitEvents(0);
+	InitModel();
+
+	return (fp);
+}
+
+// Set the default values for global variables.
+void InitDefaults() {
+	model = NB;
+	strcpy(modelfilename, ".model");
+	numactivities = 1;
+	numfeatures = 5;
+	numphysicalsensors = 1;
+	numsensors = 1;
+	eval = 1;
+	partitiontype = 1;
+	outputlevel = 1;
+	evnum = 0;
+	stream = 0;
+	mode = BOTH;
+	threads = 1;
+	CRFtrainiterations = 30;
+}
+
+// Allocate the buffers that hold the sensor events, sized from the number
+// of bytes of data to read.  The events are stored contiguously and the
+// buffers grow as events are added, see GrowEvents().
+void InitEvents(long size) {
+	eventbuffer = NULL;
+	datebuffer = NULL;
+	aevents = NULL;
+	adatetime = NULL;
+	eventcapacity = 0;
+	GrowEvents((int) (size / EVENTBYTES) + EVENTBLOCK);
+}
+
+// Resize the event buffers to hold capacity events (at most MAXALENGTH),
+// keeping the events already stored.  The rows of aevents and adatetime
+// point into the contiguous buffers.
+void GrowEvents(int capacity) {
+	int i;
+
+	if (capacity > MAXALENGTH)
+		capacity = MAXALENGTH;
+	eventbuffer = (int *) realloc(eventbuffer,
+			(size_t) capacity * numfeatures * sizeof(int));
+	datebuffer = (char *) realloc(datebuffer,
+			(size_t) capacity * DATELENGTH * sizeof(char));
+	aevents = (int **) realloc(aevents, capacity * sizeof(int *));
+	adatetime = (char **) realloc(adatetime, capacity * sizeof(char *));
+	if ((eventbuffer == NULL) || (datebuffer == NULL) || (aevents == NULL)
+			|| (adatetime == NULL)) {
+		printf("Unable to store %d events\n", capacity);
+		exit(1);
+	}
+	for (i = 0; i < capacity; i++) {
+		aevents[i] = eventbuffer + ((size_t) i * numfeatures);
+		adatetime[i] = datebuffer + ((size_t) i * DATELENGTH);
+	}
+	eventcapacity = capacity;
+}
+
+// Initialize the data structures of the activity model.
+void InitModel() {
+	int i, j;
+
 	// Initialize variables
-	aevents = (int **) malloc(MAXALENGTH * sizeof(int *));
-	adatetime = (char **) malloc(MAXALENGTH * sizeof(char *));
-	evidence = (int ***) malloc(numactivities * sizeof(int **));
-	emissionProb = (double ***) malloc(numactivities * sizeof(double **));
-	lemissionProb = (LargeNumber ***) malloc(
-			numactivities * sizeof(LargeNumber **));
 	freq = (int **) malloc(numactivities * sizeof(int *));
 	lengthactivities = (int **) malloc(numactivities * sizeof(int *));
 	previousactivity = (int **) malloc(numactivities * sizeof(int *));
 	starts = (int **) malloc(numactivities * sizeof(int *));
-	tr = (double **) malloc(numactivities * sizeof(double *));
-	testevidence = (int **) malloc(numfeatures * sizeof(int *));
 	afreq = (int *) malloc(numactivities * sizeof(int));
 	open = (int *) malloc(numactivities * sizeof(int));
-	stotal = (int *) malloc(numactivities * sizeof(int));
-	prior = (double *) malloc(numactivities * sizeof(double));
-	svalues = (int *) malloc(numfeatures * sizeof(int));
-	sfreq = (int **) malloc(numactivities * sizeof(int *));
-	ltr = (LargeNumber **) malloc(numactivities * sizeof(LargeNumber *));
-	likelihood = (LargeNumber *) malloc(numactivities * sizeof(LargeNumber));
-	lprior = (LargeNumber *) malloc(numactivities * sizeof(LargeNumber));
 	thresholds = (int **) malloc(numfeatures * sizeof(int *));
 
 	for (i = 0; i < numactivities; i++) {
 		afreq[i] = 0;
 		open[i] = 0;
-		evidence[i] = (int **) malloc(numfeatures * sizeof(int *));
-		emissionProb[i] = (double **) malloc(numfeatures * sizeof(double *));
-		lemissionProb[i] = (LargeNumber **) malloc(
-				numfeatures * sizeof(LargeNumber *));
 		freq[i] = (int *) malloc(numactivities * sizeof(int));
 		lengthactivities[i] = (int *) malloc(sizeof(int));
 		previousactivity[i] = (int *) malloc(sizeof(int));
 		starts[i] = (int *) malloc(sizeof(int));
-		tr[i] = (double *) malloc(numactivities * sizeof(double));
-		sfreq[i] = (int *) malloc(numsensors * sizeof(int));
-		ltr[i] = (LargeNumber *) malloc(numactivities * sizeof(LargeNumber));
-		for (j = 0; j < numfeatures; j++) {
-			evidence[i][j] = (int *) malloc(numfeaturevalues[j] * sizeof(int));
-			emissionProb[i][j] = (double *) malloc(
-					numfeaturevalues[j] * sizeof(double));
-			lemissionProb[i][j] = (LargeNumber *) malloc(
-					numfeaturevalues[j] * sizeof(LargeNumber));
-		}
+		lengthactivities[i][0] = 0;
+		previousactivity[i][0] = 0;
+		starts[i][0] = 0;
 		for (j = 0; j < numactivities; j++)
 			freq[i][j] = 0;
-		for (j = 0; j < numsensors; j++)
-			sfreq[i][j] = 0;
 	}
-	for (i = 0; i < MAXALENGTH; i++)
-	{
-		aevents[i] = (int *) malloc(numfeatures * sizeof(int));
-		adatetime[i] = (char *) malloc(26 * sizeof(char));
-	}
-	for (i = 0; i < numfeatures; i++) {
-		testevidence[i] = (int *) malloc(numfeaturevalues[i] * sizeof(int));
+	for (i = 0; i < numfeatures; i++)
 		thresholds[i] = (int *) malloc((numfeaturevalues[i] - 1) * sizeof(int));
-	}
-	
-	
+
+	// One model state per cross validation fold
+	if (mode == BOTH)
+		numfolds = K;
+	else
+		numfolds = 1;
+	folds = (Fold *) malloc(numfolds * sizeof(Fold));
+	for (i = 0; i < numfolds; i++)
+		InitFold(&folds[i], i);
 
 	right = 0;
 	wrong = 0;
+	totalright = 0;
+	totalwrong = 0;
 	evnum = 0;
 	// Because the probabilities get arbitrarily small we represent them in
 	// mantissa exponent format
-	min = MakeLargeNumber((long double) 1);
-	min.mantissa = 1;
-	min.exponent = -10000000;
-
-	return (fp);
+	min = MakeLargeExponent((long double) 1, -10000000);
 }
 
-// Clean up variables.
-void Finish() {
+// Initialize the model state of a fold that tests on partition cvnum.
+void InitFold(Fold *f, int cvnum) {
 	int i, j;
 
+	f->cvnum = cvnum;
+	f->right = 0;
+	f->wrong = 0;
+	f->totalright = 0;
+	f->totalwrong = 0;
+	f->out = results;
+	f->log = stdout;
+	f->outtext = NULL;
+	f->logtext = NULL;
+	f->evidence = (int ***) malloc(numactivities * sizeof(int **));
+	f->emissionProb = (double ***) malloc(numactivities * sizeof(double **));
+	f->lemissionProb = (LargeNumber ***) malloc(
+			numactivities * sizeof(LargeNumber **));
+	f->freq = (int **) malloc(numactivities * sizeof(int *));
+	f->tr = (double **) malloc(numactivities * sizeof(double *));
+	f->testevidence = (int **) malloc(numfeatures * sizeof(int *));
+	f->stotal = (int *) malloc(numactivities * sizeof(int));
+	f->prior = (double *) malloc(numactivities * sizeof(double));
+	f->svalues = (int *) malloc(numfeatures * sizeof(int));
+	f->sfreq = (int **) malloc(numactivities * sizeof(int *));
+	f->ltr = (LargeNumber **) malloc(numactivities * sizeof(LargeNumber *));
+	f->likelihood = (LargeNumber *) malloc(
+			numactivities * sizeof(LargeNumber));
+	f->lprior = (LargeNumber *) malloc(numactivities * sizeof(LargeNumber));
+
 	for (i = 0; i < numactivities; i++) {
+		f->evidence[i] = (int **) malloc(numfeatures * sizeof(int *));
+		f->emissionProb[i] = (double **) malloc(
+				numfeatures * sizeof(double *));
+		f->lemissionProb[i] = (LargeNumber **) malloc(
+				numfeatures * sizeof(LargeNumber *));
+		f->freq[i] = (int *) malloc(numactivities * sizeof(int));
+		f->tr[i] = (double *) malloc(numactivities * sizeof(double));
+		f->sfreq[i] = (int *) malloc(numsensors * sizeof(int));
+		f->ltr[i] = (LargeNumber *) malloc(
+				numactivities * sizeof(LargeNumber));
 		for (j = 0; j < numfeatures; j++) {
-			free(evidence[i][j]);
-			free(emissionProb[i][j]);
-			free(lemissionProb[i][j]);
+			f->evidence[i][j] = (int *) malloc(
+					numfeaturevalues[j] * sizeof(int));
+			f->emissionProb[i][j] = (double *) malloc(
+					numfeaturevalues[j] * sizeof(double));
+			f->lemissionProb[i][j] = (LargeNumber *) malloc(
+					numfeaturevalues[j] * sizeof(LargeNumber));
 		}
+		for (j = 0; j < numactivities; j++)
+			f->freq[i][j] = 0;
+		for (j = 0; j < numsensors; j++)
+			f->sfreq[i][j] = 0;
+	}
+	for (i = 0; i < numfeatures; i++)
+		f->testevidence[i] = (int *) malloc(
+				numfeaturevalues[i] * sizeof(int));
+}
+
+// Clean up variables.
+void Finish() {
+	int i;
+
+	for (i = 0; i < numfolds; i++)
+		FinishFold(&folds[i]);
+	free(folds);
+	folds = NULL;
+	numfolds = 0;
+	for (i = 0; i < numactivities; i++) {
 		free(lengthactivities[i]);
 		free(previousactivity[i]);
 		free(starts[i]);
-		free(evidence[i]);
-		free(emissionProb[i]);
-		free(lemissionProb[i]);
 		free(freq[i]);
 		if (sizes != NULL)
 			free(sizes[i]);
-		free(tr[i]);
-		free(sfreq[i]);
-		free(ltr[i]);
 		free(activitynames[i]);
 	}
-	for (i = 0; i < numfeatures; i++) {
-		free(testevidence[i]);
+	for (i = 0; i < numfeatures; i++)
 		free(thresholds[i]);
-	}
 	free(afreq);
 	free(open);
 	free(lengthactivities);
 	free(previousactivity);
 	free(freq);
-	free(prior);
-	free(lprior);
-	free(stotal);
-	free(svalues);
 	free(selectfeatures);
+	free(eventbuffer);
+	free(datebuffer);
 	free(aevents);
 	free(adatetime);
+	eventbuffer = NULL;
+	datebuffer = NULL;
+	aevents = NULL;
+	adatetime = NULL;
+	eventcapacity = 0;
 	free(starts);
 	if (sizes != NULL)
 		free(sizes);
+	sizes = NULL;
+	if (partition != NULL)
+		free(partition);
+	partition = NULL;
+	if (sensormap != NULL) {
+		for (i = 0; i < numphysicalsensors; i++) {
+			free(sensormap[i][0]);
+			free(sensormap[i][1]);
+			free(sensormap[i]);
+		}
+		free(sensormap);
+	}
+	sensormap = NULL;
 	free(numfeaturevalues);
-	free(tr);
-	free(sfreq);
-	free(ltr);
-	free(evidence);
-	free(testevidence);
 	free(thresholds);
-	free(emissionProb);
-	free(lemissionProb);
-	free(likelihood);
 	free(activitynames);
 }
 
-// Process command-line options.
-void ReadOptions(int argc, char *argv[]) {
-	int i = 3;
+// Clean up the model state of a fold.
+void FinishFold(Fold *f) {
+	int i, j;
+
+	for (i = 0; i < numactivities; i++) {
+		for (j = 0; j < numfeatures; j++) {
+			free(f->evidence[i][j]);
+			free(f->emissionProb[i][j]);
+			free(f->lemissionProb[i][j]);
+		}
+		free(f->evidence[i]);
+		free(f->emissionProb[i]);
+		free(f->lemissionProb[i]);
+		free(f->freq[i]);
+		free(f->tr[i]);
+		free(f->sfreq[i]);
+		free(f->ltr[i]);
+	}
+	for (i = 0; i < numfeatures; i++)
+		free(f->testevidence[i]);
+	free(f->freq);
+	free(f->prior);
+	free(f->lprior);
+	free(f->stotal);
+	free(f->svalues);
+	free(f->tr);
+	free(f->sfreq);
+	free(f->ltr);
+	free(f->evidence);
+	free(f->testevidence);
+	free(f->emissionProb);
+	free(f->lemissionProb);
+	free(f->likelihood);
+}
+
+// Process command-line options, starting at argv[start].
+void ReadOptions(int argc, char *argv[], int start) {
+	int i = start;
 
 	while (i < argc) {
 		// Data should be processed in streaming fashion without segmenting
@@ -266,6 +503,16 @@ void ReadOptions(int argc, char *argv[]) {
 		} else if (strcmp(argv[i], "-trainiterations") == 0) {
 			i++;
 			sscanf(argv[i], "%d", &CRFtrainiterations);
+		} else if (strcmp(argv[i], "-threads") == 0) {
+			i++;
+			sscanf(argv[i], "%d", &threads);
+			if (threads < 1) {
+				printf("%s: threads must be at least 1\n", argv[0]);
+				exit(1);
+			}
+		} else if ((server == 1) && (strcmp(argv[i], "-socket") == 0)) {
+			i++;
+			sscanf(argv[i], "%s", socketpath);
 		} else {
 			printf("%s: unknown option %s\n", argv[0], argv[i]);
 			exit(1);
@@ -579,7 +826,9 @@ void ProcessData(int activity, int occurrence, int length, char *dstr,
 	else
 		sensorvalue = ON;
 	
-	sprintf(adatetime[evnum], "%s %s", dstr, tstr);
+	if (evnum == eventcapacity) // Double the room for events
+		GrowEvents(2 * eventcapacity);
+	snprintf(adatetime[evnum], DATELENGTH, "%s %s", dstr, tstr);
 
 	aevents[evnum][SENSOR] = sensorid;
 	aevents[evnum][TIME] = tnum;
@@ -794,43 +1043,137 @@ void Ar() {
 	if (mode == BOTH) // Partition data into train and test cases
 		Partition();
 	if (mode == TRAIN) {
-		TrainInit();
+		folds[0].cvnum = -1;
+		TrainInit(&folds[0]);
 		if (model == NB)
-			NBCTrain(-1);
+			NBCTrain(&folds[0]);
 		else if (model == HMM)
-			HMMTrain(-1);
+			HMMTrain(&folds[0]);
 		else if (model == CRF)
 			CRFTrain(-1);
-		SaveModel();
+		SaveModel(&folds[0]);
 	} else if (mode == BOTH) {
+		// The CRF trainer keeps its state in globals, so its folds are
+		// always processed one at a time, CRFTrain() uses the threads
+		// for the gradient instead
+		if ((threads > 1) && (model != CRF))
+			RunFolds();
 		for (i = 0; i < K; i++) // Process one fold for n-fold cross validation
 				{
-			TrainInit();
+			if ((threads <= 1) || (model == CRF))
+				RunFold(&folds[i]);
+			else
+				CopyFoldOutput(&folds[i]);
+			ReduceFold(&folds[i]);
 			if (model == NB) {
-				NBCTrain(i);
-				NBCTest(i);
-				PrintResults();
+				PrintResults(&folds[i]);
 				right = 0;
 				wrong = 0;
-			} else if (model == HMM) {
-				HMMTrain(i);
-				HMMTest(i);
-			} else if (model == CRF) {
-				CRFTrain(i);
-				CRFTest(i);
 			}
 		}
 	} else if (mode == TEST) {
-		ReadModel();
+		folds[0].cvnum = -1;
+		ReadModel(&folds[0]);
 		if (model == NB)
-			NBCTest(-1);
+			NBCTest(&folds[0]);
 		else if (model == HMM)
-			HMMTest(-1);
+			HMMTest(&folds[0]);
 		else if (model == CRF)
-			CRFTest(-1);
+			CRFTest(&folds[0]);
+		ReduceFold(&folds[0]);
 	}
 }
 
+// Train and test the model of one cross validation fold.
+void RunFold(Fold *f) {
+	TrainInit(f);
+	if (model == NB) {
+		NBCTrain(f);
+		NBCTest(f);
+	} else if (model == HMM) {
+		HMMTrain(f);
+		HMMTest(f);
+	} else if (model == CRF) {
+		CRFTrain(f->cvnum);
+		CRFTest(f);
+	}
+}
+
+// Next fold for a worker thread of RunFolds() to process.
+static int nextfold;
+static pthread_mutex_t foldlock = PTHREAD_MUTEX_INITIALIZER;
+
+// Worker thread that processes folds until none are left.
+void *FoldWorker(void *arg) {
+	int i;
+
+	while (1) {
+		pthread_mutex_lock(&foldlock);
+		i = nextfold++;
+		pthread_mutex_unlock(&foldlock);
+		if (i >= K)
+			return (NULL);
+		RunFold(&folds[i]);
+	}
+}
+
+// Process the cross validation folds with a pool of threads worker threads.
+// Each fold writes its output to memory, CopyFoldOutput() then passes it
+// on in fold order so the output is the same as when the folds run in turn.
+void RunFolds() {
+	int i, n;
+	pthread_t *workers;
+
+	for (i = 0; i < K; i++) {
+		folds[i].log = open_memstream(&folds[i].logtext,
+				&folds[i].loglength);
+		if (results == stdout)
+			folds[i].out = folds[i].log;
+		else
+			folds[i].out = open_memstream(&folds[i].outtext,
+					&folds[i].outlength);
+	}
+	n = threads;
+	if (n > K)
+		n = K;
+	workers = (pthread_t *) malloc(n * sizeof(pthread_t));
+	nextfold = 0;
+	for (i = 0; i < n; i++)
+		pthread_create(&workers[i], NULL, FoldWorker, NULL);
+	for (i = 0; i < n; i++)
+		pthread_join(workers[i], NULL);
+	free(workers);
+}
+
+// Pass the output a fold wrote to memory on to stdout and results.
+void CopyFoldOutput(Fold *f) {
+	if (f->out != f->log) {
+		fclose(f->out);
+		fwrite(f->outtext, 1, f->outlength, results);
+		free(f->outtext);
+		f->outtext = NULL;
+	}
+	fclose(f->log);
+	fwrite(f->logtext, 1, f->loglength, stdout);
+	free(f->logtext);
+	f->logtext = NULL;
+	f->out = results;
+	f->log = stdout;
+}
+
+// Add the results of a fold to the overall results.
+void ReduceFold(Fold *f) {
+	int i, j;
+
+	right += f->right;
+	wrong += f->wrong;
+	totalright += f->totalright;
+	totalwrong += f->totalwrong;
+	for (i = 0; i < numactivities; i++)
+		for (j = 0; j < numactivities; j++)
+			freq[i][j] += f->freq[i][j];
+}
+
 // Partition data streams into test and train examples.
 void Partition() {
 	int i, j, num = 0, count = 0;
@@ -858,8 +1201,8 @@ void Partition() {
 	}
 }
 
-// Report the results of activity recognition.
-void PrintResults() {
+// Report the results of activity recognition, with the model of fold f.
+void PrintResults(Fold *f) {
 	int i, j, k;
 
 /*
@@ -905,6 +1248,8 @@ void PrintResults() {
 
 	// Print accuracy results
 	printf("%d  %d  %f\n", right, wrong, (float) right / (float) (right + wrong));
+	totalright += right;
+	totalwrong += wrong;
 	//printf("right %d wrong %d Average accuracy is %f\n", right, wrong,
 	//		(float) right / (float) (right + wrong));
 		
@@ -916,95 +1261,96 @@ void PrintResults() {
 			for (j = 0; j < numfeatures; j++) {
 				printf("   ");
 				for (k = 0; k < numfeaturevalues[j]; k++)
-					PrintLargeNumber(lemissionProb[i][j][k]);
+					PrintLargeNumber(f->lemissionProb[i][j][k]);
 				printf("\n");
 			}
 			printf("\n");
 			printf("   transition to ");
 			for (j = 0; j < numactivities; j++) {
 				printf("%s ", activitynames[j]);
-				PrintLargeNumber(ltr[i][j]);
+				PrintLargeNumber(f->ltr[i][j]);
 			}
 		}
 	}
 }
 
 // Initialize variables used to train activity model.
-void TrainInit() {
+void TrainInit(Fold *f) {
 	int i, j, k;
 
 	for (i = 0; i < numfeatures; i++)
-		svalues[i] = 0;
+		f->svalues[i] = 0;
 
 	for (i = 0; i < numactivities; i++) {
-		stotal[i] = 0;
-		prior[i] = (double) 0.0;
+		f->stotal[i] = 0;
+		f->prior[i] = (double) 0.0;
 
 		for (j = 0; j < numsensors; j++)
-			sfreq[i][j] = 0;
+			f->sfreq[i][j] = 0;
 
 		for (j = 0; j < numactivities; j++)
-			tr[i][j] = (double) 0.0;
+			f->tr[i][j] = (double) 0.0;
 
 		for (j = 0; j < numfeatures; j++)
 			for (k = 0; k < numfeaturevalues[j]; k++)
-				evidence[i][j][k] = 0;
+				f->evidence[i][j][k] = 0;
 	}
 }
 
 // Initialize variables used to test activity model.
-void TestInit() {
+void TestInit(Fold *f) {
 	int i, j;
 
 	for (i = 0; i < numfeatures; i++) {
-		svalues[i] = 0;
+		f->svalues[i] = 0;
 		for (j = 0; j < numfeaturevalues[i]; j++)
-			testevidence[i][j] = 0;
+			f->testevidence[i][j] = 0;
 	}
 	for (i = 0; i < numactivities; i++)
-		likelihood[i] = MakeLargeNumber((long double) 1);
+		f->likelihood[i] = MakeLargeNumber((long double) 1);
 }
 
 // Determine features that represent current sensor event.
-void CalculateState(int *event, int size, int previous) {
+void CalculateState(Fold *f, int *event, int size, int previous) {
 	int length;
 
-	svalues[SENSOR] = event[SENSOR];
-	svalues[TIME] = event[TIME];
-	svalues[DOW] = event[DOW];
-	svalues[PREVIOUS] = previous;
+	f->svalues[SENSOR] = event[SENSOR];
+	f->svalues[TIME] = event[TIME];
+	f->svalues[DOW] = event[DOW];
+	f->svalues[PREVIOUS] = previous;
 	if (stream == 1)
 		length = DLength(size);
 	else
 		length = size;
-	svalues[LENGTH] = length;
+	f->svalues[LENGTH] = length;
 }
 
 // Keep track of the numbers of feature values for all activities.
-void CalculateEvidence(int **e) {
-	e[SENSOR][svalues[SENSOR]] += 1;
-	e[TIME][svalues[TIME]] += 1;
-	e[DOW][svalues[DOW]] += 1;
-	e[PREVIOUS][svalues[PREVIOUS]] += 1;
-	e[LENGTH][svalues[LENGTH]] += 1;
+void CalculateEvidence(Fold *f, int **e) {
+	e[SENSOR][f->svalues[SENSOR]] += 1;
+	e[TIME][f->svalues[TIME]] += 1;
+	e[DOW][f->svalues[DOW]] += 1;
+	e[PREVIOUS][f->svalues[PREVIOUS]] += 1;
+	e[LENGTH][f->svalues[LENGTH]] += 1;
 }
 
 // Determine prior probability that a sensor event belongs to any given
 // activity based on the number of sensor events that have belonged to
 // each activity class in the training data.
-void CalculatePrior() {
+void CalculatePrior(Fold *f) {
 	int i, atotal;
 
 	atotal = 0;
 	// Calculate total number of sensor events in training data
 	for (i = 0; i < numactivities; i++)
-		atotal += stotal[i];
+		atotal += f->stotal[i];
 
 	// Calculate prior probability for activity as #events/#total events
 	for (i = 0; i < numactivities; i++)
-		prior[i] = (double) stotal[i] / (double) atotal;
+		f->prior[i] = (double) f->stotal[i] / (double) atotal;
 }
 
+#ifndef LOGSPACE
 // Compute the sum of two large numbers.
 LargeNumber Add(LargeNumber op1, LargeNumber op2) {
 	LargeNumber result;
@@ -1071,23 +1417,25 @@ LargeNumber Divide(LargeNumber op1, LargeNumber op2) {
 	return (result);
 }
 
+#endif // LOGSPACE
+
 // Convert double values to mantissa exponent format for floating-point
 // arithmetic.
-void MakeAllLarge() {
+void MakeAllLarge(Fold *f) {
 	int i, j, k;
 
 	for (i = 0; i < numactivities; i++) {
-		if (prior[i] == (double) 0.0)
-			lprior[i] = min;
+		if (f->prior[i] == (double) 0.0)
+			f->lprior[i] = min;
 		else
-			lprior[i] = MakeLargeNumber((long double) prior[i]);
+			f->lprior[i] = MakeLargeNumber((long double) f->prior[i]);
 
 		for (j = 0; j < numactivities; j++) // Transition probability values
 				{
-			if (tr[i][j] == (double) 0.0)
-				ltr[i][j] = min;
+			if (f->tr[i][j] == (double) 0.0)
+				f->ltr[i][j] = min;
 			else
-				ltr[i][j] = MakeLargeNumber((long double) tr[i][j]);
+				f->ltr[i][j] = MakeLargeNumber((long double) f->tr[i][j]);
 		}
 	}
 
@@ -1095,18 +1443,18 @@ void MakeAllLarge() {
 			{
 		for (j = 0; j < numfeatures; j++) {
 			for (k = 0; k < numfeaturevalues[j]; k++) {
-				if (emissionProb[i][j][k] == 0)
-					lemissionProb[i][j][k] = min;
+				if (f->emissionProb[i][j][k] == 0)
+					f->lemissionProb[i][j][k] = min;
 				else
-					lemissionProb[i][j][k] = MakeLargeNumber(
-							(long double) emissionProb[i][j][k]);
+					f->lemissionProb[i][j][k] = MakeLargeNumber(
+							(long double) f->emissionProb[i][j][k]);
 			}
 		}
 	}
 }
 
 // Read model parameters from a file.
-void ReadModel() {
+void ReadModel(Fold *f) {
 	FILE *fp;
 	char name[MAXSTR];
 	int i, j, k, num;
@@ -1145,18 +1493,18 @@ void ReadModel() {
 		fscanf(fp, "%s %s ", sensormap[i][0], sensormap[i][1]);
 	fscanf(fp, "\n");
 	for (i = 0; i < numactivities; i++)
-		fscanf(fp, "%d ", &(stotal[i]));
+		fscanf(fp, "%d ", &(f->stotal[i]));
 	fscanf(fp, "\n");
 	for (i = 0; i < numactivities; i++) {
 		for (j = 0; j < numfeatures; j++)
 			for (k = 0; k < numfeaturevalues[j]; k++)
-				fscanf(fp, "%d	", &evidence[i][j][k]);
+				fscanf(fp, "%d	", &f->evidence[i][j][k]);
 		fprintf(fp, "\n");
 	}
 	fscanf(fp, "\n");
 
 	if (model == HMM)
-		ReadHMM(fp);
+		ReadHMM(f, fp);
 	else if (model == CRF)
 		ReadCRF(fp);
 
@@ -1190,7 +1538,7 @@ void ReadModel() {
 }
 
 // Save model parameters to a file.
-void SaveModel() {
+void SaveModel(Fold *f) {
 	FILE *fp;
 	char name[MAXSTR];
 	int i, j, k;
@@ -1230,23 +1578,33 @@ void SaveModel() {
 		fprintf(fp, "%s %s ", sensormap[i][0], sensormap[i][1]);
 	fprintf(fp, "\n");
 	for (i = 0; i < numactivities; i++)
-		fprintf(fp, "%d ", stotal[i]);
+		fprintf(fp, "%d ", f->stotal[i]);
 	fprintf(fp, "\n");
 	for (i = 0; i < numactivities; i++) {
 		for (j = 0; j < numfeatures; j++)
 			for (k = 0; k < numfeaturevalues[j]; k++)
-				fprintf(fp, "%d	", evidence[i][j][k]);
+				fprintf(fp, "%d	", f->evidence[i][j][k]);
 		fprintf(fp, "\n");
 	}
 
 	if (model == HMM)
-		SaveHMM(fp);
+		SaveHMM(f, fp);
 	else if (model == CRF)
 		SaveCRF(fp);
 
 	fclose(fp);
 }
 
+// Print the description of a sensor event.
+void PrintEvent(int *event) {
+	printf("%d ", event[SENSOR]);
+	printf("%d ", event[TIME]);
+	printf("%d ", event[DOW]);
+	printf("%d ", event[SENSORVALUE]);
+	printf("%d ", event[LABEL]);
+}
+
+#ifndef LOGSPACE
 // Convert double to mantissa exponent number representation.
 LargeNumber MakeLargeNumber(long double num) {
 	LargeNumber result;
@@ -1258,6 +1616,32 @@ LargeNumber MakeLargeNumber(long double num) {
 	return (result);
 }
 
+// Make the large number mantissa * 10^exponent.
+LargeNumber MakeLargeExponent(long double mantissa, long int exponent) {
+	LargeNumber result;
+
+	result.exponent = exponent;
+	result.mantissa = mantissa;
+	result = Standardize(result);
+
+	return (result);
+}
+
+// Make the large number e^num.
+LargeNumber LargeExp(long double num) {
+	return (MakeLargeNumber(expl(num)));
+}
+
+// Convert large number back to a double value.
+long double LargeToDouble(LargeNumber num) {
+	return (num.mantissa * powl(10.0, ((long double) num.exponent)));
+}
+
+// Natural logarithm of a large number.
+double LargeLog(LargeNumber num) {
+	return (log((double) num.mantissa) + (num.exponent * log(10.0)));
+}
+
 // Convert large number to mantissa exponent format for floating-point
 // arithmetic.
 LargeNumber Standardize(LargeNumber num) {
@@ -1323,17 +1707,9 @@ int IsGreaterThan(LargeNumber op1, LargeNumber op2) {
 	return (FALSE);
 }
 
-// Print the description of a sensor event.
-void PrintEvent(int *event) {
-	printf("%d ", event[SENSOR]);
-	printf("%d ", event[TIME]);
-	printf("%d ", event[DOW]);
-	printf("%d ", event[SENSORVALUE]);
-	printf("%d ", event[LABEL]);
-}
-
 // Print a large number in mantissa exponent format.
 void PrintLargeNumber(LargeNumber new)
 {
 	printf(" %fe%d ", (float) new.mantissa, (int) new.exponent);
 }
+#endif // LOGSPACE
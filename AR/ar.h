@@ -10,6 +10,9 @@
 
 #define MAXSTR 80
 #define MAXALENGTH 10000000
+#define EVENTBLOCK 1024            // Initial room for events beyond the estimate
+#define EVENTBYTES 32         // Bytes per line of data used to estimate #events
+#define DATELENGTH 32                // Room for "YYYY-MM-DD HH:MM:SS.ssssss"
 #define MAXBUFFER 256
 #define DOUBLELIMIT 15
 
@@ -43,31 +46,70 @@
 
 #define WINDOW 10             // Test window measured in number of sensor events
 
+#ifdef LOGSPACE
+// Probabilities kept as sign and natural logarithm of magnitude, see
+// logspace.c (built as arlog)
+typedef struct LargeNumber
+{
+   double logvalue;
+   int sign;                                         // -1, 0 (zero), or 1
+} LargeNumber;
+#else
 typedef struct LargeNumber
 {
    long double mantissa;
    long int exponent;
 } LargeNumber;
+#endif
+
+// Model state of one cross validation fold, so that folds can be trained
+// and tested in parallel threads
+typedef struct Fold
+{
+   int cvnum;                      // Test partition, -1 for TRAIN or TEST
+   int right;
+   int wrong;
+   int totalright;
+   int totalwrong;
+   int *svalues;                  // Feature values of the current event
+   int *stotal;              // Total training #sensor events for each activity
+   int **freq;   // Frequency of actual activities and activity classifications
+   int **sfreq;                       // Count of sensor frequency for activity
+   int **testevidence;                 // Counts of feature values in test data
+   int ***evidence;                // Counts of feature values in training data
+   double *prior;
+   double **tr;                                     // Transition probabilities
+   double ***emissionProb;                            // Emission probabilities
+   LargeNumber *likelihood;
+   LargeNumber *lprior;                            // Large prior probabilities
+   LargeNumber **ltr;                         // Large transition probabilities
+   LargeNumber ***lemissionProb;                // Large emission probabilities
+   FILE *out;                         // Output for the event classifications
+   FILE *log;                                  // Output for progress messages
+   char *outtext;                  // Output held in memory by RunFolds()
+   char *logtext;
+   size_t outlength;
+   size_t loglength;
+} Fold;
 
 char **activitynames;
 char ***sensormap;
 char **adatetime;
+char *datebuffer;                         // Contiguous storage for adatetime
 char modelfilename[MAXSTR];
+char socketpath[MAXSTR];                      // Unix socket used in server mode
 int **aevents;
+int *eventbuffer;                           // Contiguous storage for aevents
+int eventcapacity;                      // Number of events the buffers hold
 int **starts;
 int **lengthactivities;               // The length of each activity occurrence
 int **previousactivity;
-int **freq;      // Frequency of actual activities and activity classifications
+int **freq;            // Confusion totals of actual and classified activities
 int *afreq;                       // The number of occurrences of each activity
 int *open;                          // The start/finish status of each activity
-int *stotal;                 // Total training #sensor events for each activity
-int *svalues;                     // Number of possible values for each feature
-int ***evidence;                   // Counts of feature values in training data
-int **testevidence;                    // Counts of feature values in test data
 int *numfeaturevalues;            // Number of possible values for each feature
 int *selectfeatures;                        // Feature values learned from data
 int **sizes;                                  // Length of activity occurrences
-int **sfreq;                          // Count of sensor frequency for activity
 int *partition;                                // Partition train and test data
 int **thresholds;                  // Threshold values for feature value ranges
 int numactivities;
@@ -79,43 +121,57 @@ int partitiontype;                                   // Deterministic or random
 int outputlevel;
 int right;
 int wrong;
+int totalright;                           // Right and wrong over all folds
+int totalwrong;
 int model;
 int evnum;                             // Number of sensor events in input data
 int mode;                                               // Train, test, or both
 int stream;
-double *prior;
-double **tr;                                        // Transition probabilities
-double ***emissionProb;                               // Emission probabilities
+int threads;          // Threads used to process the folds or CRF gradient
+int numfolds;
+int server;                                      // Resident, see Server()
 LargeNumber min;
-LargeNumber *likelihood;
-LargeNumber **ltr;                            // Large transition probabilities
-LargeNumber *lprior;                               // Large prior probabilities
-LargeNumber ***lemissionProb;                   // Large emission probabilities
+Fold *folds;                                    // Model state of each fold
+FILE *results;                            // Output for event classifications
 
 void Ar();
-void TrainInit();
-void TestInit();
-void ReadOptions(int argc, char *argv[]);
+void RunFold(Fold *f);
+void RunFolds();
+void *FoldWorker(void *arg);
+void CopyFoldOutput(Fold *f);
+void ReduceFold(Fold *f);
+void TrainInit(Fold *f);
+void TestInit(Fold *f);
+void ReadOptions(int argc, char *argv[], int start);
 void ReadHeader(FILE *fp);
 void ReadData(FILE *fp);
-void CalculateState(int event[6], int size, int previous);
-void CalculateEvidence(int **e);
+void CalculateState(Fold *f, int event[6], int size, int previous);
+void CalculateEvidence(Fold *f, int **e);
 void Finish();
+void FinishFold(Fold *f);
 void ProcessData(int activity, int occurrence, int length,
                  char *dstr, char *tstr, char *sistr, char *svstr);
-void NBCTrain(int cvnum);
-void NBCTest(int cvnum);
-void CalculatePrior();
+void NBCTrain(Fold *f);
+void NBCTest(Fold *f);
+void CalculatePrior(Fold *f);
 void SelectFeatures();
 void Partition();
-void MakeAllLarge();
+void MakeAllLarge(Fold *f);
 void PrintEvent(int *event);
 void PrintLargeNumber(LargeNumber num);
 void Summarize();
-void PrintResults();
-void ReadModel();
-void SaveModel();
+void PrintResults(Fold *f);
+void ReadModel(Fold *f);
+void SaveModel(Fold *f);
 FILE *Init(int argc, char *argv[]);
+void InitDefaults();
+void InitEvents(long size);
+void GrowEvents(int capacity);
+void InitModel();
+void InitFold(Fold *f, int cvnum);
+int Server(int argc, char *argv[]);
+void Serve(int argc, char *argv[], FILE *in, FILE *out);
+void Request(int argc, char *argv[], FILE *cfp, FILE *dfp, long size);
 int FindActivity(char *name);
 int AddActivity(char *date, char *time, char *sensorid, char *sensorvalue,
                 int activity, int label, int same, int previous);
@@ -125,10 +181,13 @@ int comp(const void *t1, const void *t2);
 int IsEqual(LargeNumber op1, LargeNumber op2);
 int IsGreaterThan(LargeNumber op1, LargeNumber op2);
 int DLength(int size);
-double CalculateProb(double p, int a);
+double CalculateProb(Fold *f, double p, int a);
 LargeNumber MakeLargeNumber(long double num);
+LargeNumber MakeLargeExponent(long double mantissa, long int exponent);
+LargeNumber LargeExp(long double num);
+long double LargeToDouble(LargeNumber num);
+double LargeLog(LargeNumber num);
 LargeNumber Standardize(LargeNumber num);
-LargeNumber MakeLargeNumber(long double num);
 LargeNumber Add(LargeNumber op1, LargeNumber op2);
 LargeNumber Subtract(LargeNumber op1, LargeNumber op2);
 LargeNumber Multiply(LargeNumber op1, LargeNumber op2);
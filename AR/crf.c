@@ -13,6 +13,7 @@
 // available at http://flexcrfs.sourceforge.net.
 
 #include <errno.h>
+#include <pthread.h>
 #include "ar.h"
 #include "crf.h"
 #include "lbfgs.h"
@@ -288,7 +289,8 @@ void PrintCRFFeature(FILE *fp, int i)
 // cvnum = test partition/fold; don't train using this partition
 void CRFTrain(int cvnum)
 {
-   int i, y, a, aIdx, seqNum, maxSeqLen, iterations=0;
+   int i, t, y, a, aIdx, seqNum, maxSeqLen, iterations=0;
+   CRFWorker *w;
 
    if (mode == TRAIN)
       printf("CRF Train\n");
@@ -329,25 +331,41 @@ void CRFTrain(int cvnum)
       printf("\n");
    }
 
-   // Initialize global variables
-   CRF_Fyx = (LargeNumber *) malloc(numCRFFeatures * sizeof(LargeNumber));
-   CRF_ExpFyx = (LargeNumber *) malloc(numCRFFeatures * sizeof(LargeNumber));
-   CRF_alpha = (LargeNumber **) malloc(maxSeqLen * sizeof(LargeNumber *));
-   CRF_beta = (LargeNumber **) malloc(maxSeqLen * sizeof(LargeNumber *));
-   CRF_M = (LargeNumber ***) malloc(maxSeqLen * sizeof(LargeNumber **));
-   for (i=0; i<maxSeqLen; i++)
+   // Initialize the state of each gradient worker thread.  Debugging
+   // output is printed per sequence, so it needs a single worker.
+   numCRFWorkers = threads;
+   if (numCRFWorkers > seqNum)
+      numCRFWorkers = seqNum;
+   if ((numCRFWorkers < 1) || (outputlevel > 1))
+      numCRFWorkers = 1;
+   CRFWorkers = (CRFWorker *) malloc(numCRFWorkers * sizeof(CRFWorker));
+   for (t=0; t<numCRFWorkers; t++)
    {
-      CRF_alpha[i] =
-         (LargeNumber *) malloc(numactivities * sizeof(LargeNumber));
-      CRF_beta[i] = (LargeNumber *) malloc(numactivities * sizeof(LargeNumber));
-      CRF_M[i] = (LargeNumber **) malloc(numactivities * sizeof(LargeNumber *));
-
-      // This is a labelxlabel matrix.  For every possible transition from
-      // one event (with a label) to another there is an entry in the matrix.
-      // There is a separate matrix for each event in the sequence.
-      for (y=0; y<numactivities; y++)
-         CRF_M[i][y] =
-	    (LargeNumber *) malloc(numactivities * sizeof(LargeNumber));
+      w = &CRFWorkers[t];
+      w->id = t;
+      w->logLiGrad = (double *) malloc(numCRFFeatures * sizeof(double));
+      w->Fyx = (LargeNumber *) malloc(numCRFFeatures * sizeof(LargeNumber));
+      w->ExpFyx =
+         (LargeNumber *) malloc(numCRFFeatures * sizeof(LargeNumber));
+      w->alpha = (LargeNumber **) malloc(maxSeqLen * sizeof(LargeNumber *));
+      w->beta = (LargeNumber **) malloc(maxSeqLen * sizeof(LargeNumber *));
+      w->M = (LargeNumber ***) malloc(maxSeqLen * sizeof(LargeNumber **));
+      for (i=0; i<maxSeqLen; i++)
+      {
+         w->alpha[i] =
+            (LargeNumber *) malloc(numactivities * sizeof(LargeNumber));
+         w->beta[i] =
+            (LargeNumber *) malloc(numactivities * sizeof(LargeNumber));
+         w->M[i] =
+            (LargeNumber **) malloc(numactivities * sizeof(LargeNumber *));
+
+         // This is a labelxlabel matrix.  For every possible transition from
+         // one event (with a label) to another there is an entry in the
+         // matrix. There is a separate matrix for each event in the sequence.
+         for (y=0; y<numactivities; y++)
+            w->M[i][y] =
+               (LargeNumber *) malloc(numactivities * sizeof(LargeNumber));
+      }
    }
 
    // Parameters to LBFGS gradient descent optimizer
@@ -436,60 +454,111 @@ void CRFTrain(int cvnum)
          PrintCRFFeature (stdout, i);
    }
 
-   // Free global memory
-   free(CRF_Fyx);
-   free(CRF_ExpFyx);
-
-   for (i=0; i<maxSeqLen; i++)
+   // Free worker memory
+   for (t=0; t<numCRFWorkers; t++)
    {
-      free(CRF_alpha[i]);
-      free(CRF_beta[i]);
-      for (y=0; y<numactivities; y++)
-         free(CRF_M[i][y]);
-      free(CRF_M[i]);
+      w = &CRFWorkers[t];
+      free(w->logLiGrad);
+      free(w->Fyx);
+      free(w->ExpFyx);
+      for (i=0; i<maxSeqLen; i++)
+      {
+         free(w->alpha[i]);
+         free(w->beta[i]);
+         for (y=0; y<numactivities; y++)
+            free(w->M[i][y]);
+         free(w->M[i]);
+      }
+      free(w->alpha);
+      free(w->beta);
+      free(w->M);
    }
-
-   free(CRF_alpha);
-   free(CRF_beta);
-   free(CRF_M);
+   free(CRFWorkers);
 }
 
 
 // Compute current gradient
+// The training sequences are shared out among numCRFWorkers threads, each
+// summing its own log likelihood and gradient, which are added up here.
 void ComputeLogLikelihoodAndGradient(int cvnum, double lambda[],
                                      double *logLi, double logLiGrad[])
 {
-   int a, aIdx, f, i, n, y, yp, seqNum = 0, start, snum;
-   double temp_logLi, tempD;
-   long double tempLD;
-   LargeNumber tempLN, Z_lambda, ExpFyx, fv, lambdafv;
-   LargeNumber vector1[numactivities]; // vector of 1s
+   int f, t;
+   CRFWorker *w;
 
-   for (y=0; y<numactivities; y++)
-      vector1[y] = MakeLargeNumber (1.0);
+   for (t=0; t<numCRFWorkers; t++)
+   {
+      w = &CRFWorkers[t];
+      w->cvnum = cvnum;
+      w->lambda = lambda;
+      w->logLi = 0.0;
+      for (f=0; f<numCRFFeatures; f++)
+         w->logLiGrad[f] = 0.0;
+   }
 
    // Initialize logLi and logLiGrad
-   temp_logLi = CRF_LOGLI_CONSTANT;
+   w = &CRFWorkers[0];
+   w->logLi = CRF_LOGLI_CONSTANT;
    for (f=0; f<numCRFFeatures; f++)
    {
-      temp_logLi -= ((lambda[f] * lambda[f]) /
-                     (2.0 * CRF_LOGLI_SIGMA_SQR));
-      logLiGrad[f] = ((-1.0) * lambda[f] / CRF_LOGLI_SIGMA_SQR);
+      w->logLi -= ((lambda[f] * lambda[f]) /
+                   (2.0 * CRF_LOGLI_SIGMA_SQR));
+      w->logLiGrad[f] = ((-1.0) * lambda[f] / CRF_LOGLI_SIGMA_SQR);
    }
 
    if (outputlevel > 1)
    {
       for (f=0; f<numCRFFeatures; f++)
-         printf("  logLiGrad[%d] = %f (after init)\n", f, logLiGrad[f]);
+         printf("  logLiGrad[%d] = %f (after init)\n", f, w->logLiGrad[f]);
       printf("\n");
    }
 
+   if (numCRFWorkers == 1)
+      CRFGradientWorker(&CRFWorkers[0]);
+   else
+   {
+      for (t=0; t<numCRFWorkers; t++)
+         pthread_create(&CRFWorkers[t].thread, NULL, CRFGradientWorker,
+                        &CRFWorkers[t]);
+      for (t=0; t<numCRFWorkers; t++)
+         pthread_join(CRFWorkers[t].thread, NULL);
+   }
+
+   // Reduce in worker order so a given thread count always gives the
+   // same result
+   *logLi = CRFWorkers[0].logLi;
+   for (f=0; f<numCRFFeatures; f++)
+      logLiGrad[f] = CRFWorkers[0].logLiGrad[f];
+   for (t=1; t<numCRFWorkers; t++)
+   {
+      *logLi += CRFWorkers[t].logLi;
+      for (f=0; f<numCRFFeatures; f++)
+         logLiGrad[f] += CRFWorkers[t].logLiGrad[f];
+   }
+}
+
+
+// Add the log likelihood and gradient of the training sequences given to
+// one worker (those with seqNum % numCRFWorkers == id) to its own totals
+void *CRFGradientWorker(void *arg)
+{
+   CRFWorker *w = (CRFWorker *) arg;
+   int a, aIdx, f, i, n, y, yp, seqNum = 0, start, snum;
+   double tempD;
+   long double tempLD;
+   LargeNumber tempLN, Z_lambda, ExpFyx, fv, lambdafv;
+   LargeNumber vector1[numactivities]; // vector of 1s
+
+   for (y=0; y<numactivities; y++)
+      vector1[y] = MakeLargeNumber (1.0);
+
    // Process training sequences
    for (a=0; a<numactivities; a++)
    {
       for (aIdx=0; aIdx<afreq[a]; aIdx++)
       {
-         if (CRF_NO_CV || (partition[seqNum] != cvnum))
+         if ((seqNum % numCRFWorkers == w->id) &&
+             (CRF_NO_CV || (partition[seqNum] != w->cvnum)))
          {
             start = starts[a][aIdx];
             snum = lengthactivities[a][aIdx];
@@ -498,7 +567,7 @@ void ComputeLogLikelihoodAndGradient(int cvnum, double lambda[],
             // Vector F(y,x) = sum_i (vector f(y,x,i)) for this seq (x,y)
             // Matrix M_i : M_i[y,y'] = exp (lambda . vector f(y,y',x,i))
             for (f=0; f<numCRFFeatures; f++)
-               CRF_Fyx[f] = MakeLargeNumber(0.0);
+               w->Fyx[f] = MakeLargeNumber(0.0);
             for (i=0, n=0; n<snum; i++)
             {
 	       // Only consider events that are part of this activity,
@@ -507,7 +576,7 @@ void ComputeLogLikelihoodAndGradient(int cvnum, double lambda[],
                {
                   for (y=0; y<numactivities; y++)
                      for (yp=0; yp<numactivities; yp++)
-                        CRF_M[i][y][yp] = MakeLargeNumber(0.0);
+                        w->M[i][y][yp] = MakeLargeNumber(0.0);
                   for (f=0; f<numCRFFeatures; f++)
 	          {
                                         // Compute feature's contribution to Fyx
@@ -517,33 +586,31 @@ void ComputeLogLikelihoodAndGradient(int cvnum, double lambda[],
                      else y = -1;
                      fv = MakeLargeNumber(
 		             EvaluateCRFFeature(f, start, i, y, yp));
-                     CRF_Fyx[f] = Add(CRF_Fyx[f], fv);
+                     w->Fyx[f] = Add(w->Fyx[f], fv);
                                          // Compute feature's contribution to Mi
                      yp = CRFFeatures[f].yp;
                      y = CRFFeatures[f].y;
                      fv = MakeLargeNumber(
 		             EvaluateCRFFeature(f, start, i, y, yp));
-                     lambdafv = Multiply(MakeLargeNumber(lambda[f]), fv);
+                     lambdafv = Multiply(MakeLargeNumber(w->lambda[f]), fv);
                      if (CRFFeatures[f].type == CRF_STATE_FEATURE)
                      {
                         for (y=0; y<numactivities; y++)
-                           CRF_M[i][y][CRFFeatures[f].yp] =
-                              Add(CRF_M[i][y][CRFFeatures[f].yp], lambdafv);
+                           w->M[i][y][CRFFeatures[f].yp] =
+                              Add(w->M[i][y][CRFFeatures[f].yp], lambdafv);
                      }
                      else                              // CRF_TRANSITION_FEATURE
                      {
-                        CRF_M[i][CRFFeatures[f].y][CRFFeatures[f].yp] =
-                           Add(CRF_M[i][CRFFeatures[f].y][CRFFeatures[f].yp],
+                        w->M[i][CRFFeatures[f].y][CRFFeatures[f].yp] =
+                           Add(w->M[i][CRFFeatures[f].y][CRFFeatures[f].yp],
 			       lambdafv);
                      }
                   }
                   for (y=0; y<numactivities; y++)             // Compute exp(Mi)
                      for (yp=0; yp<numactivities; yp++)
                      {
-                        tempLD = CRF_M[i][y][yp].mantissa *
-                           powl(10.0, ((long double) CRF_M[i][y][yp].exponent));
-                        tempLD = expl(tempLD);
-                        CRF_M[i][y][yp] = MakeLargeNumber(tempLD);
+                        tempLD = LargeToDouble(w->M[i][y][yp]);
+                        w->M[i][y][yp] = LargeExp(tempLD);
                      }
 	          n++;
 	       }
@@ -552,29 +619,29 @@ void ComputeLogLikelihoodAndGradient(int cvnum, double lambda[],
             // Compute alphas
             //   vector alpha_i = [1], if i=0
             //                    alpha_(i-1) * M_i, if 0 < i <= n
-            // Note that CRF_alpha[0] = the above alpha_1
+            // Note that w->alpha[0] = the above alpha_1
             // Where we need alpha_0, we explicitly use vector1 or [1.0]
-            VectorMatrixMult(numactivities, vector1, CRF_M[0], CRF_alpha[0]);
+            VectorMatrixMult(numactivities, vector1, w->M[0], w->alpha[0]);
             for (i=1; i<snum; i++)
-               VectorMatrixMult(numactivities, CRF_alpha[i-1], CRF_M[i],
-                                CRF_alpha[i]);
+               VectorMatrixMult(numactivities, w->alpha[i-1], w->M[i],
+                                w->alpha[i]);
 
             // Compute betas
             //   vector beta_i^T = [1], if i = n
             //                     M_(i+1) * beta_(i+1)^T, if 1 <= i < n
-            // Note that CRF_beta[snum-1] = the above beta_n
+            // Note that w->beta[snum-1] = the above beta_n
             for (y=0; y<numactivities; y++)
-               CRF_beta[snum-1][y] = MakeLargeNumber(1.0);
+               w->beta[snum-1][y] = MakeLargeNumber(1.0);
             for (i=(snum-2); i>=0; i--)
-               MatrixVectorTransposeMult(numactivities, CRF_M[i+1],
-                                         CRF_beta[i+1], CRF_beta[i]);
+               MatrixVectorTransposeMult(numactivities, w->M[i+1],
+                                         w->beta[i+1], w->beta[i]);
 
             // Compute Z_lambda(x) for this seq(x,y)
             //   Z_lambda(x) = vector alpha_n . [1]^T
             Z_lambda = MakeLargeNumber(0.0);
 
             for (y=0; y<numactivities; y++)
-               Z_lambda = Add(Z_lambda, CRF_alpha[snum-1][y]);
+               Z_lambda = Add(Z_lambda, w->alpha[snum-1][y]);
 
             // Compute vector Exp(F(Y,x)) for this sequence
             // Exp(F(Y,x)) = sum_i(alpha_(i-1)x(f_i * M_i)xbeta_i) / Z_lambda(x)
@@ -583,7 +650,7 @@ void ComputeLogLikelihoodAndGradient(int cvnum, double lambda[],
             // If f is a state feature, then the above formula becomes
             // alpha_i x f_i x beta_i / Z_lambda(x)
             for (f=0; f<numCRFFeatures; f++)
-               CRF_ExpFyx[f] = MakeLargeNumber(0.0);
+               w->ExpFyx[f] = MakeLargeNumber(0.0);
 
             for (i=0, n=0; n<snum; i++)
             {
@@ -600,58 +667,55 @@ void ComputeLogLikelihoodAndGradient(int cvnum, double lambda[],
 
                      if (CRFFeatures[f].type == CRF_STATE_FEATURE)
                      {
-                        ExpFyx = CRF_alpha[i][CRFFeatures[f].yp];
+                        ExpFyx = w->alpha[i][CRFFeatures[f].yp];
                         ExpFyx = Multiply(ExpFyx, fv);
                         ExpFyx = Multiply(ExpFyx,
-			                  CRF_beta[i][CRFFeatures[f].yp]);
+			                  w->beta[i][CRFFeatures[f].yp]);
                      }
                      else // CRF_TRANSITION_FEATURE
                      {
                         if (i > 0)
-                           ExpFyx = CRF_alpha[i-1][CRFFeatures[f].y];
+                           ExpFyx = w->alpha[i-1][CRFFeatures[f].y];
                         else ExpFyx = MakeLargeNumber(1.0);
                         ExpFyx = Multiply(ExpFyx, fv);
                         ExpFyx = Multiply(ExpFyx,
-                                 CRF_M[i][CRFFeatures[f].y][CRFFeatures[f].yp]);
+                                 w->M[i][CRFFeatures[f].y][CRFFeatures[f].yp]);
                         ExpFyx = Multiply(ExpFyx,
-			                  CRF_beta[i][CRFFeatures[f].yp]);
+			                  w->beta[i][CRFFeatures[f].yp]);
                      }
                      ExpFyx = Divide(ExpFyx, Z_lambda);
-                     CRF_ExpFyx[f] = Add(CRF_ExpFyx[f], ExpFyx);
+                     w->ExpFyx[f] = Add(w->ExpFyx[f], ExpFyx);
                   }
 	          n++;
 	       }
             }
 
             // Increment logLi by [(lambda . F(y,x)) - log Z_lamda(x)]
-            // Increment vector logLiGrad by [(F(y,x) - Exp(F(Y,x))]
-            tempD = (log (((double) Z_lambda.mantissa)) +
-                      (Z_lambda.exponent * log (10.0)));
-            temp_logLi -= tempD;
+            // Increment vector w->logLiGrad by [(F(y,x) - Exp(F(Y,x))]
+            tempD = LargeLog(Z_lambda);
+            w->logLi -= tempD;
 
             if (outputlevel > 1)
                printf("\n    logLi = %f (after subtracting %f, seq = %d)\n",
-                      temp_logLi, tempD, (seqNum+1));
+                      w->logLi, tempD, (seqNum+1));
 
             for (f=0; f<numCRFFeatures; f++)
             {
-               tempLD = (CRF_Fyx[f].mantissa *
-                         powl(10.0, ((long double) CRF_Fyx[f].exponent)));
-               temp_logLi += (lambda[f] * ((double) tempLD));
-               tempLN = Subtract(CRF_Fyx[f], CRF_ExpFyx[f]);
-               tempLD = (tempLN.mantissa *
-                        powl(10.0, ((long double) tempLN.exponent)));
-               logLiGrad[f] += ((double) tempLD);
+               tempLD = LargeToDouble(w->Fyx[f]);
+               w->logLi += (w->lambda[f] * ((double) tempLD));
+               tempLN = Subtract(w->Fyx[f], w->ExpFyx[f]);
+               tempLD = LargeToDouble(tempLN);
+               w->logLiGrad[f] += ((double) tempLD);
 
                if (outputlevel > 1)
                {
-                  printf("    CRF_Fyx[%d] = ", f);
-                  PrintLargeNumber(CRF_Fyx[f]);
+                  printf("    w->Fyx[%d] = ", f);
+                  PrintLargeNumber(w->Fyx[f]);
                   printf("\n");
-                  printf("    CRF_ExpFyx[%d] = ", f);
-                  PrintLargeNumber(CRF_ExpFyx[f]);
+                  printf("    w->ExpFyx[%d] = ", f);
+                  PrintLargeNumber(w->ExpFyx[f]);
                   printf("\n");
-                  printf("    CRF_Fyx[%d] - CRF_ExpFyx[%d] = ", f, f);
+                  printf("    w->Fyx[%d] - w->ExpFyx[%d] = ", f, f);
                   PrintLargeNumber(tempLN);
                   printf("(%Lf)", tempLD);
                   printf("\n");
@@ -665,10 +729,10 @@ void ComputeLogLikelihoodAndGradient(int cvnum, double lambda[],
             printf("Sequence %d (length = %d):\n\n", seqNum+1,
                    lengthactivities[a][aIdx]);
             for (f=0; f < numCRFFeatures; f++) {
-               if (CRF_Fyx[f].mantissa != 0.0)
+               if (!IsEqual(w->Fyx[f], MakeLargeNumber(0.0)))
 	       {
                   printf("  F(y,x)[%d] =", f);
-                  PrintLargeNumber(CRF_Fyx[f]);
+                  PrintLargeNumber(w->Fyx[f]);
                   printf("\n");
                }
             }
@@ -678,11 +742,10 @@ void ComputeLogLikelihoodAndGradient(int cvnum, double lambda[],
                for (y=0; y<numactivities; y++)
                   for (yp=0; yp<numactivities; yp++)
 	          {
-                     if ((CRF_M[i][y][yp].mantissa != 1.0) ||
-                         (CRF_M[i][y][yp].exponent != 0))
+                     if (!IsEqual(w->M[i][y][yp], MakeLargeNumber(1.0)))
 		     {
                         printf("  M[%d][%d][%d] =", i, y, yp);
-                        PrintLargeNumber(CRF_M[i][y][yp]);
+                        PrintLargeNumber(w->M[i][y][yp]);
                         printf("\n");
                      }
                   }
@@ -692,7 +755,7 @@ void ComputeLogLikelihoodAndGradient(int cvnum, double lambda[],
                for (y=0; y<numactivities; y++)
 	       {
                   printf("  alpha[%d][%d] =", i, y);
-                  PrintLargeNumber(CRF_alpha[i][y]);
+                  PrintLargeNumber(w->alpha[i][y]);
                   printf("\n");
                }
             printf("\n");
@@ -700,7 +763,7 @@ void ComputeLogLikelihoodAndGradient(int cvnum, double lambda[],
                for (y=0; y<numactivities; y++)
 	       {
                   printf("  beta[%d][%d] =", i, y);
-                  PrintLargeNumber(CRF_beta[i][y]);
+                  PrintLargeNumber(w->beta[i][y]);
                   printf("\n");
                }
             printf("\n");
@@ -709,32 +772,32 @@ void ComputeLogLikelihoodAndGradient(int cvnum, double lambda[],
             printf("\n\n");
             for (f=0; f<numCRFFeatures; f++) {
                printf("  ExpF(Y,x)[%d] =", f);
-               PrintLargeNumber(CRF_ExpFyx[f]);
+               PrintLargeNumber(w->ExpFyx[f]);
                printf("\n");
             }
             printf("\n");
-            printf("  logLi = %f\n", temp_logLi);
+            printf("  logLi = %f\n", w->logLi);
             printf("\n");
             for (f=0; f<numCRFFeatures; f++)
-               printf("  logLiGrad[%d] = %f\n", f, logLiGrad[f]);
+               printf("  w->logLiGrad[%d] = %f\n", f, w->logLiGrad[f]);
             printf("\n");
          }
          seqNum++;
       }
    }
-   *logLi = temp_logLi;
+   return (NULL);
 }
 
 
 // CRFTest
-// cvnum = test only on activities in this partition/fold
-void CRFTest(int cvnum)
+// f->cvnum = test only on activities in this partition/fold
+void CRFTest(Fold *f)
 {
    int i, y, a, aIdx, start, snum, seqNum, maxSeqLen;
 
    if (mode == TEST)
       printf("CRF Test\n");
-   else printf("CRF Test (CV fold %d of %d) ...\n\n", (cvnum+1), K),
+   else printf("CRF Test (CV fold %d of %d) ...\n\n", (f->cvnum+1), K),
 
    // Find maximum activity occurrence sequence length
    // Events within sequence can have different labels
@@ -744,7 +807,7 @@ void CRFTest(int cvnum)
    for (a=0; a<numactivities; a++)
       for (aIdx=0; aIdx<afreq[a]; aIdx++)
       {
-         if (CRF_NO_CV || (partition[seqNum] == cvnum))
+         if (CRF_NO_CV || (partition[seqNum] == f->cvnum))
             if (lengthactivities[a][aIdx] > maxSeqLen)
               maxSeqLen = lengthactivities[a][aIdx];
          seqNum++;
@@ -779,7 +842,7 @@ void CRFTest(int cvnum)
    {
       for (aIdx=0; aIdx<afreq[a]; aIdx++)
       {
-         if (CRF_NO_CV || (partition[seqNum] == cvnum))
+         if (CRF_NO_CV || (partition[seqNum] == f->cvnum))
          {
             start = starts[a][aIdx];
             snum = lengthactivities[a][aIdx];
@@ -790,8 +853,8 @@ void CRFTest(int cvnum)
 	    // in the sequence
             CRFViterbi(snum);
             if (CRF_PREDICT_EVENT == 1)
-                CRFEvaluateByEvent(start, snum);
-            else CRFEvaluateByEventSeq(a, snum);
+                CRFEvaluateByEvent(f, start, snum);
+            else CRFEvaluateByEventSeq(f, a, snum);
          }
          seqNum++;
       }
@@ -850,10 +913,8 @@ void ComputeCRF_M(int a, int start, int snum)
          for (y=0; y<numactivities; y++)
             for (yp=0; yp<numactivities; yp++)
             {
-               tempLD = CRF_M[i][y][yp].mantissa *
-                 powl(10.0, ((long double) CRF_M[i][y][yp].exponent));
-               tempLD = expl(tempLD);
-               CRF_M[i][y][yp] = MakeLargeNumber(tempLD);
+               tempLD = LargeToDouble(CRF_M[i][y][yp]);
+               CRF_M[i][y][yp] = LargeExp(tempLD);
             }
          n++;
       }
@@ -919,7 +980,7 @@ void CRFViterbi(int snum)
 // Determine the number of correct/incorrect label/activity predictions
 // made by CRF on the given sequence.
 // Assume CRFViterbi has already been called on this sequence.
-void CRFEvaluateByEvent(int start, int snum)
+void CRFEvaluateByEvent(Fold *f, int start, int snum)
 {
    int i, actualLabel, predictedLabel;
 
@@ -928,9 +989,9 @@ void CRFEvaluateByEvent(int start, int snum)
       actualLabel = aevents[start+i][numfeatures-1];
       predictedLabel = CRFTestSeqLabels[i];
       if (actualLabel == predictedLabel)
-         right++;
-      else wrong++;
-      freq[actualLabel][predictedLabel]++;
+         f->right++;
+      else f->wrong++;
+      f->freq[actualLabel][predictedLabel]++;
    }
 }
 
@@ -938,7 +999,7 @@ void CRFEvaluateByEvent(int start, int snum)
 // on the most frequent activity assigned to the individual events
 // in the sequence. This is compared to the given activity label.
 // Assume CRFViterbi has already been called on this sequence.
-void CRFEvaluateByEventSeq(int activity, int snum)
+void CRFEvaluateByEventSeq(Fold *f, int activity, int snum)
 {
    int a, i, maxFreq, maxActivity, predictedFreq[numactivities];
 
@@ -957,9 +1018,9 @@ void CRFEvaluateByEventSeq(int activity, int snum)
       }
    // Compare predicted activity to actual activity
    if (activity == maxActivity)
-      right++;
-   else wrong++;
-   freq[activity][maxActivity]++;
+      f->right++;
+   else f->wrong++;
+   f->freq[activity][maxActivity]++;
 }
 
 
@@ -3,6 +3,8 @@
 #ifndef CRF_H
 #define CRF_H
 
+#include <pthread.h>
+
 // Written by Larry Holder and Diane Cook, Washington State University, 2010.
 
 // Attributes that accompany the activity label on an event can be
@@ -54,6 +56,22 @@ typedef struct {
    double weight; // Feature weight (to be learned)
 } CRFFeature;
 
+// State of one thread computing the log likelihood and gradient over its
+// share of the training sequences
+typedef struct {
+   int id;                   // Takes sequences with seqNum % numCRFWorkers == id
+   int cvnum;
+   pthread_t thread;
+   double *lambda;          // Current feature weights (shared)
+   double logLi;            // Log likelihood of this worker's sequences
+   double *logLiGrad;       // Gradient of this worker's sequences
+   LargeNumber *Fyx;        // Global feature vector Fyx for a sequence
+   LargeNumber *ExpFyx;     // Expected value of the feature vector
+   LargeNumber **alpha;     // Forward state-cost vectors
+   LargeNumber **beta;      // Backward state-cost vectors
+   LargeNumber ***M;        // Label x label matrix M[i][y][yp] over sequence
+} CRFWorker;
+
 typedef struct {
    LargeNumber prob; // Probability of transition to next label
    int label;        // Previous label that max-prob transition came from
@@ -63,11 +81,9 @@ typedef struct {
 int numCRFFeatures;
 int sizeCRFFeatures;
 CRFFeature *CRFFeatures;
-LargeNumber *CRF_Fyx;    // Global feature vector Fyx for a sequence
-LargeNumber *CRF_ExpFyx; // Expected value of the feature vector for a sequence
-LargeNumber **CRF_alpha; // Forward state-cost vectors
-LargeNumber **CRF_beta;  // Backward state-cost vectors
 LargeNumber ***CRF_M;    // Label x label matrix M[i][y][yp] over sequence
+CRFWorker *CRFWorkers;   // Gradient threads used by CRFTrain
+int numCRFWorkers;
 CRFViterbiProb **CRFViterbiProbs; // Results of Viterbi on a test sequence
 int *CRFTestSeqLabels;   // Holds predicted labels for a test sequence
                          // Used for generating label for a window of events
@@ -83,11 +99,12 @@ void RemoveRareCRFFeatures();
 void PrintCRFFeature(FILE *, int);
 void CRFTrain(int);
 void ComputeLogLikelihoodAndGradient(int, double*, double*, double*);
-void CRFTest(int);
+void *CRFGradientWorker(void *);
+void CRFTest(Fold *);
 void ComputeCRF_M(int, int, int);
 void CRFViterbi(int);
-void CRFEvaluateByEvent(int, int);
-void CRFEvaluateByEventSeq (int, int);
+void CRFEvaluateByEvent(Fold *, int, int);
+void CRFEvaluateByEventSeq (Fold *, int, int);
 void VectorMatrixMult(int, LargeNumber*, LargeNumber**, LargeNumber*);
 void MatrixVectorTransposeMult(int, LargeNumber**, LargeNumber*, LargeNumber*);
 void OutputSimpleData(FILE *);
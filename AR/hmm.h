@@ -3,13 +3,13 @@
 #ifndef HMM_H
 #define HMM_H
 
-void HMMTrain(int cvnum);
-void HMMTest(int cvnum);
-void CalculateEmission();
-void NormalizeTransitionProb();
-void UpdateLikelihood(int *event);
-void SaveHMM(FILE *fp);
-void ReadHMM(FILE *fp);
-int GetMax();
+void HMMTrain(Fold *f);
+void HMMTest(Fold *f);
+void CalculateEmission(Fold *f);
+void NormalizeTransitionProb(Fold *f);
+void UpdateLikelihood(Fold *f, int *event);
+void SaveHMM(Fold *f, FILE *fp);
+void ReadHMM(Fold *f, FILE *fp);
+int GetMax(Fold *f);
 
 #endif // HMM_H
@@ -0,0 +1,171 @@
+// logspace.c
+//
+// Log-space version of the LargeNumber arithmetic in ar.c, compiled in
+// place of it when LOGSPACE is defined (make arlog).  A number is kept as
+// its sign and the natural logarithm of its magnitude, so products are
+// sums and no renormalizing loop is needed after each operation.
+
+#include "ar.h"
+
+#ifdef LOGSPACE
+
+// Make the large number zero.
+LargeNumber LargeZero() {
+	LargeNumber result;
+
+	result.logvalue = -HUGE_VAL;
+	result.sign = 0;
+
+	return (result);
+}
+
+// Convert double to log-space number representation.
+LargeNumber MakeLargeNumber(long double num) {
+	LargeNumber result;
+
+	if (num == 0)
+		return (LargeZero());
+	result.logvalue = (double) logl(fabsl(num));
+	result.sign = (num < 0) ? -1 : 1;
+
+	return (result);
+}
+
+// Make the large number mantissa * 10^exponent.
+LargeNumber MakeLargeExponent(long double mantissa, long int exponent) {
+	LargeNumber result = MakeLargeNumber(mantissa);
+
+	if (result.sign != 0)
+		result.logvalue += exponent * log(10.0);
+
+	return (result);
+}
+
+// Make the large number e^num.
+LargeNumber LargeExp(long double num) {
+	LargeNumber result;
+
+	result.logvalue = (double) num;
+	result.sign = 1;
+
+	return (result);
+}
+
+// Convert large number back to a double value.
+long double LargeToDouble(LargeNumber num) {
+	if (num.sign == 0)
+		return (0);
+
+	return (num.sign * expl((long double) num.logvalue));
+}
+
+// Natural logarithm of a large number.
+double LargeLog(LargeNumber num) {
+	if (num.sign == 0)
+		return (-HUGE_VAL);
+
+	return (num.logvalue);
+}
+
+// Log-space numbers are always in standard form.
+LargeNumber Standardize(LargeNumber num) {
+	return (num);
+}
+
+// Compute the sum of two large numbers.
+LargeNumber Add(LargeNumber op1, LargeNumber op2) {
+	LargeNumber result;
+	double diff;
+
+	if (op2.sign == 0)
+		return (op1);
+	if (op1.sign == 0)
+		return (op2);
+
+	// Factor out the operand of larger magnitude
+	if (op1.logvalue < op2.logvalue) {
+		result = op1;
+		op1 = op2;
+		op2 = result;
+	}
+	diff = op2.logvalue - op1.logvalue;
+	result = op1;
+	if (op1.sign == op2.sign)
+		result.logvalue += log1p(exp(diff));
+	else if (diff == 0)
+		result = LargeZero();
+	else
+		result.logvalue += log1p(-exp(diff));
+
+	return (result);
+}
+
+// Compute the difference of two large numbers.
+LargeNumber Subtract(LargeNumber op1, LargeNumber op2) {
+	op2.sign *= -1;
+	return (Add(op1, op2));
+}
+
+// Compute the product of two large numbers.
+LargeNumber Multiply(LargeNumber op1, LargeNumber op2) {
+	LargeNumber result;
+
+	result.sign = op1.sign * op2.sign;
+	if (result.sign == 0)
+		return (LargeZero());
+	result.logvalue = op1.logvalue + op2.logvalue;
+
+	return (result);
+}
+
+// Divide two large numbers.
+LargeNumber Divide(LargeNumber op1, LargeNumber op2) {
+	LargeNumber result;
+
+	result.sign = op1.sign * op2.sign;
+	if (result.sign == 0)
+		return (LargeZero());
+	result.logvalue = op1.logvalue - op2.logvalue;
+
+	return (result);
+}
+
+// Test the equality of two large numbers.
+int IsEqual(LargeNumber op1, LargeNumber op2) {
+	if ((op1.sign == op2.sign) &&
+	    ((op1.sign == 0) || (op1.logvalue == op2.logvalue)))
+		return (TRUE);
+	else
+		return (FALSE);
+}
+
+// Determine if large number op1 is greater than large number op2.
+int IsGreaterThan(LargeNumber op1, LargeNumber op2) {
+	if (op1.sign != op2.sign)
+		return ((op1.sign > op2.sign) ? TRUE : FALSE);
+	if (op1.sign == 0)
+		return (FALSE);
+
+	// Larger magnitude is greater only for positive numbers
+	if (op1.sign > 0)
+		return ((op1.logvalue > op2.logvalue) ? TRUE : FALSE);
+	else
+		return ((op1.logvalue < op2.logvalue) ? TRUE : FALSE);
+}
+
+// Print a large number in the same mantissa exponent format as ar.c.
+void PrintLargeNumber(LargeNumber new)
+{
+	double e10;
+	long int exponent = 0;
+	double mantissa = 0.0;
+
+	if (new.sign != 0) {
+		e10 = new.logvalue / log(10.0);
+		exponent = (long int) floor(e10);
+		mantissa = new.sign * pow(10.0, e10 - exponent);
+	}
+	printf(" %fe%d ", (float) mantissa, (int) exponent);
+}
+
+#endif // LOGSPACE
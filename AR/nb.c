@@ -8,7 +8,7 @@
 #include "nb.h"
 
 // Use a naive Bayes classifier to learn model of activities.
-void NBCTrain(int cvnum) {
+void NBCTrain(Fold *f) {
 	int i, j, k, n, num = 0, snum, start, label, previous;
 
 	//if (mode == TRAIN)
@@ -22,17 +22,17 @@ void NBCTrain(int cvnum) {
 			for (j = 0; j < afreq[i]; j++) // Look at each activity occurrence
 					{
 				// Train on K-1/K data
-				if ((mode == TRAIN) || (K == 1) || (partition[num] != cvnum)) {
+				if ((mode == TRAIN) || (K == 1) || (partition[num] != f->cvnum)) {
 					start = starts[i][j];
 					snum = lengthactivities[i][j];
 					for (k = 0, n = 0; n < snum; k++) {
 						// Only consider events that are part of this activity,
 						// ignore events for overlapping activities
 						if (i == aevents[start + k][LABEL]) {
-							CalculateState(aevents[start + k], sizes[i][j],
+							CalculateState(f, aevents[start + k], sizes[i][j],
 									previousactivity[i][j]);
-							stotal[i] += 1;
-							CalculateEvidence(evidence[i]);
+							f->stotal[i] += 1;
+							CalculateEvidence(f, f->evidence[i]);
 							n++;
 						}
 					}
@@ -46,9 +46,9 @@ void NBCTrain(int cvnum) {
 		start = 0;
 		for (i = 0; i < evnum; i++) {
 			label = aevents[i][LABEL];
-			CalculateState(aevents[i], i - start, previous);
-			stotal[label] += 1;
-			CalculateEvidence(evidence[label]);
+			CalculateState(f, aevents[i], i - start, previous);
+			f->stotal[label] += 1;
+			CalculateEvidence(f, f->evidence[label]);
 			if (label != previous) {
 				previous = label;
 				start = i;
@@ -59,14 +59,14 @@ void NBCTrain(int cvnum) {
 
 // Generate activity label for sensor event sequence using naive Bayes
 // classifier.
-void NBCTest(int cvnum) {
+void NBCTest(Fold *f) {
 	int i, j, k, n, snum, label, class, num=0, start, previous;
 	double p[numactivities], minvalue, mprob;
 
 	//if (mode == TEST)
 	//	printf("NB Test\n");
 	//printf("NB Test (CV fold %d of %d) ...\n", cvnum + 1, K);
-	CalculatePrior(); // Determine prior probability for each activity
+	CalculatePrior(f); // Determine prior probability for each activity
 
 	if (stream == 0) // Process as whole segmented data
 			{
@@ -75,18 +75,18 @@ void NBCTest(int cvnum) {
 			for (j = 0; j < afreq[i]; j++) // Look at each activity occurrence
 					{
 				// Test on 1/K data
-				if ((mode == TEST) || (K == 1) || (partition[num] == cvnum)) {
+				if ((mode == TEST) || (K == 1) || (partition[num] == f->cvnum)) {
 					start = starts[i][j];
-					TestInit(); // Initialize test variables
+					TestInit(f); // Initialize test variables
 					snum = lengthactivities[i][j];
 					for (k = 0, n = 0; n < snum; k++) {
 						// Only consider events that are part of this activity,
 						// ignore events for overlapping activities
 						if (i == aevents[start + k][LABEL]) {
-							CalculateState(aevents[start + k], sizes[i][j],
+							CalculateState(f, aevents[start + k], sizes[i][j],
 									previousactivity[i][j]);
 							// Calculate probability of feature values given activity
-							CalculateEvidence(testevidence);
+							CalculateEvidence(f, f->testevidence);
 							n++;
 						}
 					}
@@ -94,7 +94,7 @@ void NBCTest(int cvnum) {
 					minvalue = 0;
 					mprob = 0;
 					for (k = 0; k < numactivities; k++) {
-						p[k] = CalculateProb(prior[k], k);
+						p[k] = CalculateProb(f, f->prior[k], k);
 						if ((k == 0) || (p[k] < mprob)) {
 							minvalue = k;
 							mprob = p[k];
@@ -103,11 +103,11 @@ void NBCTest(int cvnum) {
 					class = minvalue;
 
 					// Keep track of label frequencies for confusion matrix
-					freq[i][class] += 1;
+					f->freq[i][class] += 1;
 					if (i == class)// Calculate classification accuracy
-						right++;
+						f->right++;
 					else
-						wrong++;
+						f->wrong++;
 				}
 				num++;
 			}
@@ -118,13 +118,13 @@ void NBCTest(int cvnum) {
 		start = 0;
 		for (i = 0; i < evnum - WINDOW; i++) // Process each sensor event in order
 		{
-			TestInit();
+			TestInit(f);
 			label = aevents[i][LABEL];
 
 			for (j = 0; j < WINDOW; j++) {
-				CalculateState(aevents[i + j], i + j - start, previous);
+				CalculateState(f, aevents[i + j], i + j - start, previous);
 				// Calculate probability of feature values given activity
-				CalculateEvidence(testevidence);
+				CalculateEvidence(f, f->testevidence);
 				if (label != previous) {
 					previous = label;
 					start = i;
@@ -133,7 +133,7 @@ void NBCTest(int cvnum) {
 			minvalue = 0;
 			mprob = 0;
 			for (j = 0; j < numactivities; j++) {
-				p[j] = CalculateProb(prior[j], j);
+				p[j] = CalculateProb(f, f->prior[j], j);
 				if ((j == 0) || (p[j] < mprob)) {
 					minvalue = j;
 					mprob = p[j];
@@ -141,16 +141,22 @@ void NBCTest(int cvnum) {
 			}
 			class = minvalue;
 			//printf("%s    %s\n", adatetime[i], activitynames[class]);
+			if (server == 1)
+				fprintf(f->out, "%s    %s\n", adatetime[i],
+						activitynames[class]);
 
-			freq[label][class] += 1;
+			f->freq[label][class] += 1;
 			if (label == class)
-				right++;
+				f->right++;
 			else
-				wrong++;
+				f->wrong++;
 			if ((i%1000) == 0) {
-				printf("%f\n", (float) right / (float) (right + wrong));
-				right = 0;
-				wrong = 0;
+				fprintf(f->log, "%f\n",
+						(float) f->right / (float) (f->right + f->wrong));
+				f->totalright += f->right;
+				f->totalwrong += f->wrong;
+				f->right = 0;
+				f->wrong = 0;
 			}
 		}
 	}
@@ -166,22 +172,22 @@ void NBCTest(int cvnum) {
 // we calculate the product of each occurrence of the feature value
 // in order to compute the probability of the event features given an
 // activity a, or P(e|a).
-double CalculateProb(double p, int a) {
+double CalculateProb(Fold *f, double p, int a) {
 	int i, j, trainval, testval;
 	double ratio;
 
 	p = (double) -1.0 * log(p); // Start with prior probability
 	for (i = 0; i < numfeatures; i++) {
 		for (j = 0; j < numfeaturevalues[i]; j++) {
-			trainval = evidence[a][i][j];
-			testval = testevidence[i][j];
-			if (testevidence[i][j] != 0) // Only include evidence which exists
+			trainval = f->evidence[a][i][j];
+			testval = f->testevidence[i][j];
+			if (f->testevidence[i][j] != 0) // Only include evidence which exists
 					{
 				if (trainval == 0) // Replace 0 values with small number
 					p -= log((double) testval) + log((double) MIN);
 				else // P(e|a), multiplied over each event in the activity
 				{
-					ratio = (double) trainval / (double) stotal[a];
+					ratio = (double) trainval / (double) f->stotal[a];
 					p -= log((double) testval) + log(ratio);
 				}
 			}
@@ -3,8 +3,8 @@
 #ifndef NB_H
 #define NB_H
 
-void NBCTrain(int cvnum);
-void NBCTest(int cvnum);
-double CalculateProb(double p, int a);
+void NBCTrain(Fold *f);
+void NBCTest(Fold *f);
+double CalculateProb(Fold *f, double p, int a);
 
 #endif // NB_H
@@ -0,0 +1,217 @@
+#!/usr/bin/python
+#*****************************************************************************#
+#**
+#**  WASP CAMS Coverage Index
+#**
+#**    Brian L Thomas, 2011
+#**
+#** Tools by the Center for Advanced Studies in Adaptive Systems at
+#**  the School of Electrical Engineering and Computer Science at
+#**  Washington State University
+#** 
+#** Copyright Washington State University, 2017
+#** Copyright Brian L. Thomas, 2017
+#** 
+#** All rights reserved
+#** Modification, distribution, and sale of this work is prohibited without
+#**  permission from Washington State University
+#**
+#** If this code is used for public research, any resulting publications need
+#** to cite work done by Brian L. Thomas at the Center for Advanced Study of 
+#** Adaptive Systems (CASAS) at Washington State University.
+#**  
+#** Contact: Brian L. Thomas (bthomas1@wsu.edu)
+#** Contact: Diane J. Cook (cook@eecs.wsu.edu)
+#*****************************************************************************#
+
+import hashlib
+import math
+import optparse
+import os
+import shutil
+import sys
+import uuid
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+
+def file_hash(filename):
+    """
+    Returns the sha1 hex digest of the contents of the given file.
+    
+    filename - file to hash, such as a site.xml.
+    """
+    data = open(filename, 'rb')
+    digest = hashlib.sha1(data.read()).hexdigest()
+    data.close()
+    return digest
+
+
+###############################################################################
+#### Coverage class
+###############################################################################
+class Coverage:
+    """
+    Field of view of a motion sensor placed on every valid cell of a site.
+    
+    The view of the sensor at cell number n (x + y*width) is stored as rows
+    view[offsets[n]:offsets[n+1]] of (cell number, radius).  Cells with an
+    empty range were not indexed (walls, lintels and off limits cells).
+    """
+    def __init__(self, width, height, radius=7):
+        self.width = int(width)
+        self.height = int(height)
+        self.radius = int(radius)
+        self.offsets = None
+        self.view = None
+        return
+    
+    def build(self, space):
+        """
+        Builds the index from a site space grid as made by load_site().  This
+        evaluates exactly the angle sweep of Emulator.spread_sensor() for
+        every cell at once, stopping each ray at the first wall or lintel.
+        """
+        dx = list()
+        dy = list()
+        for angle in range(360):
+            dx.append(list())
+            dy.append(list())
+            for r in range(self.radius):
+                dx[-1].append(float(r+1) * float(math.cos(math.radians(angle))))
+                dy[-1].append(float(r+1) * float(math.sin(math.radians(angle))))
+        dx = numpy.array(dx, dtype=numpy.float64)
+        dy = numpy.array(dy, dtype=numpy.float64)
+        ranks = numpy.tile(numpy.arange(1, self.radius + 1), 360)
+        
+        blocked = numpy.zeros((self.width + 1, self.height + 1), dtype=bool)
+        blocked[self.width, :] = True
+        blocked[:, self.height] = True
+        valid = numpy.zeros((self.width, self.height), dtype=bool)
+        for x in range(self.width):
+            for y in range(self.height):
+                if space[x][y] in ['w', 'l']:
+                    blocked[x][y] = True
+                elif space[x][y] != 'x':
+                    valid[x][y] = True
+        
+        counts = numpy.zeros(self.width * self.height, dtype=numpy.int32)
+        views = list()
+        for y in range(self.height):
+            for x in range(self.width):
+                if not valid[x][y]:
+                    continue
+                tx = numpy.clip((x + dx).astype(numpy.int64), 0, self.width)
+                ty = numpy.clip((y + dy).astype(numpy.int64), 0, self.height)
+                walls = blocked[tx, ty]
+                seen = (numpy.cumsum(walls, axis=1) == 0).ravel()
+                cells = (tx + (ty * self.width)).ravel()[seen]
+                (cells, first) = numpy.unique(cells, return_index=True)
+                rows = numpy.empty((len(cells), 2), dtype=numpy.int32)
+                rows[:, 0] = cells
+                rows[:, 1] = ranks[seen][first]
+                counts[x + (y * self.width)] = len(rows)
+                views.append(rows)
+        
+        self.offsets = numpy.zeros(len(counts) + 1, dtype=numpy.int64)
+        self.offsets[1:] = numpy.cumsum(counts)
+        if len(views) > 0:
+            self.view = numpy.concatenate(views)
+        else:
+            self.view = numpy.zeros((0, 2), dtype=numpy.int32)
+        return
+    
+    def has_cell(self, x, y):
+        num = x + (y * self.width)
+        return self.offsets[num + 1] > self.offsets[num]
+    
+    def get_view(self, x, y):
+        """
+        Returns a list of (x, y, radius) cells seen by a sensor at x, y.
+        """
+        num = x + (y * self.width)
+        rows = self.view[self.offsets[num]:self.offsets[num + 1]]
+        cells = list()
+        for (cell, r) in rows.tolist():
+            cells.append((cell % self.width, cell // self.width, r))
+        return cells
+    
+    def save(self, directory):
+        numpy.save(os.path.join(directory, "offsets.npy"), self.offsets)
+        numpy.save(os.path.join(directory, "view.npy"), self.view)
+        return
+    
+    def load(self, directory):
+        self.offsets = numpy.load(os.path.join(directory, "offsets.npy"),
+                                  mmap_mode='r')
+        self.view = numpy.load(os.path.join(directory, "view.npy"),
+                               mmap_mode='r')
+        return
+
+
+def open_coverage(cache_dir, file_site, space, width, height, radius=7):
+    """
+    Returns the Coverage for the given site, memory mapped from cache_dir.
+    The index is built and stored the first time a site's contents are seen,
+    later calls (from any process) only map the stored arrays.
+    
+    cache_dir - directory holding one sub directory per site content hash.
+    file_site - site.xml file the space grid was loaded from.
+    space - site space grid as made by load_site().
+    """
+    name = "%s_r%s" % (file_hash(file_site), str(radius))
+    directory = os.path.join(cache_dir, name)
+    coverage = Coverage(width, height, radius)
+    if not os.path.isdir(directory):
+        if not os.path.isdir(cache_dir):
+            try:
+                os.makedirs(cache_dir)
+            except OSError:
+                pass
+        coverage.build(space)
+        tmp_dir = os.path.join(cache_dir, "%s.%s" % (name, uuid.uuid4().hex))
+        os.mkdir(tmp_dir)
+        coverage.save(tmp_dir)
+        try:
+            os.rename(tmp_dir, directory)
+        except OSError:
+            shutil.rmtree(tmp_dir)
+    coverage.load(directory)
+    return coverage
+
+
+if __name__ == "__main__":
+    print "CAMS Coverage Index"
+    parser = optparse.OptionParser(usage="usage: %prog [options]")
+    parser.add_option("-s",
+                      "--site",
+                      dest="site",
+                      help="Site configuration file.")
+    parser.add_option("-d",
+                      "--directory",
+                      dest="directory",
+                      help="Directory to store coverage indexes in.")
+    (options, args) = parser.parse_args()
+    if None in [options.site, options.directory]:
+        if options.site == None:
+            print "ERROR: Missing -s / --site"
+        if options.directory == None:
+            print "ERROR: Missing -d / --directory"
+        parser.print_help()
+        sys.exit()
+    from CAMS_Emulator import Emulator
+    options.movement = None
+    options.chromosome = None
+    options.output = None
+    options.engine = "loop"
+    options.fov_cache = None
+    options.traces = None
+    cams_em = Emulator(options)
+    cams_em.load_site()
+    coverage = open_coverage(options.directory, options.site, cams_em.space,
+                             cams_em.max_width, cams_em.max_height)
+    print "Indexed cells:", int(numpy.count_nonzero(numpy.diff(coverage.offsets)))
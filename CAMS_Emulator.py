@@ -25,65 +25,52 @@
 #*****************************************************************************#
 
 import ConfigParser
+import collections
 import copy
-import datetime
+import heapq
 import math
 import optparse
+import os
 import pprint
 import re
 import sys
 import xml.dom.minidom
 
+try:
+    import numpy
+except ImportError:
+    numpy = None
 
+import CAMS_Coverage
+import CAMS_Trace
+from CAMS_Time import SECOND, format_timestamp, get_timestamp
 
-def get_datetime(newVal):
-    """
-    Takes the given string in format of YYYY-MM-DD HH:MM:SS.ms and converts it
-    to a datetime.datetime() object.  The ms field is optional.
-    
-    newVal - string to convert to a datetime.datetime() object.
-    """
-    stuff = re.split('\s+', newVal)
-    date = re.split('-', stuff[0])
-    time = re.split(':', stuff[1])
-    sec = []
-    try:
-        if re.search('\.', time[2]) == None:
-            sec.append(time[2])
-            sec.append("0")
-        else:
-            sec = re.split('\.', time[2])
-    except:
-        print newVal
-        z = int("45.2")
-    dt = datetime.datetime(int(date[0]),
-                           int(date[1]),
-                           int(date[2]),
-                           int(time[0]),
-                           int(time[1]),
-                           int(sec[0]),
-                           int(sec[1]))
-    return dt
 
+HOLD_OFF = SECOND * 5 / 2
+BUFFER_WINDOW = SECOND / 4
 
-def compare_events(one, two):
-    if one.dt <= two.dt:
-        if one.dt == two.dt:
-            return 0
-        else:
-            return -1
-    return 1
+
+def event_time(event):
+    return event.dt
 
 
 ###############################################################################
 #### PersonEvent class
 ###############################################################################
 class PersonEvent:
-    def __init__(self, line):
+    def __init__(self, line=None):
+        if line == None:
+            self.dt = None
+            self.res = "0"
+            self.x = "-1"
+            self.y = "-1"
+            self.speed = 0.0
+            self.annotation = ""
+            return
         stuff = re.split('\s+', str(line).strip())
         date = str(stuff[0]).strip()
         time = str(stuff[1]).strip()
-        self.dt = get_datetime("%s %s" % (date, time))
+        self.dt = get_timestamp("%s %s" % (date, time))
         self.res = str(stuff[2]).strip()
         self.x = str(stuff[3]).strip()
         self.y = str(stuff[4]).strip()
@@ -94,7 +81,8 @@ class PersonEvent:
         return
     
     def __str__(self):
-        mystr = "%s\t%s\t%s\t%s\t%s\t%s" % (str(self.dt), self.res, self.x,
+        mystr = "%s\t%s\t%s\t%s\t%s\t%s" % (format_timestamp(self.dt),
+                                            self.res, self.x,
                                             self.y, self.speed, self.annotation)
         return mystr
 
@@ -115,7 +103,7 @@ class Event:
     
     def __str__(self):
         mystr = "<event "
-        mystr += "timestamp=\"%s\" " % str(self.dt)
+        mystr += "timestamp=\"%s\" " % format_timestamp(self.dt)
         mystr += "serial=\"%s\" " % str(self.serial)
         mystr += "message=\"%s\" " % str(self.message)
         mystr += "x=\"%s\" " % str(self.px)
@@ -207,12 +195,49 @@ class MotionSensor(Sensor):
             self.last_motion = pevent.dt
         else:
             if self.state == "ON":
-                if (pevent.dt - self.last_motion) >= datetime.timedelta(0,2.5):
+                if (pevent.dt - self.last_motion) >= HOLD_OFF:
                     self.state = "OFF"
                     self.add_event(pevent.dt, self.id, self.state, pevent)
         return
 
 
+###############################################################################
+#### StreamCache class
+###############################################################################
+class StreamCache:
+    """
+    Least recently used cache of per sensor event streams, keyed by
+    (site hash, movement file, cell).  Entries are evicted once the total
+    size of the cached streams passes budget bytes.
+    """
+    def __init__(self, budget=256*1024*1024):
+        self.budget = int(budget)
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.entries = collections.OrderedDict()
+        return
+    
+    def get(self, key):
+        if key not in self.entries:
+            self.misses += 1
+            return None
+        self.hits += 1
+        (value, size) = self.entries.pop(key)
+        self.entries[key] = (value, size)
+        return value
+    
+    def put(self, key, value, size):
+        if key in self.entries:
+            self.size -= self.entries.pop(key)[1]
+        self.entries[key] = (value, size)
+        self.size += size
+        while self.size > self.budget and len(self.entries) > 1:
+            (old, (oldValue, oldSize)) = self.entries.popitem(last=False)
+            self.size -= oldSize
+        return
+
+
 ###############################################################################
 #### Emulator class
 ###############################################################################
@@ -222,6 +247,17 @@ class Emulator:
         self.file_movement = str(options.movement)
         self.file_chromosome = str(options.chromosome)
         self.file_output = str(options.output)
+        self.engine = str(options.engine)
+        self.fov_cache = options.fov_cache
+        self.coverage = None
+        self.site_space = None
+        self.trace_dir = options.traces
+        self.trace = None
+        self.stream_cache = None
+        self.site_key = None
+        self.spots = None
+        self.timeline = None
+        self.timeline_pos = None
         self.max_width = 0
         self.max_height = 0
         self.space = None
@@ -303,10 +339,31 @@ class Emulator:
                     height = str(c.getAttribute("height")).strip()
                     self.areas[-1].add_area(x, y, width, height,
                                             self.max_width, self.max_height)
+        self.site_space = copy.deepcopy(self.space)
         #self.print_obj(self.space)
+        if self.fov_cache != None and numpy != None:
+            self.coverage = CAMS_Coverage.open_coverage(str(self.fov_cache),
+                                                        self.file_site,
+                                                        self.space,
+                                                        self.max_width,
+                                                        self.max_height)
         return
     
     def load_movement(self):
+        path = None
+        if self.trace_dir != None and numpy != None:
+            path = CAMS_Trace.trace_path(str(self.trace_dir), self.file_movement)
+            if os.path.isdir(path):
+                trace = CAMS_Trace.MovementTrace(path)
+                if trace.is_current(self.file_movement):
+                    trace.load()
+                    self.trace = trace
+                    self.movement = list()
+                    if self.engine != "numpy":
+                        for i in range(len(trace)):
+                            self.movement.append(self.trace_event(i))
+                    return
+        
         #print "Loading movement file."
         fileIn = open(self.file_movement)
         mData = fileIn.readlines()
@@ -320,15 +377,15 @@ class Emulator:
         #print "Adding extra buffers."
         startDT = self.movement[0].dt
         endDT = self.movement[-1].dt
-        window = datetime.timedelta(0, 0.25)
+        window = BUFFER_WINDOW
         extra = startDT + window
-        self.movement.append(PersonEvent("%s\t0\t-1\t-1\t0.0" % str(extra)))
+        self.movement.append(self.buffer_event(extra))
         while extra < endDT:
-            self.movement.append(PersonEvent("%s\t0\t-1\t-1\t0.0" % str(extra)))
+            self.movement.append(self.buffer_event(extra))
             extra += window
         
         #print "Sorting movement events."
-        self.movement.sort(cmp=compare_events)
+        self.movement.sort(key=event_time)
         
         #print "Filling empty buffer x/y values."
         mSpeed = int(self.movement[0].speed)
@@ -351,14 +408,39 @@ class Emulator:
                 mSpeed = copy.copy(self.movement[i].speed)
                 if re.search('-end', mAnnotation):
                     mAnnotation = ""
+        
+        # Compile the trace so later loads of this file only map it
+        if path != None:
+            CAMS_Trace.compile_trace(self.movement, self.file_movement, path)
         return
     
+    def buffer_event(self, dt):
+        pevent = PersonEvent()
+        pevent.dt = dt
+        return pevent
+    
+    def trace_event(self, row):
+        pevent = PersonEvent()
+        (pevent.dt, pevent.res, pevent.x, pevent.y,
+         pevent.speed, pevent.annotation) = self.trace.get_row(row)
+        return pevent
+    
+    def get_person_event(self, row):
+        if self.trace != None and len(self.movement) == 0:
+            return self.trace_event(row)
+        return self.movement[row]
+    
     def load_chromosome(self):
         dom = xml.dom.minidom.parse(self.file_chromosome)
         chromo = dom.getElementsByTagName("chromosome")
         cData = str(chromo[0].getAttribute("data"))
+        self.load_genome(cData)
+        return
+    
+    def load_genome(self, cData):
         senId = 0
-        
+        self.space = copy.deepcopy(self.site_space)
+        self.events = list()
         self.sensors = list()
         self.sensor_view = list()
         for x in range(self.max_width):
@@ -373,7 +455,10 @@ class Emulator:
                     self.sensors.append(MotionSensor(senId, x, y))
                     self.space[x][y] = str(senId)
                     self.sensor_view[x][y].append(str(senId))
-                    self.spread_sensor(senId, x, y)
+                    if self.coverage != None and self.coverage.has_cell(x, y):
+                        self.apply_coverage(senId, x, y)
+                    else:
+                        self.spread_sensor(senId, x, y)
                     senId += 1
         
         for x in range(len(self.sensors)):
@@ -405,6 +490,15 @@ class Emulator:
                     break
         return
     
+    def apply_coverage(self, id, sX, sY):
+        for (saX, saY, r) in self.coverage.get_view(sX, sY):
+            self.sensors[id].add_view(saX, saY, r)
+            if self.space[saX][saY] == ' ':
+                self.space[saX][saY] = str(id)
+            if str(id) not in self.sensor_view[saX][saY]:
+                self.sensor_view[saX][saY].append(str(id))
+        return
+    
     def add_sensor_event(self, dt, serial, message, pevent):
         self.events.append(Event(dt, serial, message, pevent))
         return
@@ -429,10 +523,115 @@ class Emulator:
     
     def emulate(self):
         #print "Emulating environment."
+        if self.engine == "numpy":
+            self.emulate_numpy()
+        else:
+            self.emulate_loop()
+        self.relabel_events()
+        return
+    
+    def emulate_loop(self):
         for m in range(len(self.movement)):
             for s in range(len(self.sensors)):
                 self.sensors[s].apply_person_event(self.movement[m])
+        return
+    
+    def emulate_numpy(self):
+        """
+        Computes the same ON/OFF events as emulate_loop(), but works out each
+        sensor's transitions in bulk from an occupancy mask over the movement
+        timeline instead of stepping every sensor through every sample.  The
+        per sensor streams are then merged back into one event list.
+        """
+        if numpy == None:
+            print "ERROR: numpy is required for --engine=numpy"
+            sys.exit()
+        if self.timeline is None:
+            self.load_timeline()
+        streams = list()
+        for s in range(len(self.sensors)):
+            streams.append(self.get_sensor_stream(s))
         
+        for (row, s, on) in heapq.merge(*streams):
+            message = "OFF"
+            if on:
+                message = "ON"
+            pevent = self.get_person_event(row)
+            self.add_sensor_event(pevent.dt, self.sensors[s].id,
+                                  message, pevent)
+        return
+    
+    def load_timeline(self):
+        self.spots = dict()
+        if self.trace != None and len(self.movement) == 0:
+            places = numpy.asarray(self.trace.x, dtype=numpy.int64) << 16
+            places |= numpy.asarray(self.trace.y, dtype=numpy.int64) & 0xFFFF
+            (places, first, inverse) = numpy.unique(places, return_index=True,
+                                                    return_inverse=True)
+            for i in range(len(places)):
+                spot = "%sx%s" % (str(self.trace.x[first[i]]),
+                                  str(self.trace.y[first[i]]))
+                self.spots[spot] = i
+            self.timeline_pos = inverse.astype(numpy.int32)
+            self.timeline = numpy.asarray(self.trace.dt) - self.trace.dt[0]
+            return
+        self.timeline_pos = numpy.empty(len(self.movement), dtype=numpy.int32)
+        self.timeline = numpy.empty(len(self.movement), dtype=numpy.int64)
+        epoch = self.movement[0].dt
+        for m in range(len(self.movement)):
+            spot = "%sx%s" % (str(self.movement[m].x), str(self.movement[m].y))
+            if spot not in self.spots:
+                self.spots[spot] = len(self.spots)
+            self.timeline_pos[m] = self.spots[spot]
+            self.timeline[m] = self.movement[m].dt - epoch
+        return
+    
+    def get_sensor_stream(self, s):
+        """
+        Returns sensor s's events as a sorted list of (movement row, s, on).
+        Streams only depend on the site, the movement file and the sensor's
+        cell, so they are kept in the stream cache when there is one.
+        """
+        key = None
+        if self.stream_cache != None:
+            if self.site_key == None:
+                self.site_key = CAMS_Coverage.file_hash(self.file_site)
+            cell = self.sensors[s].x + (self.sensors[s].y * self.max_width)
+            key = (self.site_key, os.path.abspath(self.file_movement), cell)
+            found = self.stream_cache.get(key)
+            if found != None:
+                (rows, ons) = found
+                return zip(rows.tolist(), [s] * len(rows), ons.tolist())
+        
+        hold = HOLD_OFF
+        total = len(self.timeline)
+        seen = numpy.zeros(len(self.spots), dtype=bool)
+        for spot in self.spots.keys():
+            if spot in self.sensors[s].view:
+                seen[self.spots[spot]] = True
+        hits = numpy.flatnonzero(seen[self.timeline_pos])
+        rows = numpy.zeros(0, dtype=numpy.int32)
+        ons = numpy.zeros(0, dtype=bool)
+        if len(hits) > 0:
+            following = numpy.append(hits[1:], total)
+            expire = numpy.searchsorted(self.timeline,
+                                        self.timeline[hits] + hold,
+                                        side="left")
+            gone = expire < following
+            starts = numpy.append(hits[:1], following[gone & (following < total)])
+            stops = expire[gone]
+            rows = numpy.concatenate((starts, stops)).astype(numpy.int32)
+            ons = numpy.concatenate((numpy.ones(len(starts), dtype=bool),
+                                     numpy.zeros(len(stops), dtype=bool)))
+            order = numpy.argsort(rows, kind="mergesort")
+            rows = rows[order]
+            ons = ons[order]
+        
+        if key != None:
+            self.stream_cache.put(key, (rows, ons), rows.nbytes + ons.nbytes)
+        return zip(rows.tolist(), [s] * len(rows), ons.tolist())
+    
+    def relabel_events(self):
         activeAnn = ""
         endAnn = ""
         for x in range(len(self.events)-1):
@@ -483,13 +682,23 @@ class Emulator:
                 
         return
     
-    def output_results(self):
+    def get_annotations(self):
+        annotations = list()
+        if self.trace != None:
+            annotations = self.trace.annotation_order()
+        else:
+            for i in range(len(self.movement)):
+                annotations.append(self.movement[i].annotation)
         dist_ann = list()
-        for i in range(len(self.movement)):
-            if self.movement[i].annotation != "":
-                myann = str(self.movement[i].annotation).split("-")[0]
+        for ann in annotations:
+            if ann != "":
+                myann = str(ann).split("-")[0]
                 if myann not in dist_ann:
                     dist_ann.append(myann)
+        return dist_ann
+    
+    def output_results(self):
+        dist_ann = self.get_annotations()
         outFile = open(self.file_output, 'w')
         outFile.write("<data ")
         outFile.write("filename=\"%s\" " % self.file_movement)
@@ -538,6 +747,17 @@ if __name__ == "__main__":
                       "--output",
                       dest="output",
                       help="Filename to output resulting dataset to.")
+    parser.add_option("-e",
+                      "--engine",
+                      dest="engine",
+                      help="Emulation engine to use (loop or numpy).",
+                      default="loop")
+    parser.add_option("--fov_cache",
+                      dest="fov_cache",
+                      help="Directory for cached sensor field of view indexes.")
+    parser.add_option("--traces",
+                      dest="traces",
+                      help="Directory of compiled movement traces, compiled there on first use.")
     (options, args) = parser.parse_args()
     if None in [options.site, options.movement, options.chromosome, options.output]:
         if options.site == None:
@@ -44,37 +44,9 @@ from pygraph.algorithms.minmax import shortest_path
 from pygraph.classes.exceptions import NodeUnreachable
 from pygraph.readwrite import dot
 
+from CAMS_Time import get_datetime
 
 
-def get_datetime(newVal):
-    """
-    Takes the given string in format of YYYY-MM-DD HH:MM:SS.ms and converts it
-    to a datetime.datetime() object.  The ms field is optional.
-    
-    newVal - string to convert to a datetime.datetime() object.
-    """
-    stuff = re.split('\s+', newVal)
-    date = re.split('-', stuff[0])
-    time = re.split(':', stuff[1])
-    sec = []
-    try:
-        if re.search('\.', time[2]) == None:
-            sec.append(time[2])
-            sec.append("0")
-        else:
-            sec = re.split('\.', time[2])
-    except:
-        print newVal
-        z = int("45.2")
-    dt = datetime.datetime(int(date[0]),
-                           int(date[1]),
-                           int(date[2]),
-                           int(time[0]),
-                           int(time[1]),
-                           int(sec[0]),
-                           int(sec[1]))
-    return dt
-
 
 ###############################################################################
 #### PersonEvent class
@@ -0,0 +1,99 @@
+#!/usr/bin/python
+#*****************************************************************************#
+#**
+#**  WASP CAMS Timestamps
+#** 
+#**    Brian L Thomas, 2011
+#** 
+#** Tools by the Center for Advanced Studies in Adaptive Systems at
+#**  the School of Electrical Engineering and Computer Science at
+#**  Washington State University
+#** 
+#** Copyright Washington State University, 2017
+#** Copyright Brian L. Thomas, 2017
+#** 
+#** All rights reserved
+#** Modification, distribution, and sale of this work is prohibited without
+#**  permission from Washington State University
+#** 
+#** If this code is used for public research, any resulting publications need
+#** to cite work done by Brian L. Thomas at the Center for Advanced Study of 
+#** Adaptive Systems (CASAS) at Washington State University.
+#**  
+#** Contact: Brian L. Thomas (bthomas1@wsu.edu)
+#** Contact: Diane J. Cook (cook@eecs.wsu.edu)
+#*****************************************************************************#
+
+import datetime
+
+
+EPOCH = datetime.datetime(1970, 1, 1)
+EPOCH_ORDINAL = EPOCH.toordinal()
+SECOND = 1000000
+DAY = 86400 * SECOND
+
+_days = dict()
+_dates = dict()
+
+
+
+def get_timestamp(newVal):
+    """
+    Takes the given string in format of YYYY-MM-DD HH:MM:SS.ms and converts it
+    to integer microseconds since the epoch.  The ms field is optional, and
+    as with the old get_datetime() its digits are taken as microseconds.
+    
+    newVal - string to convert, anything after the time field is ignored.
+    """
+    stuff = newVal.split()
+    if stuff[0] not in _days:
+        date = stuff[0].split('-')
+        day = datetime.date(int(date[0]), int(date[1]), int(date[2]))
+        _days[stuff[0]] = day.toordinal() - EPOCH_ORDINAL
+    time = stuff[1].split(':')
+    sec = time[2].split('.')
+    hour = int(time[0])
+    minute = int(time[1])
+    second = int(sec[0])
+    usec = 0
+    if len(sec) > 1:
+        usec = int(sec[1])
+    if hour > 23 or minute > 59 or second > 59 or usec >= SECOND:
+        raise ValueError("Time out of range: %s" % newVal)
+    secs = (hour * 60 + minute) * 60 + second
+    return _days[stuff[0]] * DAY + secs * SECOND + usec
+
+
+def format_timestamp(stamp):
+    """
+    Returns the integer timestamp as text, the same as str() gives for the
+    equivalent datetime.datetime() object.
+    """
+    (days, usec) = divmod(stamp, DAY)
+    if days not in _dates:
+        day = datetime.date.fromordinal(days + EPOCH_ORDINAL)
+        _dates[days] = "%04d-%02d-%02d" % (day.year, day.month, day.day)
+    (secs, usec) = divmod(usec, SECOND)
+    (mins, secs) = divmod(secs, 60)
+    (hours, mins) = divmod(mins, 60)
+    if usec:
+        return "%s %02d:%02d:%02d.%06d" % (_dates[days], hours, mins, secs,
+                                           usec)
+    return "%s %02d:%02d:%02d" % (_dates[days], hours, mins, secs)
+
+
+def to_datetime(stamp):
+    """
+    Converts an integer timestamp to a datetime.datetime() object.
+    """
+    return EPOCH + datetime.timedelta(microseconds=stamp)
+
+
+def get_datetime(newVal):
+    """
+    Takes the given string in format of YYYY-MM-DD HH:MM:SS.ms and converts it
+    to a datetime.datetime() object.  The ms field is optional.
+    
+    newVal - string to convert to a datetime.datetime() object.
+    """
+    return to_datetime(get_timestamp(newVal))
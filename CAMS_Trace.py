@@ -0,0 +1,251 @@
+#!/usr/bin/python
+#*****************************************************************************#
+#**
+#**  WASP CAMS Movement Trace Compiler
+#** 
+#**    Brian L Thomas, 2011
+#** 
+#** Tools by the Center for Advanced Studies in Adaptive Systems at
+#**  the School of Electrical Engineering and Computer Science at
+#**  Washington State University
+#** 
+#** Copyright Washington State University, 2017
+#** Copyright Brian L. Thomas, 2017
+#** 
+#** All rights reserved
+#** Modification, distribution, and sale of this work is prohibited without
+#**  permission from Washington State University
+#** 
+#** If this code is used for public research, any resulting publications need
+#** to cite work done by Brian L. Thomas at the Center for Advanced Study of 
+#** Adaptive Systems (CASAS) at Washington State University.
+#**  
+#** Contact: Brian L. Thomas (bthomas1@wsu.edu)
+#** Contact: Diane J. Cook (cook@eecs.wsu.edu)
+#*****************************************************************************#
+
+import optparse
+import os
+import shutil
+import sys
+import uuid
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+from CAMS_Coverage import file_hash
+
+
+COLUMNS = ["dt", "res", "x", "y", "speed", "ann"]
+
+
+
+def trace_path(trace_dir, file_movement):
+    """
+    Returns the compiled trace directory for the given movement file.
+    """
+    name = os.path.splitext(os.path.basename(file_movement))[0]
+    return os.path.join(trace_dir, "%s.trace" % name)
+
+
+def file_stamp(filename):
+    """
+    Returns the modification time and size of the given file as text.
+    """
+    info = os.stat(filename)
+    return "%r %d" % (info.st_mtime, info.st_size)
+
+
+def write_source(directory, digest, stamp):
+    """
+    Writes the source file of a trace, the sha1 hex digest and stamp of
+    the text movement file it was compiled from, replacing the old one in
+    one step.
+    """
+    tmp_file = os.path.join(directory, "source.%s" % uuid.uuid4().hex)
+    out = open(tmp_file, 'w')
+    out.write("%s\n" % digest)
+    out.write("%s\n" % stamp)
+    out.close()
+    os.rename(tmp_file, os.path.join(directory, "source"))
+    return
+
+
+def compile_trace(movement, file_movement, directory):
+    """
+    Writes the movement of a loaded Emulator (buffer events already merged
+    and x/y/annotation filled) to directory as one .npy file per column.
+    
+    movement - list of PersonEvent as made by Emulator.load_movement().
+    file_movement - text movement file the events were loaded from.
+    directory - trace directory to create, see trace_path().
+    """
+    total = len(movement)
+    cols = dict()
+    cols["dt"] = numpy.empty(total, dtype=numpy.int64)
+    cols["res"] = numpy.empty(total, dtype=numpy.int8)
+    cols["x"] = numpy.empty(total, dtype=numpy.int16)
+    cols["y"] = numpy.empty(total, dtype=numpy.int16)
+    cols["speed"] = numpy.empty(total, dtype=numpy.float64)
+    cols["ann"] = numpy.empty(total, dtype=numpy.int16)
+    annotations = dict()
+    names = list()
+    for i in range(total):
+        pevent = movement[i]
+        for val in [pevent.res, pevent.x, pevent.y]:
+            if str(int(val)) != str(val):
+                print "ERROR: %s is not an integer in %s" % (val, file_movement)
+                return False
+        cols["dt"][i] = pevent.dt
+        cols["res"][i] = int(pevent.res)
+        cols["x"][i] = int(pevent.x)
+        cols["y"][i] = int(pevent.y)
+        cols["speed"][i] = float(pevent.speed)
+        if pevent.annotation not in annotations:
+            annotations[pevent.annotation] = len(names)
+            names.append(pevent.annotation)
+        cols["ann"][i] = annotations[pevent.annotation]
+    
+    stamp = file_stamp(file_movement)
+    parent = os.path.dirname(os.path.abspath(directory))
+    if not os.path.isdir(parent):
+        try:
+            os.makedirs(parent)
+        except OSError:
+            pass
+    tmp_dir = os.path.join(parent, "%s.%s" % (os.path.basename(directory),
+                                              uuid.uuid4().hex))
+    os.mkdir(tmp_dir)
+    for c in COLUMNS:
+        numpy.save(os.path.join(tmp_dir, "%s.npy" % c), cols[c])
+    out = open(os.path.join(tmp_dir, "annotations"), 'w')
+    for name in names:
+        out.write("%s\n" % name)
+    out.close()
+    write_source(tmp_dir, file_hash(file_movement), stamp)
+    if os.path.isdir(directory):
+        shutil.rmtree(directory, ignore_errors=True)
+    try:
+        os.rename(tmp_dir, directory)
+    except OSError:
+        # Another process put its trace there first
+        shutil.rmtree(tmp_dir)
+    return True
+
+
+###############################################################################
+#### MovementTrace class
+###############################################################################
+class MovementTrace:
+    """
+    Compiled movement file, with each column memory mapped from disk.
+    Timestamps are microseconds since the epoch, annotations are ids into
+    self.annotations.
+    """
+    def __init__(self, directory):
+        self.directory = directory
+        self.source = None
+        self.annotations = list()
+        for c in COLUMNS:
+            setattr(self, c, None)
+        return
+    
+    def load(self):
+        for c in COLUMNS:
+            setattr(self, c, numpy.load(os.path.join(self.directory,
+                                                     "%s.npy" % c),
+                                        mmap_mode='r'))
+        data = open(os.path.join(self.directory, "annotations"))
+        self.annotations = list()
+        for line in data.readlines():
+            self.annotations.append(str(line).rstrip("\n"))
+        data.close()
+        data = open(os.path.join(self.directory, "source"))
+        self.source = str(data.readline()).strip()
+        data.close()
+        return
+    
+    def is_current(self, file_movement):
+        """
+        True when the trace was compiled from the current contents of the
+        given text movement file.  The file is only hashed when its
+        modification time or size changed since the trace last checked it.
+        """
+        if not os.path.isfile(os.path.join(self.directory, "source")):
+            return False
+        data = open(os.path.join(self.directory, "source"))
+        source = str(data.readline()).strip()
+        stamp = str(data.readline()).strip()
+        data.close()
+        current = file_stamp(file_movement)
+        if stamp == current:
+            return True
+        if source != file_hash(file_movement):
+            return False
+        write_source(self.directory, source, current)
+        return True
+    
+    def __len__(self):
+        return len(self.dt)
+    
+    def get_row(self, i):
+        """
+        Returns (dt, res, x, y, speed, annotation) for row i, with the same
+        types PersonEvent uses.
+        """
+        return (int(self.dt[i]), str(self.res[i]), str(self.x[i]),
+                str(self.y[i]), float(self.speed[i]),
+                self.annotations[self.ann[i]])
+    
+    def annotation_order(self):
+        """
+        Returns the annotations in the order they first appear in the trace.
+        """
+        (ids, first) = numpy.unique(numpy.asarray(self.ann), return_index=True)
+        order = list()
+        for i in numpy.argsort(first):
+            order.append(self.annotations[ids[i]])
+        return order
+
+
+if __name__ == "__main__":
+    print "CAMS Movement Trace Compiler"
+    parser = optparse.OptionParser(usage="usage: %prog [options]")
+    parser.add_option("-d",
+                      "--data",
+                      dest="data",
+                      help="Directory of movement data files.")
+    parser.add_option("-o",
+                      "--output",
+                      dest="output",
+                      help="Directory to write compiled traces to.")
+    (options, args) = parser.parse_args()
+    if None in [options.data, options.output]:
+        if options.data == None:
+            print "ERROR: Missing -d / --data"
+        if options.output == None:
+            print "ERROR: Missing -o / --output"
+        parser.print_help()
+        sys.exit()
+    from CAMS_Emulator import Emulator
+    if not os.path.isdir(options.output):
+        os.makedirs(options.output)
+    files = os.listdir(options.data)
+    files.sort()
+    for f in files:
+        fname = os.path.join(options.data, f)
+        if not os.path.isfile(fname):
+            continue
+        options.site = None
+        options.movement = fname
+        options.chromosome = None
+        options.engine = "loop"
+        options.fov_cache = None
+        options.traces = None
+        cams_em = Emulator(options)
+        cams_em.load_movement()
+        print f
+        compile_trace(cams_em.movement, fname,
+                      trace_path(options.output, fname))
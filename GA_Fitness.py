@@ -24,140 +24,351 @@
 #** Contact: Diane J. Cook (cook@eecs.wsu.edu)
 #*****************************************************************************#
 
-import copy
-import datetime
 import optparse
 import os
 import re
+import StringIO
 import subprocess
 import sys
-import time
-import uuid
 import xml.dom.minidom
+import xml.parsers.expat
 
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+import CAMS_Emulator
+from CAMS_Time import SECOND, format_timestamp, get_timestamp
 from GA_Reproduce import Chromosome
 
 
-def get_datetime(newVal):
+TICK = SECOND / 100
+READ_SIZE = 1024 * 1024
+BLOCK_GAP = 3600 * SECOND
+
+
+class Event:
+    def __init__(self, dt, ann, orig):
+        self.dt = dt
+        self.ann = ann
+        self.orig = orig
+        return
+    
+    def sort_key(self):
+        """
+        Events sort by time, with original data events before the
+        classified events at the same time.
+        """
+        return (self.dt, not self.orig)
+
+
+
+class Dataset:
     """
-    Takes the given string in format of YYYY-MM-DD HH:MM:SS.ms and converts it
-    to a datetime.datetime() object.  The ms field is optional.
+    One emulated sensor dataset, as written by CAMS_Emulator.
     
-    newVal - string to convert to a datetime.datetime() object.
+    name - key for the dataset, the emulated file or movement file.
+    filename - movement file the dataset was emulated from.
+    annotations - annotation names present in the movement file.
+    events - list of (timestamp, serial, message, annotation) strings, or
+             None to stream them from the emulated XML file called name.
     """
-    stuff = re.split('\s+', newVal)
-    date = re.split('-', stuff[0])
-    time = re.split(':', stuff[1])
-    sec = []
-    try:
-        if re.search('\.', time[2]) == None:
-            sec.append(time[2])
-            sec.append("0")
-        else:
-            sec = re.split('\.', time[2])
-    except:
-        print newVal
-        z = int("45.2")
-    dt = datetime.datetime(int(date[0]),
-                           int(date[1]),
-                           int(date[2]),
-                           int(time[0]),
-                           int(time[1]),
-                           int(sec[0]),
-                           int(sec[1]))
-    return dt
+    def __init__(self, name, filename=None, annotations=None, events=None):
+        self.name = name
+        self.filename = None
+        self.orig = None
+        self.annotations = annotations
+        self.events = events
+        if filename != None:
+            self.set_filename(filename)
+        return
+    
+    def set_filename(self, filename):
+        self.filename = filename
+        dir = os.path.dirname(filename)
+        nName = os.path.basename(filename)
+        nName = re.sub('^m', '', nName)
+        self.orig = os.path.join(dir, nName)
+        return
+    
+    def get_events(self):
+        """
+        Iterates over the (timestamp, serial, message, annotation) events.
+        For an XML dataset the movement filename and annotations are filled
+        in as soon as the data element has been read.
+        """
+        if self.events != None:
+            return iter(self.events)
+        return self.read_xml()
+    
+    def read_xml(self):
+        rows = list()
+        
+        def start_element(name, attrs):
+            if name == "event":
+                rows.append((attrs.get("timestamp", ""),
+                             attrs.get("serial", ""),
+                             attrs.get("message", ""),
+                             attrs.get("annotation", "")))
+            elif name == "data":
+                self.set_filename(attrs.get("filename", ""))
+                self.annotations = list()
+                if "annotations" in attrs:
+                    self.annotations = str(attrs["annotations"]).split(',')
+            return
+        
+        parser = xml.parsers.expat.ParserCreate()
+        parser.StartElementHandler = start_element
+        data = open(self.name)
+        while True:
+            chunk = data.read(READ_SIZE)
+            parser.Parse(chunk, chunk == "")
+            for row in rows:
+                yield row
+            del rows[:]
+            if chunk == "":
+                break
+        data.close()
+        return
 
 
+def read_dataset(filename):
+    """
+    Returns a Dataset for an emulated dataset XML file.  The file is only
+    parsed when the events are read, one chunk at a time.
+    """
+    return Dataset(filename)
 
-class Event:
-    def __init__(self, dt, ann, orig):
-        self.dt = copy.copy(dt)
-        self.ann = copy.copy(ann)
-        self.orig = copy.copy(orig)
+
+def format_info(calc):
+    """
+    Formats the per annotation confusion counts as the chromosome info
+    string, name:TP:FP:TN:FN for each annotation.
+    """
+    msg = ""
+    for x in calc.keys():
+        msg += "%s:" % str(x)
+        msg += "%d:" % calc[x]['TP']
+        msg += "%d:" % calc[x]['FP']
+        msg += "%d:" % calc[x]['TN']
+        msg += "%d," % calc[x]['FN']
+    return msg
+
+
+class GroundTruth:
+    """
+    Annotation active at each line of an original data file, in file order.
+    Parsed once and then shared between CookAr runs through CookAr.truths,
+    so the original files are only read again when they change.
+    """
+    def __init__(self, filename):
+        self.filename = filename
+        self.stamp = self.get_stamp()
+        self.times = list()
+        self.labels = list()
+        data = open(self.filename)
+        activeAnn = "Other"
+        nextOther = False
+        for line in data:
+            stuff = str(line).split()
+            if nextOther:
+                activeAnn = "Other"
+                nextOther = False
+            
+            if len(stuff) > 4:
+                if '-begin' in stuff[4]:
+                    activeAnn = stuff[4].replace('-begin', '')
+                elif '-end' in stuff[4]:
+                    nextOther = True
+            self.times.append(get_timestamp(line))
+            self.labels.append(activeAnn)
+        data.close()
         return
     
-    def __cmp__(self, other):
-        val = 0
-        if self.dt < other.dt:
-            val = -1
-        elif self.dt > other.dt:
-            val = 1
-        elif self.orig and not other.orig:
-            val = -1
-        elif not self.orig and other.orig:
-            val = 1
-        return val
+    def get_stamp(self):
+        info = os.stat(self.filename)
+        return (info.st_mtime, info.st_size)
+    
+    def is_current(self):
+        if not os.path.isfile(self.filename):
+            return False
+        return self.get_stamp() == self.stamp
+
 
+class ArServer:
+    """
+    Resident "ar -server" process.  Each call to classify() sends one
+    parameter file and data file over the pipe and reads back the event
+    classifications, so a worker pays for starting ar only once.
+    """
+    def __init__(self, ar_path, options=None):
+        self.ar_path = str(ar_path)
+        self.options = options
+        if self.options == None:
+            self.options = ["-stream"]
+        self.process = None
+        self.devnull = None
+        self.disabled = False
+        return
+    
+    def start(self):
+        """
+        Starts ar and reads the "ready" line it greets with in server mode.
+        Raises IOError when ar can not be run or has no server mode, the
+        server then stays disabled.
+        """
+        self.devnull = open(os.devnull, 'w')
+        try:
+            self.process = subprocess.Popen([self.ar_path, "-server"] +
+                                            self.options,
+                                            stdin=subprocess.PIPE,
+                                            stdout=subprocess.PIPE,
+                                            stderr=self.devnull)
+        except OSError, e:
+            self.close()
+            raise IOError("can not run %s: %s" % (self.ar_path, e.strerror))
+        line = self.process.stdout.readline()
+        if not line.startswith("ready "):
+            self.close()
+            self.disabled = True
+            raise IOError("%s has no server mode, rebuild it from AR/" %
+                          self.ar_path)
+        return
+    
+    def classify(self, config, data):
+        """
+        Returns (lines, right, wrong), where lines are the
+        "date time activity" classifications ar made for the data.  Raises
+        IOError when ar exits or refuses the request, the next call starts
+        a new process.
+        
+        config - contents of the ar parameter file.
+        data - contents of the ar data file.
+        """
+        if self.disabled:
+            raise IOError("%s has no server mode, rebuild it from AR/" %
+                          self.ar_path)
+        if self.process == None or self.process.poll() != None:
+            self.close()
+            self.start()
+        try:
+            self.process.stdin.write("request %d %d\n" % (len(config),
+                                                          len(data)))
+            self.process.stdin.write(config)
+            self.process.stdin.write(data)
+            self.process.stdin.flush()
+        except IOError:
+            raise self.failed()
+        lines = list()
+        while True:
+            line = self.process.stdout.readline()
+            if line == "":
+                raise self.failed()
+            if line.startswith("done "):
+                stuff = line.split()
+                return (lines, int(stuff[1]), int(stuff[2]))
+            if line.startswith("error "):
+                raise IOError("ar server: %s" % line[6:].strip())
+            lines.append(line)
+    
+    def failed(self):
+        """
+        Closes the process after it died during a request and returns the
+        IOError to raise.
+        """
+        status = self.close()
+        if status != None and status < 0:
+            return IOError("ar server killed by signal %d" % -status)
+        return IOError("ar server exited with status %s" % str(status))
+    
+    def close(self):
+        """
+        Stops the process, returns its exit status or None.
+        """
+        status = None
+        if self.process != None:
+            try:
+                self.process.stdin.close()
+            except IOError:
+                pass
+            status = self.process.wait()
+            self.process = None
+        if self.devnull != None:
+            self.devnull.close()
+            self.devnull = None
+        return status
 
 
 class CookAr:
-    def __init__(self, options):
-        self.file_chromosome = str(options.chromosome)
-        self.file_site = str(options.site)
-        self.working_dir = str(options.work)
-        self.files_rawdata = str(options.files).split(',')
+    def __init__(self, working_dir, chromosome, ar_path=None, scoring=None,
+                 server=None):
+        self.working_dir = str(working_dir)
+        self.chromosome = chromosome
+        self.ar_path = ar_path
+        if self.ar_path == None:
+            self.ar_path = os.path.join(self.working_dir, "ar")
+        self.server = server
+        self.scoring = scoring
+        if self.scoring == None:
+            self.scoring = "intervals"
+            if numpy != None:
+                self.scoring = "numpy"
+        self.datasets = list()
         self.files_orig = dict()
         self.file_ranges = dict()
         self.calc = dict()
+        self.truths = dict()
         self.all_annotations = list()
         self.all_annotations.append("Other")
-        for x in self.files_rawdata:
-            self.file_ranges[x] = list()
-            dom = xml.dom.minidom.parse(x)
-            data = dom.getElementsByTagName("data")
-            fname = data[0].getAttribute("filename")
-            dir = os.path.dirname(fname)
-            nName = os.path.basename(fname)
-            nName = re.sub('^m', '', nName)
-            origFile = os.path.join(dir, nName)
-            self.files_orig[x] = origFile
-            info = data[0].firstChild
-            self.file_ranges[x].append(get_datetime(info.getAttribute("timestamp")))
-            info = data[0].lastChild
-            self.file_ranges[x].append(get_datetime(info.getAttribute("timestamp")))
-            if data[0].hasAttribute("annotations"):
-                this_ann = data[0].getAttribute("annotations")
-                this_ann_list = str(this_ann).split(',')
-                for one_ann in this_ann_list:
-                    if one_ann not in self.all_annotations:
-                        self.all_annotations.append(str(one_ann).strip())
-            oData = open(origFile)
-            lines = oData.readlines()
-            oData.close()
-            self.file_ranges[origFile] = list()
-            stuff = str(lines[0]).split()
-            self.file_ranges[origFile].append(get_datetime("%s %s" % (stuff[0],
-                                                                      stuff[1])))
-            stuff = str(lines[-1]).split()
-            self.file_ranges[origFile].append(get_datetime("%s %s" % (stuff[0],
-                                                                      stuff[1])))
-        
-        self.all_annotations.sort()
-        dom = xml.dom.minidom.parse(self.file_site)
-        site = dom.getElementsByTagName("site")
-        self.max_width = int(float(site[0].getAttribute("max_width")))
-        self.max_height = int(float(site[0].getAttribute("max_height")))
-        self.chromosome = Chromosome(self.file_chromosome,
-                                     self.max_width, self.max_height)
         self.annotations = list()
-        name = str(uuid.uuid4().hex)
-        self.file_config = os.path.join(self.working_dir, "%s.config" % str(name))
-        self.file_data = os.path.join(self.working_dir, "%s.data" % str(name))
         self.fitness = -1
         self.events = list()
         return
     
-    def write_data(self):
-        out = open(self.file_data, 'w')
-        for fname in self.files_rawdata:
-            dom = xml.dom.minidom.parse(fname)
-            data = dom.getElementsByTagName("data")
-            children = data[0].childNodes
-            for event in children:
-                dt = event.getAttribute("timestamp")
-                serial = event.getAttribute("serial")
-                message = event.getAttribute("message")
-                annotation = event.getAttribute("annotation")
+    def get_truth(self, filename):
+        truth = self.truths.get(filename)
+        if truth == None or not truth.is_current():
+            self.truths[filename] = GroundTruth(filename)
+        return self.truths[filename]
+    
+    def load_files(self, files):
+        for x in files:
+            self.add_dataset(read_dataset(x))
+        return
+    
+    def add_dataset(self, dataset):
+        self.datasets.append(dataset)
+        return
+    
+    def index_dataset(self, dataset, first, last):
+        """
+        Records the time range, original data file and annotations of a
+        dataset once write_data() has read through it.
+        """
+        x = dataset.name
+        self.file_ranges[x] = list()
+        origFile = dataset.orig
+        self.files_orig[x] = origFile
+        self.file_ranges[x].append(get_timestamp(first))
+        self.file_ranges[x].append(get_timestamp(last))
+        for one_ann in dataset.annotations:
+            if one_ann not in self.all_annotations:
+                self.all_annotations.append(str(one_ann).strip())
+        truth = self.get_truth(origFile)
+        self.file_ranges[origFile] = list()
+        self.file_ranges[origFile].append(truth.times[0])
+        self.file_ranges[origFile].append(truth.times[-1])
+        self.all_annotations.sort()
+        return
+    
+    def write_data(self, out):
+        for dataset in self.datasets:
+            first = None
+            dt = None
+            for (dt, serial, message, annotation) in dataset.get_events():
+                if first == None:
+                    first = dt
                 stuff = str(annotation).split(",")
                 ann = ""
                 for line in stuff:
@@ -169,11 +380,10 @@ class CookAr:
                     if str(ann).split()[0] not in self.annotations:
                         self.annotations.append(str(ann).split()[0])
                 out.write("%s\t%s\t%s\t%s\n" % (dt, serial, message, ann))
-        out.close()
+            self.index_dataset(dataset, first, dt)
         return
     
-    def write_config(self):
-        out = open(self.file_config, 'w')
+    def write_config(self, out):
         out.write("numactivities\n")
         out.write("  %s\n" % str(len(self.all_annotations)))
         out.write("activitynames\n")
@@ -200,47 +410,85 @@ class CookAr:
             out.write("  %s %s\n" % (str(x), str(x)))
         out.write("model\n")
         out.write("  naivebayes")
-        out.close()
         return
     
     def run(self):
-        self.write_data()
-        self.write_config()
-        p = subprocess.Popen([os.path.join(self.working_dir, "ar"),
-                              self.file_data, self.file_config, "-stream"],
-                             stdout=subprocess.PIPE)
-        
-        while p.poll() == None:
-            data = p.stdout.readlines()
-            for x in data:
-                stuff = str(str(x).strip()).split()
-                dt = get_datetime("%s %s" % (stuff[0], stuff[1]))
-                self.events.append(Event(dt, stuff[2], False))
-            time.sleep(1)
+        out = StringIO.StringIO()
+        self.write_data(out)
+        data = out.getvalue()
+        out = StringIO.StringIO()
+        self.write_config(out)
+        config = out.getvalue()
+        out = None
+        # Without a resident server, ar answers this one request and exits
+        server = self.server
+        if server == None:
+            server = ArServer(self.ar_path)
+        try:
+            (lines, right, wrong) = server.classify(config, data)
+        finally:
+            if self.server == None:
+                server.close()
+        data = None
+        for x in lines:
+            stuff = str(str(x).strip()).split()
+            dt = get_timestamp("%s %s" % (stuff[0], stuff[1]))
+            self.events.append(Event(dt, stuff[2], False))
         
         for fname in self.files_orig.keys():
-            data = open(self.files_orig[fname])
-            info = data.readlines()
-            data.close()
-            activeAnn = "Other"
-            nextOther = False
-            for line in info:
-                stuff = str(str(line).strip()).split()
-                dt = get_datetime("%s %s" % (stuff[0], stuff[1]))
-                if nextOther:
-                    activeAnn = "Other"
-                    nextOther = False
-                
-                if len(stuff) > 4:
-                    if re.search('-begin', stuff[4]):
-                        activeAnn = re.sub('-begin', '', stuff[4])
-                    elif re.search('-end', stuff[4]):
-                        nextOther = True
-                ann = str(activeAnn)
-                self.events.append(Event(dt, ann, True))
+            truth = self.get_truth(self.files_orig[fname])
+            for x in range(len(truth.times)):
+                self.events.append(Event(truth.times[x], truth.labels[x],
+                                         True))
         
-        self.events.sort()
-        hourTD = datetime.timedelta(hours=1)
+        self.events.sort(key=Event.sort_key)
+        for x in self.all_annotations:
+            self.calc[x] = {'TP':0, 'FP':0, 'TN':0, 'FN':0}
+        
+        if self.scoring == "ticks":
+            totalTicks = self.score_ticks()
+        elif self.scoring == "numpy":
+            totalTicks = self.score_numpy()
+        else:
+            totalTicks = self.score_intervals()
+        
+        for x in self.all_annotations:
+            self.calc[x]['TN'] = totalTicks - self.calc[x]['TP'] - self.calc[x]['FP'] - self.calc[x]['FN']
+        testing = 0
+        for x in range(len(self.events)):
+            if not self.events[x].orig:
+                testing += 1
+        
+        avgAcc = 0.0
+        for x in self.all_annotations:
+            xPos = float(self.calc[x]['TP'] + self.calc[x]['FN'])
+            xNeg = float(self.calc[x]['FP'] + self.calc[x]['TN'])
+            tpr = 0.0
+            if xPos > 0:
+                tpr = float(self.calc[x]['TP']) / float(xPos)
+            fpr = 0.0
+            if xNeg > 0:
+                fpr = float(self.calc[x]['FP']) / float(xNeg)
+            acc = (tpr - fpr) * 100.0
+            if x != "Other":
+                avgAcc += acc
+            msg = "%10s  TP =%5d  FP =%5d" % (x, self.calc[x]['TP'], self.calc[x]['FP'])
+            msg += "  TN =%5d  FN =%5d" % (self.calc[x]['TN'], self.calc[x]['FN'])
+            msg += "\ttpr=%f  fpr=%f" % (tpr*100.0, fpr*100.0)
+            msg += "    acc=%f" % (acc)
+            #msg += "\t p=%f  f=%f" % (xPos, xNeg)
+            #print msg
+        self.fitness = avgAcc/(len(self.all_annotations)-1)
+        #self.fitness += 2.0 * float(len(self.annotations))
+        return
+    
+    def score_ticks(self):
+        """
+        Reference scoring, steps through each block of events in 10ms ticks
+        and counts the label active at every tick.  Returns the total number
+        of ticks.
+        """
+        hourTD = BLOCK_GAP
         blocks = list()
         blocks.append(list())
         chunk = 0
@@ -253,13 +501,10 @@ class CookAr:
                 blocks.append(list())
         blocks[chunk].append(self.events[-1])
         
-        for x in self.all_annotations:
-            self.calc[x] = {'TP':0, 'FP':0, 'TN':0, 'FN':0}
-        
         totalTicks = 0
         for x in range(len(blocks)):
             step = blocks[x][0].dt
-            stepper = datetime.timedelta(seconds=0.01)
+            stepper = TICK
             t = 0
             activeAnn = "Other"
             while t < len(blocks[x]):
@@ -281,35 +526,215 @@ class CookAr:
                         step += stepper
                 else:
                     t += 1
-        
-        for x in self.all_annotations:
-            self.calc[x]['TN'] = totalTicks - self.calc[x]['TP'] - self.calc[x]['FP'] - self.calc[x]['FN']
-        testing = 0
+        return totalTicks
+    
+    def get_ticks(self):
+        """
+        Returns how many ticks score_ticks() spends on each event.  The tick
+        loop sits on an event for one tick plus one for every 10ms boundary
+        (counted from the start of its block) passed before the next event of
+        the block.
+        """
+        ticks = list()
+        start = None
         for x in range(len(self.events)):
-            if not self.events[x].orig:
-                testing += 1
+            dt = self.events[x].dt
+            if x == 0 or (dt - self.events[x-1].dt) > BLOCK_GAP:
+                start = dt
+            ticks.append(1)
+            if x+1 < len(self.events):
+                nxt = self.events[x+1].dt
+                if (nxt - dt) <= BLOCK_GAP:
+                    ticks[x] += (nxt - start) / TICK - (dt - start) / TICK
+        return ticks
+    
+    def score_intervals(self):
+        """
+        Gives the same counts as score_ticks(), weighting each event by the
+        number of ticks it stays current instead of stepping through them.
+        """
+        ticks = self.get_ticks()
+        totalTicks = 0
+        activeAnn = "Other"
+        for x in range(len(self.events)):
+            event = self.events[x]
+            if x > 0 and (event.dt - self.events[x-1].dt) > BLOCK_GAP:
+                activeAnn = "Other"
+            if activeAnn not in self.calc:
+                self.calc[activeAnn] = {'TP':0, 'FP':0, 'TN':0, 'FN':0}
+            totalTicks += ticks[x]
+            if event.orig:
+                activeAnn = event.ann
+                if ticks[x] > 1 and activeAnn not in self.calc:
+                    self.calc[activeAnn] = {'TP':0, 'FP':0, 'TN':0, 'FN':0}
+            elif event.ann == activeAnn:
+                self.calc[event.ann]['TP'] += ticks[x]
+            else:
+                self.calc[event.ann]['FP'] += ticks[x]
+                self.calc[activeAnn]['FN'] += ticks[x]
+        return totalTicks
+    
+    def score_numpy(self):
+        """
+        numpy version of score_intervals().
+        """
+        if numpy == None:
+            return self.score_intervals()
+        names = list(self.calc.keys())
+        ids = dict()
+        for x in range(len(names)):
+            ids[names[x]] = x
+        for event in self.events:
+            if not event.orig and event.ann not in ids:
+                return self.score_intervals()
         
-        avgAcc = 0.0
-        for x in self.all_annotations:
-            xPos = float(self.calc[x]['TP'] + self.calc[x]['FN'])
-            xNeg = float(self.calc[x]['FP'] + self.calc[x]['TN'])
-            tpr = 0.0
-            if xPos > 0:
-                tpr = float(self.calc[x]['TP']) / float(xPos)
-            fpr = 0.0
-            if xNeg > 0:
-                fpr = float(self.calc[x]['FP']) / float(xNeg)
-            acc = (tpr - fpr) * 100.0
-            if x != "Other":
-                avgAcc += acc
-            msg = "%10s  TP =%5d  FP =%5d" % (x, self.calc[x]['TP'], self.calc[x]['FP'])
-            msg += "  TN =%5d  FN =%5d" % (self.calc[x]['TN'], self.calc[x]['FN'])
-            msg += "\ttpr=%f  fpr=%f" % (tpr*100.0, fpr*100.0)
-            msg += "    acc=%f" % (acc)
-            #msg += "\t p=%f  f=%f" % (xPos, xNeg)
-            #print msg
-        self.fitness = avgAcc/(len(self.all_annotations)-1)
-        #self.fitness += 2.0 * float(len(self.annotations))
+        total = len(self.events)
+        dt = numpy.empty(total, dtype=numpy.int64)
+        orig = numpy.empty(total, dtype=bool)
+        ann = numpy.empty(total, dtype=numpy.int64)
+        for x in range(total):
+            event = self.events[x]
+            dt[x] = event.dt
+            orig[x] = event.orig
+            if event.ann not in ids:
+                ids[event.ann] = len(names)
+                names.append(event.ann)
+            ann[x] = ids[event.ann]
+        
+        gaps = numpy.diff(dt) > BLOCK_GAP
+        first = numpy.flatnonzero(numpy.concatenate(([True], gaps)))
+        block = numpy.cumsum(numpy.concatenate(([0], gaps)))
+        steps = (dt - dt[first][block]) // TICK
+        ticks = numpy.ones(total, dtype=numpy.int64)
+        ticks[:-1] += numpy.where(gaps, 0, numpy.diff(steps))
+        
+        # Label active before each event: the last original event earlier
+        # in the same block, or Other.
+        last = numpy.where(orig, numpy.arange(total), -1)
+        last = numpy.maximum.accumulate(last)
+        last = numpy.concatenate(([-1], last[:-1]))
+        active = numpy.where(last >= first[block], ann[last], ids["Other"])
+        
+        created = numpy.empty(total * 2, dtype=numpy.int64)
+        created[0::2] = active
+        created[1::2] = numpy.where(orig & (ticks > 1), ann, -1)
+        (found, order) = numpy.unique(created, return_index=True)
+        for x in found[numpy.argsort(order)]:
+            if x >= 0 and names[x] not in self.calc:
+                self.calc[names[x]] = {'TP':0, 'FP':0, 'TN':0, 'FN':0}
+        
+        pred = ~orig
+        hit = pred & (ann == active)
+        miss = pred & (ann != active)
+        size = len(names)
+        tp = numpy.bincount(ann[hit], weights=ticks[hit], minlength=size)
+        fp = numpy.bincount(ann[miss], weights=ticks[miss], minlength=size)
+        fn = numpy.bincount(active[miss], weights=ticks[miss], minlength=size)
+        for x in range(size):
+            if names[x] in self.calc:
+                self.calc[names[x]]['TP'] += int(tp[x])
+                self.calc[names[x]]['FP'] += int(fp[x])
+                self.calc[names[x]]['FN'] += int(fn[x])
+        return int(ticks.sum())
+
+
+class Evaluator:
+    """
+    Emulates and scores chromosomes inside the calling process.  Parsed
+    sites, movement traces and emulated sensor streams are kept between
+    calls to evaluate(), so a worker thread only pays for them once.  With
+    server set, ar also stays resident as an ArServer, running its cross
+    validation folds on ar_threads threads.  A stream_cache given is used
+    instead of one of cache_budget bytes, so Evaluators of one thread can
+    share a budget.
+    """
+    def __init__(self, working_dir, ar_path, engine=None, fov_cache=None,
+                 traces=None, cache_budget=256*1024*1024, scoring=None,
+                 server=True, ar_threads=1, stream_cache=None):
+        self.working_dir = str(working_dir)
+        self.ar_path = str(ar_path)
+        self.scoring = scoring
+        self.server = None
+        if server:
+            self.server = ArServer(self.ar_path,
+                                   ["-stream", "-threads", str(ar_threads)])
+        self.engine = engine
+        if self.engine == None:
+            self.engine = "loop"
+            if CAMS_Emulator.numpy != None:
+                self.engine = "numpy"
+        self.fov_cache = fov_cache
+        self.traces = traces
+        self.stream_cache = stream_cache
+        if self.stream_cache == None:
+            self.stream_cache = CAMS_Emulator.StreamCache(cache_budget)
+        self.truths = dict()
+        self.emulators = dict()
+        return
+    
+    def get_emulator(self, site, movement):
+        key = (site, movement)
+        if key not in self.emulators:
+            options = optparse.Values({"site":site,
+                                       "movement":movement,
+                                       "chromosome":None,
+                                       "output":None,
+                                       "engine":self.engine,
+                                       "fov_cache":self.fov_cache,
+                                       "traces":self.traces})
+            emulator = CAMS_Emulator.Emulator(options)
+            emulator.stream_cache = self.stream_cache
+            emulator.load_site()
+            emulator.load_movement()
+            self.emulators[key] = emulator
+        return self.emulators[key]
+    
+    def evaluate(self, site, movement_files, orig_files, genome):
+        """
+        Returns (fitness, calc) for the genome, where calc holds the TP, FP,
+        TN and FN counts for each annotation.
+        
+        site - site.xml file.
+        movement_files - movement files to emulate the genome on.
+        orig_files - original data files to score against, matched to the
+                     movement files by name (mP001.txt -> P001.txt).
+        genome - chromosome data string.
+        """
+        origs = dict()
+        for of in orig_files:
+            origs[os.path.basename(of)] = of
+        
+        datasets = list()
+        for mf in movement_files:
+            emulator = self.get_emulator(site, mf)
+            emulator.load_genome(str(genome))
+            emulator.emulate()
+            events = list()
+            for e in emulator.events:
+                events.append((format_timestamp(e.dt), str(e.serial),
+                               str(e.message), str(e.annotation)))
+            annotations = ",".join(emulator.get_annotations()).split(',')
+            dataset = Dataset(mf, mf, annotations, events)
+            oName = os.path.basename(dataset.orig)
+            if oName in origs:
+                dataset.orig = origs[oName]
+            datasets.append(dataset)
+        
+        emulator = self.get_emulator(site, movement_files[0])
+        chrom = Chromosome("", emulator.max_width, emulator.max_height)
+        chrom.set_text(genome)
+        myobj = CookAr(self.working_dir, chrom, self.ar_path, self.scoring,
+                       self.server)
+        myobj.truths = self.truths
+        for dataset in datasets:
+            myobj.add_dataset(dataset)
+        myobj.run()
+        return (myobj.fitness, myobj.calc)
+    
+    def close(self):
+        if self.server != None:
+            self.server.close()
+        self.emulators = dict()
         return
 
 
@@ -336,6 +761,9 @@ if __name__ == "__main__":
                       "--work",
                       dest="work",
                       help="Working directory for data.")
+    parser.add_option("--scoring",
+                      dest="scoring",
+                      help="Scoring to use (ticks, intervals or numpy).")
     (options, args) = parser.parse_args()
     if None in [options.files, options.chromosome, options.site, options.method, options.work]:
         if options.files == None:
@@ -352,25 +780,19 @@ if __name__ == "__main__":
         sys.exit()
     
     if str(options.method) == "CookAr":
-        myobj = CookAr(options)
-        myobj.run()
-        
-        fitness = myobj.fitness
-        print "Fitness =",fitness
-        msg = ""
-        for x in myobj.calc.keys():
-            msg += "%s:" % str(x)
-            msg += "%d:" % myobj.calc[x]['TP']
-            msg += "%d:" % myobj.calc[x]['FP']
-            msg += "%d:" % myobj.calc[x]['TN']
-            msg += "%d," % myobj.calc[x]['FN']
         dom = xml.dom.minidom.parse(options.site)
         site = dom.getElementsByTagName("site")
         max_width = int(float(site[0].getAttribute("max_width")))
         max_height = int(float(site[0].getAttribute("max_height")))
         chrom = Chromosome(options.chromosome, max_width, max_height)
+        myobj = CookAr(options.work, chrom, scoring=options.scoring)
+        myobj.load_files(str(options.files).split(','))
+        myobj.run()
+        
+        fitness = myobj.fitness
+        print "Fitness =",fitness
         chrom.fitness = fitness
-        chrom.info = msg
+        chrom.info = format_info(myobj.calc)
         out = open(chrom.filename, 'w')
         out.write(str(chrom))
         out.close()
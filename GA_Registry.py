@@ -0,0 +1,232 @@
+#!/usr/bin/python
+#*****************************************************************************#
+#**
+#**  WASP GA Genome Registry
+#** 
+#**    Brian L Thomas, 2011
+#** 
+#** Tools by the Center for Advanced Studies in Adaptive Systems at
+#**  the School of Electrical Engineering and Computer Science at
+#**  Washington State University
+#** 
+#** Copyright Washington State University, 2017
+#** Copyright Brian L. Thomas, 2017
+#** 
+#** All rights reserved
+#** Modification, distribution, and sale of this work is prohibited without
+#**  permission from Washington State University
+#** 
+#** If this code is used for public research, any resulting publications need
+#** to cite work done by Brian L. Thomas at the Center for Advanced Study of 
+#** Adaptive Systems (CASAS) at Washington State University.
+#**  
+#** Contact: Brian L. Thomas (bthomas1@wsu.edu)
+#** Contact: Diane J. Cook (cook@eecs.wsu.edu)
+#*****************************************************************************#
+
+import hashlib
+import math
+import optparse
+import os
+import pgdb
+import struct
+import sys
+import uuid
+
+
+
+def genome_hash(text):
+    """
+    Returns the 64 bit hash of a genome in its text form.
+    """
+    return int(hashlib.sha1(text).hexdigest()[:16], 16)
+
+
+###############################################################################
+#### GenomeRegistry class
+###############################################################################
+class GenomeRegistry:
+    """
+    Record of the genomes in the chromosome table, so that duplicate
+    children can be rejected without asking the DB about each one.
+    
+    Hashes of the genomes seen by this process are kept in a set, every
+    genome stored in the DB is in a Bloom filter saved to filename along with
+    the highest cid it covers.  A genome whose hash is in the set is known
+    to be stored, one that misses the filter is known to be new, and only
+    the rest have to be confirmed by the DB.
+    
+    Genomes are told apart by a 64 bit hash alone.  A collision can only
+    make a new genome look stored, so the child is bred again, it can never
+    let a stored genome through as new.  With a million genomes the chance
+    of any collision is about 3e-8.
+    
+    Cids are taken when a row is inserted, not when it is committed, so a
+    manager can commit a lower cid after a higher one was read.  Cids
+    missing below the highest one read are asked for again by each
+    catch_up() until they are window cids behind it.
+    """
+    window = 10000
+    
+    def __init__(self, filename, capacity=1000000, error_rate=0.01):
+        self.filename = filename
+        self.known = set()
+        self.missing = set()
+        self.last_cid = 0
+        self.count = 0
+        self.size_filter(capacity, error_rate)
+        return
+    
+    def size_filter(self, capacity, error_rate=0.01):
+        self.capacity = int(capacity)
+        self.error_rate = float(error_rate)
+        bits = -self.capacity * math.log(self.error_rate) / (math.log(2) ** 2)
+        self.num_bits = int(math.ceil(bits / 8.0)) * 8
+        self.num_hashes = max(1, int(round(bits / self.capacity * math.log(2))))
+        self.bits = bytearray(self.num_bits / 8)
+        self.count = 0
+        self.last_cid = 0
+        self.missing = set()
+        return
+    
+    def positions(self, value):
+        h1 = value & 0xffffffff
+        h2 = (value >> 32) | 1
+        for i in range(self.num_hashes):
+            yield (h1 + i * h2) % self.num_bits
+    
+    def add(self, text):
+        value = genome_hash(text)
+        if value not in self.known:
+            self.known.add(value)
+            new = False
+            for pos in self.positions(value):
+                if not self.bits[pos >> 3] & (1 << (pos & 7)):
+                    self.bits[pos >> 3] |= 1 << (pos & 7)
+                    new = True
+            if new:
+                self.count += 1
+        return
+    
+    def is_known(self, text):
+        """
+        True when the genome was added by this process, so it is stored.
+        """
+        return genome_hash(text) in self.known
+    
+    def may_contain(self, text):
+        """
+        False when the genome is certainly not stored in the DB.
+        """
+        value = genome_hash(text)
+        if value in self.known:
+            return True
+        for pos in self.positions(value):
+            if not self.bits[pos >> 3] & (1 << (pos & 7)):
+                return False
+        return True
+    
+    def load(self, cr):
+        """
+        Reads the saved filter, then adds the genomes stored in the DB after
+        it was saved, and those of the last window cids it covered.  When the filter has filled up past its capacity it is
+        rebuilt twice as large from the whole chromosome table.
+        
+        cr - cursor on the wasp DB.
+        """
+        if self.filename != None and os.path.isfile(self.filename):
+            data = open(self.filename, 'rb')
+            (capacity, error_rate, count, last_cid, num_bits,
+             num_hashes) = struct.unpack("<QdQQQQ", data.read(48))
+            self.capacity = capacity
+            self.error_rate = error_rate
+            self.num_bits = num_bits
+            self.num_hashes = num_hashes
+            self.bits = bytearray(data.read())
+            self.count = count
+            self.last_cid = last_cid
+            data.close()
+        self.catch_up(cr, True)
+        if self.count > self.capacity:
+            self.size_filter(self.capacity * 2, self.error_rate)
+            self.known = set()
+            self.catch_up(cr)
+        return
+    
+    def catch_up(self, cr, rescan=False):
+        """
+        Adds the genomes stored in the DB since the filter last covered it,
+        by this or any other manager, and those committed late under a
+        missing cid.  Call it before each round of breeding of a long
+        running process.
+        
+        rescan - read the last window cids again instead of the missing
+                 ones, for a filter loaded from its file.
+        """
+        first = self.last_cid
+        if rescan:
+            first = max(0, self.last_cid - self.window)
+        query = "SELECT cid, genome FROM chromosome WHERE cid>%s" % str(first)
+        if len(self.missing) > 0 and not rescan:
+            query += " OR cid IN (%s)" % ",".join([str(c) for c in
+                                                   sorted(self.missing)])
+        query += " ORDER BY cid"
+        cr.execute(query)
+        found = set()
+        last = self.last_cid
+        row = cr.fetchone()
+        while row != None:
+            self.add(str(row[1]).strip())
+            found.add(int(row[0]))
+            last = max(last, int(row[0]))
+            row = cr.fetchone()
+        self.missing.difference_update(found)
+        for cid in range(max(first, last - self.window) + 1, last):
+            if cid not in found:
+                self.missing.add(cid)
+        self.last_cid = last
+        self.missing = set([c for c in self.missing
+                            if c > self.last_cid - self.window])
+        return
+    
+    def save(self):
+        """
+        Writes the filter to filename, replacing the old one in one step.
+        """
+        if self.filename == None:
+            return
+        directory = os.path.dirname(os.path.abspath(self.filename))
+        tmp_file = os.path.join(directory, "%s.%s" % (
+                os.path.basename(self.filename), uuid.uuid4().hex))
+        out = open(tmp_file, 'wb')
+        out.write(struct.pack("<QdQQQQ", self.capacity, self.error_rate,
+                              self.count, self.last_cid, self.num_bits,
+                              self.num_hashes))
+        out.write(str(self.bits))
+        out.close()
+        os.rename(tmp_file, self.filename)
+        return
+
+
+if __name__ == "__main__":
+    print "GA Genome Registry"
+    parser = optparse.OptionParser(usage="usage: %prog [options]")
+    parser.add_option("-f",
+                      "--file",
+                      dest="file",
+                      help="Genome registry file to build or bring up to date.")
+    parser.add_option("--capacity",
+                      dest="capacity",
+                      help="Number of genomes to size a new registry for.",
+                      default="1000000")
+    (options, args) = parser.parse_args()
+    if None in [options.file]:
+        if options.file == None:
+            print "ERROR: Missing -f / --file"
+        parser.print_help()
+        sys.exit()
+    mydb = pgdb.connect("", "", "", "", "wasp")
+    registry = GenomeRegistry(options.file, int(float(options.capacity)))
+    registry.load(mydb.cursor())
+    registry.save()
+    print "Genomes:", registry.count
@@ -2,9 +2,9 @@
 #*****************************************************************************#
 #**
 #**  WASP GA Reproduce
-#**
+#** 
 #**    Brian L Thomas, 2011
-#**
+#** 
 #** Tools by the Center for Advanced Studies in Adaptive Systems at
 #**  the School of Electrical Engineering and Computer Science at
 #**  Washington State University
@@ -15,7 +15,7 @@
 #** All rights reserved
 #** Modification, distribution, and sale of this work is prohibited without
 #**  permission from Washington State University
-#**
+#** 
 #** If this code is used for public research, any resulting publications need
 #** to cite work done by Brian L. Thomas at the Center for Advanced Study of 
 #** Adaptive Systems (CASAS) at Washington State University.
@@ -24,7 +24,7 @@
 #** Contact: Diane J. Cook (cook@eecs.wsu.edu)
 #*****************************************************************************#
 
-import copy
+import math
 import optparse
 import os
 import random
@@ -35,6 +35,106 @@ import sys
 import uuid
 import xml.dom.minidom
 
+from GA_Registry import GenomeRegistry
+import GA_Surrogate
+
+
+
+###############################################################################
+#### Genome class
+###############################################################################
+class Genome:
+    """
+    Sensor layout of a chromosome as an integer bitset, bit n is set when
+    cell number n (x + y*width) has a sensor.  The text form used by the DB
+    and the chromosome xml has one '0'/'1' character per cell, cell 0 first.
+    """
+    def __init__(self, size, bits=0):
+        self.size = int(size)
+        self.bits = bits
+        return
+    
+    def copy(self):
+        return Genome(self.size, self.bits)
+    
+    def get(self, num):
+        return (self.bits >> num) & 1 == 1
+    
+    def set(self, num):
+        self.bits |= 1 << num
+        return
+    
+    def invert(self, num):
+        self.bits ^= 1 << num
+        return
+    
+    def count(self):
+        return bin(self.bits).count("1")
+    
+    def cells(self):
+        """
+        Returns the list of cell numbers that have a sensor.
+        """
+        cells = list()
+        bits = self.bits
+        while bits:
+            low = bits & -bits
+            cells.append(low.bit_length() - 1)
+            bits ^= low
+        return cells
+    
+    def span(self, start, end):
+        """
+        Returns the mask of cells start up to (not including) end.
+        """
+        return ((1 << end) - 1) ^ ((1 << start) - 1)
+    
+    def crossover(self, other, points):
+        """
+        Returns the genome taking the cells between alternate pairs of the
+        sorted cut points (which include 0 and size) from self and other.
+        """
+        bits = 0
+        for x in range(len(points) - 1):
+            mask = self.span(points[x], points[x+1])
+            if (x % 2) == 0:
+                bits |= self.bits & mask
+            else:
+                bits |= other.bits & mask
+        return Genome(self.size, bits)
+    
+    def mutate(self, mask):
+        """
+        Inverts every cell set in mask.
+        """
+        self.bits ^= mask
+        return
+    
+    def to_text(self):
+        return bin(self.bits)[2:].zfill(self.size)[::-1][:self.size]
+    
+    def __eq__(self, other):
+        return self.size == other.size and self.bits == other.bits
+    
+    def __ne__(self, other):
+        return not self.__eq__(other)
+    
+    def __hash__(self):
+        return hash(self.bits)
+
+
+def genome_from_text(text):
+    """
+    Makes a Genome from its text form, one '0'/'1' character per cell.
+    """
+    text = str(text).strip()
+    if text == "":
+        return Genome(0)
+    return Genome(len(text), int(text[::-1], 2))
+
+
+_valid_cells = dict()
+_valid_masks = dict()
 
 
 ###############################################################################
@@ -49,19 +149,18 @@ class Chromosome:
         self.info = ""
         self.cid = ""
         self.accuracy = -1
+        self.predicted = None
         self.ann = dict()
         if filename != "":
             dom = xml.dom.minidom.parse(filename)
             chromo = dom.getElementsByTagName("chromosome")
-            self.data = list(str(chromo[0].getAttribute("data")).strip())
+            self.set_text(chromo[0].getAttribute("data"))
             self.fitness = float(chromo[0].getAttribute("fitness"))
             self.generation = int(float(chromo[0].getAttribute("generation")))
             if chromo[0].hasAttribute("info"):
                 self.info = str(chromo[0].getAttribute("info"))
         else:
-            self.data = list()
-            for x in range(self.width * self.height):
-                self.data.append("0")
+            self.genome = Genome(self.width * self.height)
             self.fitness = -1
             self.generation = -1
         self.check = None
@@ -90,33 +189,67 @@ class Chromosome:
                     self.fitness += self.ann[x]['acc'] - self.ann[x]['avg']
                 #mul = self.ann[x]['acc'] / self.ann[x]['avg']
                 #self.fitness = self.fitness * mul
-        self.fitness = self.fitness - (float(str("".join(self.data)).count("1"))/20.0)
+        self.fitness = self.fitness - (float(self.get_sensor_count())/20.0)
         return
     
     def set_check(self, chFunc):
         self.check = chFunc
         return
     
+    def get_text(self):
+        """
+        Returns the genome in the text form stored in the DB and the xml.
+        """
+        return self.genome.to_text()
+    
+    def set_text(self, text):
+        self.genome = genome_from_text(text)
+        return
+    
+    def get_valid_cells(self):
+        """
+        Returns the sorted list of cell numbers the check function allows a
+        sensor on, computed once per check function and layout size.
+        """
+        key = (self.check, self.width, self.height)
+        if key not in _valid_cells:
+            cells = list()
+            for num in range(self.width * self.height):
+                (x,y) = self.get_xy(num)
+                if self.check(x,y):
+                    cells.append(num)
+            _valid_cells[key] = cells
+        return _valid_cells[key]
+    
+    def get_valid_mask(self):
+        """
+        Returns the bitset of the cells in get_valid_cells().
+        """
+        key = (self.check, self.width, self.height)
+        if key not in _valid_masks:
+            mask = 0
+            for num in self.get_valid_cells():
+                mask |= 1 << num
+            _valid_masks[key] = mask
+        return _valid_masks[key]
+    
     def set_num(self, num):
         (x,y) = self.get_xy(int(float(num)))
         if self.check(x,y):
-            self.data[int(float(num))] = "1"
+            self.genome.set(int(float(num)))
             return True
         return False
     
     def set_xy(self, x, y):
         if self.check(x,y):
-            self.data[self.get_num(x, y)] = "1"
+            self.genome.set(self.get_num(x, y))
             return True
         return False
     
     def invert_num(self, num):
         (x,y) = self.get_xy(num)
         if self.check(x,y):
-            if self.data[num] == "0":
-                self.data[num] = "1"
-            else:
-                self.data[num] = "0"
+            self.genome.invert(num)
             return True
         return False
     
@@ -130,40 +263,42 @@ class Chromosome:
         return num
     
     def get_sensor_count(self):
-        count = 0
-        for x in range(len(self.data)):
-            if self.data[x] == "1":
-                count += 1
-        return count
+        return self.genome.count()
     
     def __add__(self, other):
         child = Chromosome("", self.width, self.height, self.config)
         child.set_check(self.check)
-        valid_child = False
-        while not valid_child:
-            points = list()
-            for x in range(self.config["crossover"]):
-                r = random.randint(1, len(self.data) - 2)
-                while r in points:
-                    r = random.randint(1, len(self.data) - 2)
-                points.append(r)
-            points.append(0)
-            points.append(len(self.data))
-            points.sort()
-            child.data = list()
-            for x in range(len(points) - 1):
-                if (x % 2) == 0:
-                    child.data = list(child.data + self.data[points[x]:points[x+1]])
-                else:
-                    child.data = list(child.data + other.data[points[x]:points[x+1]])
-            child.mutate()
-            if self.config["size_limit"] != None:
-                if str("".join(self.data)).count("1") <= self.config["size_limit"]:
-                    valid_child = True
-            else:
-                valid_child = True
+        size = self.genome.size
+        points = list()
+        for x in range(self.config["crossover"]):
+            r = random.randint(1, size - 2)
+            while r in points:
+                r = random.randint(1, size - 2)
+            points.append(r)
+        points.append(0)
+        points.append(size)
+        points.sort()
+        child.genome = self.genome.crossover(other.genome, points)
+        child.mutate()
+        child.repair()
         return child
     
+    def repair(self):
+        """
+        Makes the chromosome meet its constraints instead of rejecting it:
+        sensors on cells the check function does not allow are removed, then
+        randomly chosen sensors are removed until there are no more than
+        config["size_limit"].
+        """
+        self.genome.bits &= self.get_valid_mask()
+        limit = self.config.get("size_limit")
+        if limit != None:
+            cells = self.genome.cells()
+            if len(cells) > limit:
+                for num in random.sample(cells, len(cells) - limit):
+                    self.genome.invert(num)
+        return
+    
     def __cmp__(self, other):
         val = 0
         if self.fitness < other.fitness:
@@ -173,15 +308,33 @@ class Chromosome:
         return val
     
     def mutate(self):
-        for x in range(len(self.data)):
-            num = random.random()
-            if num < self.config["mutation"]:
-                self.invert_num(x)
+        """
+        Inverts each valid cell with probability config["mutation"].  The
+        gaps between inverted cells are drawn from the geometric
+        distribution, so this costs one draw per inverted cell rather than
+        one per cell.
+        """
+        rate = float(self.config["mutation"])
+        if rate <= 0.0:
+            return
+        if rate >= 1.0:
+            self.genome.mutate(self.get_valid_mask())
+            return
+        cells = self.get_valid_cells()
+        log_keep = math.log(1.0 - rate)
+        mask = 0
+        x = -1
+        while True:
+            x += 1 + int(math.log(1.0 - random.random()) / log_keep)
+            if x >= len(cells):
+                break
+            mask |= 1 << cells[x]
+        self.genome.mutate(mask)
         return
     
     def __str__(self):
         mystr = "<chromosome "
-        mystr += "data=\"%s\" " % str("".join(self.data))
+        mystr += "data=\"%s\" " % self.get_text()
         mystr += "fitness=\"%s\" " % str(self.fitness)
         mystr += "generation=\"%s\" " % str(self.generation)
         mystr += "info=\"%s\" " % str(self.info)
@@ -194,9 +347,16 @@ class Chromosome:
 #### Pollinator class
 ###############################################################################
 class Pollinator:
-    def __init__(self, options):
+    """
+    Breeds the generations of one manager.  Run from the command line it
+    breeds a single generation from the DB, held by WASP_Manager it keeps
+    the current generation in memory between results (see resume(),
+    record_result() and evolve()) and only writes to the DB.
+    """
+    def __init__(self, options, mydb=None):
         self.file_site = options.site
         self.manager_id = options.manager_id
+        self.island = int(float(options.island))
         self.nextgen = int(float(options.generation))
         self.seed = options.seed
         self.population = options.population
@@ -215,16 +375,147 @@ class Pollinator:
         else:
             self.config["grid_size"] = None
         self.greedy_search = options.greedy_search
+        self.registry = None
+        if options.registry != None:
+            self.registry = GenomeRegistry(options.registry)
+        self.surrogate_rate = None
+        if options.surrogate != None:
+            self.surrogate_rate = float(options.surrogate)
+        self.surrogate = None
+        self.ann_avg = dict()
         self.space = None
         self.max_width = 0
         self.max_height = 0
+        self.valid_cells = list()
+        self.cell_index = list()
         self.chromosomes = list()
         self.children = list()
         self.annotations = list()
-        self.mydb = pgdb.connect("", "", "", "", "wasp")
+        self.annotation_ids = dict()
+        self.members = dict()
+        self.jobs = dict()
+        self.scored = list()
+        self.steady_state = False
+        self.tournament = 0
+        self.inserted = 0
+        if mydb == None:
+            mydb = pgdb.connect("", "", "", "", "wasp")
+        self.mydb = mydb
         self.cr = self.mydb.cursor()
         return
     
+    def setup(self):
+        self.load_site()
+        if self.registry != None:
+            self.registry.load(self.cr)
+        self.annotation_ids = self.get_annotation_ids()
+        if self.surrogate_rate != None and self.surrogate == None:
+            if GA_Surrogate.numpy == None:
+                print "WARNING: numpy is required for --surrogate, not used"
+                self.surrogate_rate = None
+            else:
+                self.surrogate = GA_Surrogate.FitnessSurrogate(self.max_width,
+                                                               self.max_height)
+                self.train_surrogate()
+        return
+    
+    def train_surrogate(self):
+        """
+        Trains the surrogate on every result this manager has in the DB.
+        """
+        query = "SELECT c.genome, c.accuracy, c.cid, a.name, ca.tp, ca.fp, "
+        query += "ca.tn, ca.fn FROM (chromosome c INNER JOIN "
+        query += "(SELECT DISTINCT cid FROM chrom_gen WHERE mid=%s) cg " % self.manager_id
+        query += "ON c.cid=cg.cid) "
+        query += "LEFT JOIN (chrom_ann ca INNER JOIN annotation a ON ca.aid=a.aid) "
+        query += "ON ca.cid=c.cid AND ca.mid=%s " % self.manager_id
+        query += "WHERE c.accuracy<>-1 ORDER BY c.cid"
+        self.cr.execute(query)
+        chroms = dict()
+        order = list()
+        row = self.cr.fetchone()
+        while row != None:
+            cid = str(row[2]).strip()
+            if cid not in chroms:
+                chroms[cid] = Chromosome("", self.max_width, self.max_height)
+                chroms[cid].set_text(row[0])
+                chroms[cid].accuracy = float(row[1])
+                order.append(cid)
+            if row[3] != None:
+                name = str(row[3]).strip()
+                chroms[cid].ann[name] = dict()
+                chroms[cid].ann[name]['TP'] = float(row[4])
+                chroms[cid].ann[name]['FP'] = float(row[5])
+                chroms[cid].ann[name]['TN'] = float(row[6])
+                chroms[cid].ann[name]['FN'] = float(row[7])
+            row = self.cr.fetchone()
+        self.add_results([chroms[cid] for cid in order])
+        print "surrogate results:",self.surrogate.count
+        return
+    
+    def add_results(self, chroms):
+        """
+        Trains the surrogate on the results of the given chromosomes.
+        """
+        targets = list()
+        for chrom in chroms:
+            chrom.calculate_accuracies()
+            values = dict()
+            values[None] = chrom.accuracy
+            for name in chrom.ann.keys():
+                values[name] = chrom.ann[name]['acc']
+            targets.append(values)
+        self.surrogate.add([c.genome for c in chroms], targets)
+        return
+    
+    def screen_children(self, candidates, count):
+        """
+        Returns the count candidates with the best fitness predicted by the
+        surrogate, using the annotation averages of the generation they
+        were bred from.
+        """
+        predictions = self.surrogate.predict([c.genome for c in candidates])
+        ranked = list()
+        for x in range(len(candidates)):
+            trial = Chromosome("", self.max_width, self.max_height)
+            trial.genome = candidates[x].genome
+            trial.accuracy = predictions[x][None]
+            for name in self.ann_avg.keys():
+                trial.ann[name] = dict()
+                trial.ann[name]['acc'] = predictions[x].get(name, 0.0)
+                trial.ann[name]['avg'] = self.ann_avg[name]
+            trial.update_fitness()
+            ranked.append((trial.fitness, x))
+        ranked.sort(reverse=True)
+        kept = list()
+        for (fitness, x) in ranked[:count]:
+            candidates[x].predicted = predictions[x][None]
+            kept.append(candidates[x])
+        return kept
+    
+    def log_surrogate(self):
+        """
+        Appends the error of the accuracies the surrogate predicted for the
+        chromosomes just scored to surrogate.log.
+        """
+        predicted = list()
+        actual = list()
+        for chrom in self.chromosomes:
+            if chrom.predicted != None:
+                predicted.append(chrom.predicted)
+                actual.append(chrom.accuracy)
+        if len(actual) == 0:
+            return
+        (mae, rmse, corr) = GA_Surrogate.prediction_error(predicted, actual)
+        line = "%3s\t%s\t%s\tn=%d\tmae=%.3f\trmse=%.3f\tr=%.3f" % (
+            str(self.nextgen - 1), self.manager_id, str(self.island),
+            len(actual), mae, rmse, corr)
+        print "surrogate:",line
+        mylog = open("surrogate.log", 'a')
+        mylog.write("%s\n" % line)
+        mylog.close()
+        return
+    
     def load_site(self):
         dom = xml.dom.minidom.parse(self.file_site)
         site = dom.getElementsByTagName("site")
@@ -281,6 +572,27 @@ class Pollinator:
                             self.space[px][py] = 'x'
                         py += 1
                     px += 1
+        self.index_cells()
+        return
+    
+    def index_cells(self):
+        """
+        Builds self.valid_cells, the cell numbers a sensor may be placed on
+        (column by column, in the order the loops over the site visit them),
+        and self.cell_index, the position of each cell number in
+        self.valid_cells or -1.
+        """
+        self.valid_cells = list()
+        self.cell_index = [-1] * (self.max_width * self.max_height)
+        for x in range(self.max_width):
+            for y in range(self.max_height):
+                if self.space[x][y] not in ['x','w','l']:
+                    num = x + (y * self.max_width)
+                    self.cell_index[num] = len(self.valid_cells)
+                    self.valid_cells.append(num)
+        # Chromosomes checked against this site can reuse the index
+        key = (self.valid_sensor_location, self.max_width, self.max_height)
+        _valid_cells[key] = sorted(self.valid_cells)
         return
     
     def valid_sensor_location(self, x, y):
@@ -291,26 +603,23 @@ class Pollinator:
         return False
     
     def build_seed(self, count):
-        spots = range(self.max_width * self.max_height)
-        if count > len(spots):
-            count = len(spots)
+        if count > len(self.valid_cells):
+            count = len(self.valid_cells)
         chrom = Chromosome("", self.max_width, self.max_height)
         chrom.set_check(self.valid_sensor_location)
-        for x in range(count):
-            num = random.randint(0, len(spots) - 1)
-            while not chrom.set_num(spots[num]):
-                del spots[num]
-                num = random.randint(0, len(spots) - 1)
+        for num in random.sample(self.valid_cells, count):
+            chrom.genome.set(num)
         return chrom
     
     def build_grid(self, xOff, yOff):
         chrom = Chromosome("", self.max_width, self.max_height)
         chrom.set_check(self.valid_sensor_location)
-        for x in range(self.max_width):
-            if (x % self.config["grid_size"]) == 0:
-                for y in range(self.max_height):
-                    if (y % self.config["grid_size"]) == 0:
-                        chrom.set_xy(x + xOff, y + yOff)
+        size = self.config["grid_size"]
+        for num in self.valid_cells:
+            (x,y) = chrom.get_xy(num)
+            if x >= xOff and y >= yOff:
+                if ((x - xOff) % size) == 0 and ((y - yOff) % size) == 0:
+                    chrom.genome.set(num)
         #self.print_layout(chrom)
         return chrom
     
@@ -319,8 +628,8 @@ class Pollinator:
             out = ""
             for x in range(self.max_width):
                 num = chrom.get_num(x,y)
-                if chrom.data[num] == "1":
-                    out += "%2s" % chrom.data[num]
+                if chrom.genome.get(num):
+                    out += "%2s" % "1"
                 else:
                     out += "%2s" % self.space[x][y]
             print out
@@ -328,73 +637,142 @@ class Pollinator:
         return
     
     def load_chromosomes(self):
-        ann = dict()
-        annIds = self.get_annotation_ids()
+        self.read_generation(self.nextgen - 1, True)
+        print "chromosomes:",len(self.chromosomes)
+        self.score_chromosomes()
+        return
+    
+    def read_generation(self, gid, evaluated):
+        """
+        Reads the chromosomes of generation gid for this manager, with their
+        annotation results, into self.chromosomes.  Returns those still
+        waiting for a result.
+        
+        gid - generation to read.
+        evaluated - only read the chromosomes that have a result, without
+                    their genome in greedy search.
+        """
+        return self.read_chromosomes("g.gid=%s" % str(gid), evaluated)
+    
+    def read_chromosomes(self, condition, evaluated):
+        """
+        Same as read_generation() for the chrom_gen rows of this manager
+        matching the SQL condition.
+        """
+        waiting = list()
         query = "SELECT c.genome, "
         if self.greedy_search:
             query += "cg.final_fitness, "
         else:
             query += "c.accuracy, "
-        query += "c.cid "
-        query += "FROM (chromosome c INNER JOIN chrom_gen cg ON c.cid=cg.cid) "
-        query += "INNER JOIN generation g ON cg.gid=g.gid "
-        if self.greedy_search:
-            query += "WHERE cg.final_fitness IS NOT NULL AND "
+        query += "c.cid, a.name, ca.tp, ca.fp, ca.tn, ca.fn, cg.gid, cg.predicted "
+        query += "FROM ((chromosome c INNER JOIN chrom_gen cg ON c.cid=cg.cid) "
+        query += "INNER JOIN generation g ON cg.gid=g.gid) "
+        query += "LEFT JOIN (chrom_ann ca INNER JOIN annotation a ON ca.aid=a.aid) "
+        query += "ON ca.cid=c.cid AND ca.mid=cg.mid "
+        if evaluated:
+            if self.greedy_search:
+                query += "WHERE cg.final_fitness IS NOT NULL AND "
+            else:
+                query += "WHERE c.accuracy<>-1 AND "
         else:
-            query += "WHERE c.accuracy<>-1 AND "
-        query += "g.gid=%s AND " % str(self.nextgen - 1)
-        query += "cg.mid=%s" % self.manager_id
+            query += "WHERE "
+        query += "%s AND " % condition
+        query += "cg.mid=%s AND cg.island=%s " % (self.manager_id,
+                                                  str(self.island))
+        query += "ORDER BY c.cid"
         self.cr.execute(query)
+        annRows = dict()
         row = self.cr.fetchone()
         while row != None:
-            self.chromosomes.append(Chromosome("", self.max_width,
-                                               self.max_height, self.config))
-            if not self.greedy_search:
-                self.chromosomes[-1].data = list(str(row[0]).strip())
-            self.chromosomes[-1].accuracy = float(row[1])
-            self.chromosomes[-1].cid = str(row[2]).strip()
-            self.chromosomes[-1].generation = self.nextgen - 1
+            cid = str(row[2]).strip()
+            if cid not in annRows:
+                annRows[cid] = list()
+                self.chromosomes.append(Chromosome("", self.max_width,
+                                                   self.max_height, self.config))
+                if not (self.greedy_search and evaluated):
+                    self.chromosomes[-1].set_text(row[0])
+                    if self.registry != None:
+                        self.registry.add(self.chromosomes[-1].get_text())
+                if row[1] == None or (not self.greedy_search and float(row[1]) == -1):
+                    waiting.append(self.chromosomes[-1])
+                else:
+                    self.chromosomes[-1].accuracy = float(row[1])
+                self.chromosomes[-1].cid = cid
+                self.chromosomes[-1].generation = int(row[8])
+                if row[9] != None:
+                    self.chromosomes[-1].predicted = float(row[9])
+            if row[3] != None:
+                annRows[cid].append(row[3:8])
             row = self.cr.fetchone()
-        print "chromosomes:",len(self.chromosomes)
         for x in range(len(self.chromosomes)):
             self.chromosomes[x].set_check(self.valid_sensor_location)
-            query = "SELECT a.name, ca.tp, ca.fp, ca.tn, ca.fn "
-            query += "FROM (chromosome c INNER JOIN chrom_ann ca ON c.cid=ca.cid) "
-            query += "INNER JOIN annotation a ON ca.aid=a.aid "
-            query += "WHERE c.cid='%s' AND ca.mid='%s'" % (self.chromosomes[x].cid, self.manager_id)
-            self.cr.execute(query)
-            row = self.cr.fetchone()
-            while row != None:
-                name = str(row[0]).strip()
-                if name not in self.annotations:
-                    self.annotations.append(name)
-                if name not in ann:
-                    ann[name] = 0.0
-                self.chromosomes[x].ann[name] = dict()
-                self.chromosomes[x].ann[name]['TP'] = float(row[1])
-                self.chromosomes[x].ann[name]['FP'] = float(row[2])
-                self.chromosomes[x].ann[name]['TN'] = float(row[3])
-                self.chromosomes[x].ann[name]['FN'] = float(row[4])
-                row = self.cr.fetchone()
+            for row in annRows[self.chromosomes[x].cid]:
+                self.set_annotation(self.chromosomes[x], row)
+        return waiting
+    
+    def set_annotation(self, chrom, row):
+        """
+        Sets one annotation result of chrom from row (name, TP, FP, TN, FN).
+        """
+        name = str(row[0]).strip()
+        if name not in self.annotations:
+            self.annotations.append(name)
+        chrom.ann[name] = dict()
+        chrom.ann[name]['TP'] = float(row[1])
+        chrom.ann[name]['FP'] = float(row[2])
+        chrom.ann[name]['TN'] = float(row[3])
+        chrom.ann[name]['FN'] = float(row[4])
+        return
+    
+    def score_chromosomes(self):
+        """
+        Works out the fitness of self.chromosomes from their annotation
+        results, storing it as the final fitness of their generation.
+        """
+        self.calculate_fitness()
+        if self.surrogate != None:
+            self.log_surrogate()
+        gid = str(self.nextgen - 1)
+        if not self.greedy_search:
+            values = list()
+            for x in range(len(self.chromosomes)):
+                values.append("(%s, %f)" % (self.chromosomes[x].cid,
+                                            self.chromosomes[x].fitness))
+            if len(values) > 0:
+                query = "UPDATE chrom_gen SET final_fitness=v.fitness FROM "
+                query += "(VALUES %s) AS v(cid, fitness) " % ",".join(values)
+                query += "WHERE chrom_gen.cid=v.cid AND "
+                query += "chrom_gen.gid=%s AND chrom_gen.mid=%s " % (gid,
+                                                                     self.manager_id)
+                query += "AND chrom_gen.island=%s" % str(self.island)
+                self.cr.execute(query)
+        self.mydb.commit()
+        return
+    
+    def calculate_fitness(self):
+        """
+        Works out the fitness of self.chromosomes, each annotation accuracy
+        counting against its average over them all.
+        """
+        ann = dict()
+        for x in range(len(self.chromosomes)):
             self.chromosomes[x].calculate_accuracies()
             for y in self.chromosomes[x].ann.keys():
-                ann[y] += self.chromosomes[x].ann[name]['acc']
+                if y not in ann:
+                    ann[y] = 0.0
+                ann[y] += self.chromosomes[x].ann[y]['acc']
         
-        gid = str(self.nextgen - 1)
         avg = dict()
         for y in ann.keys():
             avg[y] = ann[y] / float(len(self.chromosomes))
+        self.ann_avg = avg
         if not self.greedy_search:
             for x in range(len(self.chromosomes)):
                 for y in avg.keys():
                     if y in self.chromosomes[x].ann:
                         self.chromosomes[x].ann[y]['avg'] = avg[y]
                 self.chromosomes[x].update_fitness()
-                query = "UPDATE chrom_gen SET final_fitness=%f " % self.chromosomes[x].fitness
-                query += "WHERE cid=%s AND gid=%s AND mid=%s" % (self.chromosomes[x].cid,
-                                                                 gid, self.manager_id)
-                self.cr.execute(query)
-        self.mydb.commit()
         return
     
     def get_annotation_ids(self):
@@ -427,21 +805,29 @@ class Pollinator:
                         top[aName].append(x)
         return top
     
-    def breed_children(self):
+    def make_generation(self, gid):
+        """
+        Makes sure generation gid is in the generation table and returns it.
+        """
         r = None
         while r == None:
-            query = "SELECT gid FROM generation WHERE gid=%s" % str(self.nextgen)
+            query = "SELECT gid FROM generation WHERE gid=%s" % str(gid)
             self.cr.execute(query)
             r = self.cr.fetchone()
             if r == None:
                 query = "INSERT INTO generation (gid) VALUES (nextval('generation_gid_seq'::regclass));"
                 self.cr.execute(query)
                 self.mydb.commit()
-        gid = str(r[0]).strip()
+        return str(r[0]).strip()
+    
+    def breed_children(self):
+        gid = self.make_generation(self.nextgen)
+        if self.registry != None:
+            self.registry.catch_up(self.cr)
         
         if self.greedy_search:
             bestAnn = self.get_top_annotation_performers()
-            myCount = 0
+            tops = list()
             for ann in self.annotations:
                 mylog = open("repo.log",'a')
                 mylog.write("%3s\t%6s  %3s\t" % (str(self.nextgen-1),ann,str(len(bestAnn[ann]))))
@@ -450,64 +836,58 @@ class Pollinator:
                 mylog.write("\n")
                 mylog.close()
                 for z in bestAnn[ann][:1]:
-                    query = "SELECT genome FROM chromosome WHERE cid='%s'" % self.chromosomes[z].cid
-                    self.cr.execute(query)
-                    row = self.cr.fetchone()
-                    if row != None:
-                        self.chromosomes[z].data = list(str(row[0]).strip())
-                        myCount += 1
+                    tops.append(z)
+            # Held by WASP_Manager the genomes are already in memory
+            genomes = self.load_genomes([self.chromosomes[z].cid for z in tops
+                                         if self.chromosomes[z].genome.count() == 0])
+            myCount = 0
+            for ann in self.annotations:
+                for z in bestAnn[ann][:1]:
+                    if self.chromosomes[z].cid in genomes:
+                        self.chromosomes[z].set_text(genomes[self.chromosomes[z].cid])
+                    myCount += 1
             print "  Children multiplier:",myCount
             myCount = 0
             myTotal = 0
+            seen = set()
             for x in range(self.max_width):
                 myTotal += myCount
                 print "x=%3s\tchildren=%6s \ttotal=%s" % (str(x),str(myCount),str(myTotal))
                 myCount = 0
+                column = list()
                 for y in range(self.max_height):
-                    if not self.valid_sensor_location(x, y):
+                    num = x + (y * self.max_width)
+                    if self.cell_index[num] < 0:
                         continue
                     for ann in self.annotations:
                         for z in bestAnn[ann][:1]:
-                            num = self.chromosomes[z].get_num(x, y)
-                            if self.chromosomes[z].data[num] == "0":
+                            if not self.chromosomes[z].genome.get(num):
                                 myCount += 1
-                                chrom = Chromosome("", self.max_width, self.max_height)
-                                chrom.set_check(self.valid_sensor_location)
-                                chrom.data = copy.deepcopy(self.chromosomes[z].data)
-                                chrom.set_xy(x, y)
-                                query = "SELECT cid FROM chromosome WHERE "
-                                query += "genome='%s'" % str("".join(chrom.data))
-                                self.cr.execute(query)
-                                r = self.cr.fetchone()
-                                if r == None:
-                                    try:
-                                        query = "INSERT INTO chromosome (genome) VALUES "
-                                        query += "('%s')" % ("".join(chrom.data))
-                                        self.cr.execute(query)
-                                    except pgdb.DatabaseError:
-                                        r = None
-                                        self.cr = self.mydb.cursor()
-                                    query = "SELECT cid FROM chromosome "
-                                    query += "WHERE genome='%s'" % "".join(chrom.data)
-                                    self.cr.execute(query)
-                                    r = self.cr.fetchone()
-                                chrom.cid = str(r[0]).strip()
-                                query = "SELECT cid FROM chrom_gen WHERE "
-                                query += "cid=%s AND gid=%s AND mid=%s" % (chrom.cid, gid, self.manager_id)
-                                self.cr.execute(query)
-                                if self.cr.rowcount < 1:
-                                    query = "INSERT INTO chrom_gen (cid, gid, mid) VALUES "
-                                    query += "(%s, %s, %s)" % (str(chrom.cid), gid, self.manager_id)
-                                    self.cr.execute(query)
-                self.mydb.commit()
+                                child = Chromosome("", self.max_width,
+                                                   self.max_height, self.config)
+                                child.set_check(self.valid_sensor_location)
+                                child.genome = self.chromosomes[z].genome.copy()
+                                child.genome.set(num)
+                                if child.genome not in seen:
+                                    seen.add(child.genome)
+                                    column.append(child)
+                texts = [c.get_text() for c in column]
+                cids = self.store_genomes(texts)
+                self.store_chrom_gen([cids[t] for t in texts], gid)
+                for c in column:
+                    c.cid = cids[c.get_text()]
+                    self.children.append(c)
         else:
             self.chromosomes.sort(reverse=True)
             survivers = int(len(self.chromosomes) * self.config["survival"])
             for x in range(survivers):
+                # A survivor's prediction was scored with its own generation
+                self.chromosomes[x].predicted = None
                 self.children.append(self.chromosomes[x])
             breeders = int(len(self.chromosomes) * self.config["reproduction"])
             mates = int((len(self.chromosomes) - len(self.children)) / breeders)
             spares = len(self.chromosomes) - (mates * breeders)
+            parents = list()
             for x in range(breeders):
                 turns = mates
                 if x > breeders/2:
@@ -517,25 +897,39 @@ class Pollinator:
                 if x < spares:
                     turns += 1
                 for y in range(turns):
-                    is_valid = False
-                    while not is_valid:
-                        nchild = self.chromosomes[x] + self.chromosomes[random.randint(0,breeders)]
-                        query = "SELECT count(*) FROM chromosome WHERE "
-                        query += "genome='%s'" % str("".join(nchild.data))
-                        self.cr.execute(query)
-                        r = self.cr.fetchone()
-                        if str(r[0]) == "0":
-                            is_valid = True
-                            query = "INSERT INTO chromosome (genome) VALUES "
-                            query += "('%s')" % ("".join(nchild.data))
-                            self.cr.execute(query)
-                            query = "SELECT cid FROM chromosome "
-                            query += "WHERE genome='%s'" % "".join(nchild.data)
-                            self.cr.execute(query)
-                            r = self.cr.fetchone()
-                            nchild.cid = str(r[0]).strip()
-                            self.children.append(nchild)
-            self.mydb.commit()
+                    parents.append(x)
+            
+            # Children must be new genomes, so breed every slot, drop those
+            # already seen here or in the DB and breed those slots again.
+            seen = set()
+            for chrom in self.children:
+                seen.add(chrom.genome)
+            # With a trained surrogate, breed more candidates than there are
+            # slots and keep those with the best predicted fitness.
+            slots = len(parents)
+            screen = self.surrogate != None and self.surrogate.is_ready()
+            if screen:
+                slots = int(math.ceil(len(parents) / self.surrogate_rate))
+            bred = dict()
+            pending = range(slots)
+            while len(pending) > 0:
+                batch = dict()
+                for slot in pending:
+                    parent = parents[slot % len(parents)]
+                    nchild = self.chromosomes[parent] + self.chromosomes[random.randint(0,breeders)]
+                    if nchild.genome not in seen:
+                        seen.add(nchild.genome)
+                        batch[nchild.get_text()] = (slot, nchild)
+                found = self.find_stored(batch.keys())
+                for text in batch.keys():
+                    if text not in found:
+                        (slot, nchild) = batch[text]
+                        bred[slot] = nchild
+                pending = [slot for slot in pending if slot not in bred]
+            candidates = [bred[slot] for slot in range(slots)]
+            if screen:
+                candidates = self.screen_children(candidates, len(parents))
+            self.children.extend(candidates)
             
             if self.population != None:
                 while len(self.children) > float(self.population):
@@ -544,76 +938,438 @@ class Pollinator:
                 while len(self.children) > len(self.chromosomes):
                     self.children.pop()
             
-            for x in range(len(self.children)):
-                query = "INSERT INTO chrom_gen (cid, gid, mid) VALUES "
-                query += "(%s, %s, %s)" % (str(self.children[x].cid), gid, self.manager_id)
-                self.cr.execute(query)
+            texts = list()
+            for x in range(survivers, len(self.children)):
+                texts.append(self.children[x].get_text())
+            cids = self.store_genomes(texts)
+            for x in range(survivers, len(self.children)):
+                self.children[x].cid = cids[self.children[x].get_text()]
+            predicted = dict()
+            for c in self.children:
+                if c.predicted != None:
+                    predicted[c.cid] = c.predicted
+            self.store_chrom_gen([c.cid for c in self.children], gid,
+                                 predicted)
         self.mydb.commit()
         return
     
-    def insert_chromosome(self, chromo, gid):
-        query = "SELECT cid FROM chromosome WHERE genome='%s'" % "".join(chromo.data)
-        self.cr.execute(query)
-        if self.cr.rowcount < 1:
+    def load_genomes(self, cids):
+        """
+        Returns a dict of genome text by cid for the given cids.
+        """
+        genomes = dict()
+        if len(cids) > 0:
+            query = "SELECT cid, genome FROM chromosome "
+            query += "WHERE cid IN (%s)" % ",".join([str(c) for c in cids])
+            self.cr.execute(query)
+            row = self.cr.fetchone()
+            while row != None:
+                genomes[str(row[0]).strip()] = str(row[1]).strip()
+                row = self.cr.fetchone()
+        return genomes
+    
+    def find_genomes(self, texts):
+        """
+        Returns a dict of cid by genome text for those of the given genome
+        texts already in the chromosome table.
+        """
+        cids = dict()
+        if len(texts) > 0:
+            query = "SELECT genome, cid FROM chromosome WHERE genome IN "
+            query += "(%s)" % ",".join(["'%s'" % t for t in texts])
+            self.cr.execute(query)
+            row = self.cr.fetchone()
+            while row != None:
+                cids[str(row[0]).strip()] = str(row[1]).strip()
+                row = self.cr.fetchone()
+        return cids
+    
+    def find_stored(self, texts):
+        """
+        Returns the set of the given genome texts that are in the chromosome
+        table.  The registry settles most of them, only the rest are looked
+        up in the DB.
+        """
+        stored = set()
+        lookup = list()
+        for t in texts:
+            if self.registry == None:
+                lookup.append(t)
+            elif self.registry.is_known(t):
+                stored.add(t)
+            elif self.registry.may_contain(t):
+                lookup.append(t)
+        stored.update(self.find_genomes(lookup).keys())
+        return stored
+    
+    def store_genomes(self, texts):
+        """
+        Returns a dict of cid by genome text for the given genome texts,
+        adding those not yet in the chromosome table with one INSERT.  The
+        caller commits.
+        """
+        lookup = set(texts)
+        if self.registry != None:
+            lookup = [t for t in lookup if self.registry.may_contain(t)]
+        cids = self.find_genomes(list(lookup))
+        new = list()
+        for t in texts:
+            if t not in cids:
+                cids[t] = None
+                new.append(t)
+        if len(new) > 0:
             query = "INSERT INTO chromosome (genome) VALUES "
-            query += "('%s')" % ("".join(chromo.data))
+            query += ",".join(["('%s')" % t for t in new])
+            query += " ON CONFLICT (genome) DO NOTHING RETURNING genome, cid"
             self.cr.execute(query)
-            self.mydb.commit()
-            query = "SELECT cid FROM chromosome WHERE genome='%s'" % "".join(chromo.data)
+            row = self.cr.fetchone()
+            while row != None:
+                cids[str(row[0]).strip()] = str(row[1]).strip()
+                row = self.cr.fetchone()
+            # Genomes another manager added since find_genomes()
+            missing = [t for t in new if cids[t] == None]
+            cids.update(self.find_genomes(missing))
+        if self.registry != None:
+            for t in cids.keys():
+                self.registry.add(t)
+        return cids
+    
+    def store_chrom_gen(self, cids, gid, predicted=None):
+        """
+        Puts the given cids in generation gid for this manager and island
+        with one INSERT, skipping rows that are already there.  The caller
+        commits.
+        
+        predicted - optional dict of the accuracy the surrogate predicted
+                    by cid.
+        """
+        if predicted == None:
+            predicted = dict()
+        rows = list()
+        seen = set()
+        for cid in cids:
+            if cid not in seen:
+                seen.add(cid)
+                value = "NULL"
+                if cid in predicted:
+                    value = "%.4f" % predicted[cid]
+                rows.append("(%s, %s, %s, %s, %s)" % (str(cid), str(gid),
+                                                      self.manager_id,
+                                                      str(self.island), value))
+        if len(rows) > 0:
+            query = "INSERT INTO chrom_gen (cid, gid, mid, island, predicted) VALUES "
+            query += ",".join(rows)
+            query += " ON CONFLICT DO NOTHING"
             self.cr.execute(query)
-        row = self.cr.fetchone()
-        cid = str(row[0]).strip()
-        query = "SELECT cid FROM chrom_gen WHERE "
-        query += "cid=%s AND gid=%s AND mid=%s" % (cid, str(gid), self.manager_id)
+        return
+    
+    def seed_population(self, count):
+        """
+        Stores a new seed population of count chromosomes (or the grid or
+        greedy search layouts) as generation 1 and puts it in self.children.
+        """
+        self.nextgen = 1
+        gid = self.make_generation(self.nextgen)
+        
+        chromos = list()
+        if self.greedy_search:
+            for num in self.valid_cells:
+                chromo = Chromosome("", self.max_width, self.max_height)
+                chromo.set_check(self.valid_sensor_location)
+                chromo.genome.set(num)
+                chromos.append(chromo)
+        elif self.config["grid_size"] != None:
+            for xOff in range(self.config["grid_size"]):
+                for yOff in range(self.config["grid_size"]):
+                    chromos.append(self.build_grid(xOff, yOff))
+        else:
+            for x in range(count):
+                chromos.append(self.build_seed(self.config["seed_size"]))
+        seen = set()
+        for chromo in chromos:
+            if chromo.genome not in seen:
+                seen.add(chromo.genome)
+                chromo.config = self.config
+                self.children.append(chromo)
+        texts = [c.get_text() for c in self.children]
+        cids = self.store_genomes(texts)
+        for c in self.children:
+            c.cid = cids[c.get_text()]
+        self.store_chrom_gen([c.cid for c in self.children], gid)
+        self.mydb.commit()
+        return
+    
+    def start_generation(self):
+        """
+        Makes the children just bred the current generation, waiting for the
+        results of those not evaluated yet.
+        """
+        self.chromosomes = self.children
+        self.children = list()
+        self.members = dict()
+        self.jobs = dict()
+        for chrom in self.chromosomes:
+            chrom.generation = self.nextgen
+            self.members[chrom.get_text()] = chrom
+            if chrom.accuracy == -1:
+                self.jobs[chrom.get_text()] = chrom
+            else:
+                chrom.predicted = None
+        self.nextgen += 1
+        return
+    
+    def resume(self, gid):
+        """
+        Makes generation gid, as it was left in the DB, the current one.
+        """
+        self.nextgen = int(gid) + 1
+        self.chromosomes = list()
+        self.index_members(self.read_generation(gid, False))
+        return
+    
+    def index_members(self, waiting):
+        """
+        Indexes self.chromosomes by genome text, those in waiting as still
+        waiting for a result.
+        """
+        self.members = dict()
+        self.jobs = dict()
+        for chrom in self.chromosomes:
+            self.members[chrom.get_text()] = chrom
+        for chrom in waiting:
+            self.jobs[chrom.get_text()] = chrom
+        return
+    
+    def get_waiting(self):
+        """
+        Returns the genome texts of the current generation still waiting for
+        a result.
+        """
+        return self.jobs.keys()
+    
+    def record_result(self, text, fitness, info):
+        """
+        Records the result of a job for the current generation.  Returns the
+        cid of the chromosome, or None if the genome is not in the current
+        generation.
+        
+        text - genome text of the chromosome evaluated.
+        fitness - accuracy the worker found.
+        info - annotation results as name:TP:FP:TN:FN,...
+        """
+        if text not in self.members:
+            return None
+        cid = self.members[text].cid
+        if text in self.jobs:
+            chrom = self.jobs.pop(text)
+            chrom.accuracy = float(fitness)
+            for line in str(info).split(','):
+                if line != "":
+                    self.set_annotation(chrom, line.split(':'))
+            if self.surrogate != None:
+                self.add_results([chrom])
+            if self.steady_state:
+                self.admit(chrom)
+        return cid
+    
+    def evolve(self):
+        """
+        Scores the evaluated chromosomes of the current generation and makes
+        the generation bred from them the current one.
+        """
+        self.score_generation()
+        self.breed_generation()
+        return
+    
+    def score_generation(self):
+        self.chromosomes = [c for c in self.chromosomes
+                            if c.get_text() not in self.jobs]
+        # Breed in the order load_chromosomes() would read them
+        self.chromosomes.sort(key=lambda c: int(c.cid))
+        print "chromosomes:",len(self.chromosomes)
+        self.score_chromosomes()
+        self.scored = self.chromosomes
+        return
+    
+    def breed_generation(self):
+        self.breed_children()
+        self.start_generation()
+        if self.registry != None:
+            self.registry.save()
+        return
+    
+    def get_migrants(self, count):
+        """
+        Returns copies of the count fittest chromosomes of the last
+        generation scored, to move to another island.
+        """
+        best = sorted(self.scored, reverse=True)[:count]
+        migrants = list()
+        for chrom in best:
+            migrant = Chromosome("", self.max_width, self.max_height)
+            migrant.genome = chrom.genome.copy()
+            migrant.accuracy = chrom.accuracy
+            migrant.fitness = chrom.fitness
+            migrant.cid = chrom.cid
+            for name in chrom.ann.keys():
+                migrant.ann[name] = dict(chrom.ann[name])
+            migrants.append(migrant)
+        return migrants
+    
+    def receive_migrants(self, migrants):
+        """
+        Replaces the least fit chromosomes of the generation just scored
+        with migrants from other islands, leaving out genomes already here.
+        """
+        texts = set([c.get_text() for c in self.chromosomes])
+        arrivals = list()
+        for migrant in migrants:
+            if migrant.get_text() not in texts:
+                texts.add(migrant.get_text())
+                migrant.config = self.config
+                migrant.set_check(self.valid_sensor_location)
+                migrant.generation = self.nextgen - 1
+                arrivals.append(migrant)
+        arrivals = arrivals[:len(self.chromosomes) - 1]
+        if len(arrivals) == 0:
+            return
+        self.chromosomes.sort(reverse=True)
+        self.chromosomes[len(self.chromosomes) - len(arrivals):] = arrivals
+        for migrant in arrivals:
+            for name in migrant.ann.keys():
+                if name not in self.annotations:
+                    self.annotations.append(name)
+        self.calculate_fitness()
+        return
+    
+    def start_steady_state(self, tournament):
+        """
+        Makes the evaluated chromosomes of the current generation the pool
+        of a steady state GA.  From then on each result recorded goes into
+        the pool straight away and breed_one() breeds children one at a
+        time, with no generation barrier.  The chrom_gen rows of the children
+        are put in pseudo generations of self.population rows each.
+        
+        tournament - number of chromosomes in each selection and replacement
+                     tournament.
+        """
+        self.steady_state = True
+        self.tournament = int(float(tournament))
+        query = "SELECT count(*) FROM chrom_gen WHERE "
+        query += "mid=%s AND island=%s" % (self.manager_id, str(self.island))
         self.cr.execute(query)
-        if self.cr.rowcount < 1:
-            query = "INSERT INTO chrom_gen (cid, gid, mid) VALUES "
-            query += "(%s, %s, %s)" % (str(cid), str(gid), self.manager_id)
-            self.cr.execute(query)
-            self.mydb.commit()
+        self.inserted = int(float(str(self.cr.fetchone()[0]).strip()))
+        self.chromosomes = [c for c in self.chromosomes
+                            if c.get_text() not in self.jobs]
+        if len(self.chromosomes) > 0:
+            self.calculate_fitness()
+        return
+    
+    def resume_steady_state(self, gid):
+        """
+        Reads back the pool of a steady state GA left in the DB, as the last
+        self.population chromosomes of this manager to get a result, along
+        with those still waiting for one.
+        
+        gid - latest (pseudo) generation of this manager.
+        """
+        self.nextgen = int(gid) + 1
+        self.chromosomes = list()
+        query = "SELECT cg2.seq FROM chrom_gen cg2 INNER JOIN chromosome c2 "
+        query += "ON c2.cid=cg2.cid WHERE c2.accuracy<>-1 AND "
+        query += "cg2.mid=%s AND " % self.manager_id
+        query += "cg2.island=%s ORDER BY cg2.seq DESC " % str(self.island)
+        query += "LIMIT %s" % str(self.population)
+        self.index_members(self.read_chromosomes("(c.accuracy=-1 OR cg.seq IN "
+                                                 "(%s))" % query, False))
+        return
+    
+    def get_next_gid(self):
+        """
+        Returns the pseudo generation the next child of a steady state GA
+        goes in.
+        """
+        return 1 + (self.inserted // int(float(self.population)))
+    
+    def select_parent(self):
+        """
+        Returns the fittest of self.tournament chromosomes picked at random
+        from the pool.
+        """
+        count = min(self.tournament, len(self.chromosomes))
+        picks = random.sample(range(len(self.chromosomes)), count)
+        best = picks[0]
+        for x in picks:
+            if self.chromosomes[x].fitness > self.chromosomes[best].fitness:
+                best = x
+        return self.chromosomes[best]
+    
+    def breed_one(self):
+        """
+        Breeds one new child from two parents selected from the pool and
+        stores it as the next chrom_gen row of this manager, waiting for its
+        result.  Returns the genome text of the child.
+        """
+        if self.registry != None:
+            self.registry.catch_up(self.cr)
+        while True:
+            child = self.select_parent() + self.select_parent()
+            text = child.get_text()
+            if text not in self.members and len(self.find_stored([text])) == 0:
+                break
+        gid = self.get_next_gid()
+        if gid >= self.nextgen:
+            self.make_generation(gid)
+            self.nextgen = gid + 1
+            if self.registry != None:
+                self.registry.save()
+        child.cid = self.store_genomes([text])[text]
+        child.generation = gid
+        self.store_chrom_gen([child.cid], gid)
+        self.mydb.commit()
+        self.inserted += 1
+        self.members[text] = child
+        self.jobs[text] = child
+        return text
+    
+    def admit(self, chrom):
+        """
+        Puts a chromosome that just got its result in the steady state pool
+        and stores its fitness as its final fitness.  Once the pool is over
+        the population size the least fit of a tournament is dropped from
+        it.  The caller commits.
+        """
+        self.chromosomes.append(chrom)
+        self.calculate_fitness()
+        query = "UPDATE chrom_gen SET final_fitness=%f " % chrom.fitness
+        query += "WHERE cid=%s AND gid=%s AND mid=%s " % (chrom.cid,
+                                                          str(chrom.generation),
+                                                          self.manager_id)
+        query += "AND island=%s" % str(self.island)
+        self.cr.execute(query)
+        if len(self.chromosomes) > int(float(self.population)):
+            count = min(self.tournament, len(self.chromosomes))
+            picks = random.sample(range(len(self.chromosomes)), count)
+            worst = picks[0]
+            for x in picks:
+                if self.chromosomes[x].fitness < self.chromosomes[worst].fitness:
+                    worst = x
+            loser = self.chromosomes.pop(worst)
+            del self.members[loser.get_text()]
         return
     
     def run(self):
-        self.load_site()
+        self.setup()
         if self.seed == None:
             self.load_chromosomes()
             self.breed_children()
         else:
-            query = "SELECT gid FROM generation WHERE gid=1"
-            self.cr.execute(query)
-            r = self.cr.fetchone()
-            if r == None:
-                query = "INSERT INTO generation (gid) VALUES (nextval('generation_gid_seq'::regclass))"
-                self.cr.execute(query)
-                self.mydb.commit()
-                query = "SELECT gid FROM generation WHERE gid=1"
-                self.cr.execute(query)
-                r = self.cr.fetchone()
-            gid = str(r[0]).strip()
-            
-            if self.greedy_search:
-                for x in range(self.max_width):
-                    for y in range(self.max_height):
-                        if self.valid_sensor_location(x, y):
-                            chromo = Chromosome("", self.max_width, self.max_height)
-                            chromo.set_check(self.valid_sensor_location)
-                            chromo.set_xy(x, y)
-                            self.insert_chromosome(chromo, gid)
-            elif self.config["grid_size"] != None:
-                for xOff in range(self.config["grid_size"]):
-                    for yOff in range(self.config["grid_size"]):
-                        chromo = self.build_grid(xOff, yOff)
-                        self.insert_chromosome(chromo, gid)
-                self.mydb.commit()
-            else:
-                for x in range(int(float(self.seed))):
-                    chromo = self.build_seed(self.config["seed_size"])
-                    self.insert_chromosome(chromo, gid)
-                self.mydb.commit()
+            self.seed_population(int(float(self.seed)))
+        if self.registry != None:
+            self.registry.save()
         return
 
 
-
 if __name__ == "__main__":
     print "GA Reproduction"
     parser = optparse.OptionParser(usage="usage: %prog [options]")
@@ -636,6 +1392,10 @@ if __name__ == "__main__":
                       "--manager_id",
                       dest="manager_id",
                       help="Manager id from the DB.")
+    parser.add_option("--island",
+                      dest="island",
+                      help="Island of the manager to breed.",
+                      default="0")
     parser.add_option("--mutation_rate",
                       dest="mutation_rate",
                       help="Rate of mutation in new chromosomes.",
@@ -670,6 +1430,12 @@ if __name__ == "__main__":
                       help="Perform greedy search over layout.",
                       action="store_true",
                       default=False)
+    parser.add_option("--registry",
+                      dest="registry",
+                      help="File to keep the genome registry in.")
+    parser.add_option("--surrogate",
+                      dest="surrogate",
+                      help="Fraction of bred children to evaluate, those a learned fitness surrogate ranks best.")
     (options, args) = parser.parse_args()
     if None in [options.site, options.generation]:
         if options.site == None:
@@ -678,6 +1444,11 @@ if __name__ == "__main__":
             print "ERROR: Missing -g / --generation"
         parser.print_help()
         sys.exit()
+    if options.surrogate != None:
+        if not 0.0 < float(options.surrogate) <= 1.0:
+            print "ERROR: --surrogate must be more than 0 and at most 1"
+            parser.print_help()
+            sys.exit()
     
     if options.random == None:
         random.seed()
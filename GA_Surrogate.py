@@ -0,0 +1,156 @@
+#!/usr/bin/python
+#*****************************************************************************#
+#**
+#**  WASP GA Fitness Surrogate
+#** 
+#**    Brian L Thomas, 2011
+#** 
+#** Tools by the Center for Advanced Studies in Adaptive Systems at
+#**  the School of Electrical Engineering and Computer Science at
+#**  Washington State University
+#** 
+#** Copyright Washington State University, 2017
+#** Copyright Brian L. Thomas, 2017
+#** 
+#** All rights reserved
+#** Modification, distribution, and sale of this work is prohibited without
+#**  permission from Washington State University
+#** 
+#** If this code is used for public research, any resulting publications need
+#** to cite work done by Brian L. Thomas at the Center for Advanced Study of 
+#** Adaptive Systems (CASAS) at Washington State University.
+#**  
+#** Contact: Brian L. Thomas (bthomas1@wsu.edu)
+#** Contact: Diane J. Cook (cook@eecs.wsu.edu)
+#*****************************************************************************#
+
+import math
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+
+def prediction_error(predicted, actual):
+    """
+    Returns (mean absolute error, root mean squared error, correlation) of
+    the predicted values against the actual ones.
+    """
+    count = float(len(actual))
+    diffs = [p - a for (p, a) in zip(predicted, actual)]
+    mae = sum([abs(d) for d in diffs]) / count
+    rmse = math.sqrt(sum([d * d for d in diffs]) / count)
+    mp = sum(predicted) / count
+    ma = sum(actual) / count
+    cov = sum([(p - mp) * (a - ma) for (p, a) in zip(predicted, actual)])
+    vp = sum([(p - mp) ** 2 for p in predicted])
+    va = sum([(a - ma) ** 2 for a in actual])
+    corr = 0.0
+    if vp > 0 and va > 0:
+        corr = cov / math.sqrt(vp * va)
+    return (mae, rmse, corr)
+
+
+###############################################################################
+#### FitnessSurrogate class
+###############################################################################
+class FitnessSurrogate:
+    """
+    Ridge regression of the accuracy a worker finds for a chromosome, and of
+    each of its annotation accuracies, from which cells hold a sensor hashed
+    into buckets, how many sensors are in each region of the site on a
+    coarse and a fine grid, and the sensor count.  The number of features
+    is fixed by the buckets and grids, not by the site size.
+    
+    Training is incremental: only X'X and X'y of the results added so far
+    are kept for each value, and the weights are solved for again the first
+    time a prediction is asked for after new results came in.  The accuracy
+    is kept under the name None.  A result only trains the annotations it
+    has.
+    """
+    min_results = 100
+    
+    def __init__(self, width, height, alpha=1.0, buckets=512,
+                 regions=(4, 16)):
+        self.width = int(width)
+        self.height = int(height)
+        self.alpha = float(alpha)
+        self.buckets = int(buckets)
+        self.regions = [int(r) for r in regions]
+        self.size = self.buckets + sum([r * r for r in self.regions]) + 2
+        self.xtx = dict()
+        self.xty = dict()
+        self.names = list()
+        self.count = 0
+        self.weights = None
+        return
+    
+    def is_ready(self):
+        return self.count >= self.min_results
+    
+    def features(self, genome):
+        x = numpy.zeros(self.size)
+        cells = genome.cells()
+        for num in cells:
+            x[((num * 2654435761) & 0xffffffff) % self.buckets] += 1.0
+        base = self.buckets
+        for r in self.regions:
+            for num in cells:
+                rx = ((num % self.width) * r) // self.width
+                ry = ((num // self.width) * r) // self.height
+                x[base + (ry * r) + rx] += 1.0
+            base += r * r
+        x[-2] = len(cells)
+        x[-1] = 1.0
+        return x
+    
+    def add(self, genomes, targets):
+        """
+        Trains on the results of the given genomes.
+        
+        genomes - list of Genome.
+        targets - list of dict of value by name, the accuracy under None.
+        """
+        if len(genomes) == 0:
+            return
+        xs = numpy.array([self.features(g) for g in genomes])
+        for t in targets:
+            for name in t.keys():
+                if name not in self.xty:
+                    self.xtx[name] = numpy.zeros((self.size, self.size))
+                    self.xty[name] = numpy.zeros(self.size)
+                    self.names.append(name)
+        for name in self.names:
+            rows = [i for i in range(len(targets)) if name in targets[i]]
+            if len(rows) == 0:
+                continue
+            ys = numpy.array([targets[i][name] for i in rows])
+            self.xtx[name] += numpy.dot(xs[rows].T, xs[rows])
+            self.xty[name] += numpy.dot(xs[rows].T, ys)
+        self.count += len(genomes)
+        self.weights = None
+        return
+    
+    def fit(self):
+        reg = numpy.eye(self.size) * self.alpha
+        # The constant feature is the intercept, it is not shrunk
+        reg[-1, -1] = 0.0
+        self.weights = numpy.column_stack(
+            [numpy.linalg.solve(self.xtx[name] + reg, self.xty[name])
+             for name in self.names])
+        return
+    
+    def predict(self, genomes):
+        """
+        Returns a dict of predicted value by name for each of the genomes.
+        """
+        if self.weights is None:
+            self.fit()
+        xs = numpy.array([self.features(g) for g in genomes])
+        values = numpy.dot(xs, self.weights)
+        predictions = list()
+        for row in values.tolist():
+            predictions.append(dict(zip(self.names, row)))
+        return predictions
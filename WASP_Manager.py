@@ -33,13 +33,12 @@ import random
 import re
 import shutil
 import pgdb
-import subprocess
 import sys
 import time
 import uuid
 import xml.dom.minidom
 
-from GA_Reproduce import Chromosome
+from GA_Reproduce import Pollinator
 
 
 
@@ -52,6 +51,7 @@ class Manager:
         self.data_dir = str(options.data)
         self.orig_dir = str(options.orig)
         self.site = os.path.join(self.directory, "site.xml")
+        self.registry = os.path.join(self.directory, "genomes.registry")
         self.boss = str(options.boss)
         self.pypath = str(options.pypath)
         self.generation = int(float(options.generation))
@@ -65,6 +65,17 @@ class Manager:
         self.max_generations = options.max_generations
         self.grid_size = options.grid_size
         self.greedy_search = options.greedy_search
+        self.steady_state = options.steady_state
+        self.in_flight = self.population
+        if options.in_flight != None:
+            self.in_flight = int(float(options.in_flight))
+        self.tournament_size = int(float(options.tournament_size))
+        self.sent = set()
+        self.islands = int(float(options.islands))
+        self.migration_interval = int(float(options.migration_interval))
+        self.migration_topology = options.migration_topology
+        self.migrants = int(float(options.migrants))
+        self.surrogate = options.surrogate
         self.manager_id = 0
         self.quit_on_generation = False
         self.xmpp = xmpp.Connection(self.name)
@@ -82,50 +93,89 @@ class Manager:
         self.max_width = int(float(site[0].getAttribute("max_width")))
         self.max_height = int(float(site[0].getAttribute("max_height")))
         self.ann_cache = dict()
-        self.p = None
         self.completed_jobs = collections.deque()
         
         self.mydb = pgdb.connect("", "", "", "", "wasp")
         self.cr = self.mydb.cursor()
         self.get_manager_id()
         
-        found = False
-        if self.generation > 0:
-            query = "SELECT g.gid FROM generation g INNER JOIN chrom_gen cg "
-            query += "ON g.gid=cg.gid INNER JOIN chromosome c ON c.cid=cg.cid "
-            query += "WHERE cg.mid=%s " % self.manager_id
-            if not self.greedy_search:
-                #query += "AND cg.final_fitness IS NOT NULL "
-                #else:
-                query += "AND c.accuracy<>-1 "
-            query += "ORDER BY g.gid DESC LIMIT 1"
-            self.cr.execute(query)
-            r = self.cr.fetchone()
-            if r != None:
-                found = True
-                self.generation = int(float(r[0]))
-        if not found:
-            self.generation = 1
-            cmd = "%s GA_Reproduce.py " % self.pypath
-            cmd += "-s %s " % os.path.join(self.directory, "site.xml")
-            cmd += "-r %f " % random.random()
-            cmd += "-g %s " % str(self.generation)
-            cmd += "-m %s " % self.manager_id
-            cmd += "--seed=%s " % str(self.population)
-            if self.seed_size != None:
-                cmd += "--seed_size=%s " % str(self.seed_size)
-            if self.size_limit != None:
-                cmd += "--size_limit=%s " % str(self.size_limit)
-            if self.grid_size != None:
-                cmd += "--grid_size=%s " % str(self.grid_size)
-            if self.greedy_search:
-                cmd += "--greedy_search "
-            cmd = str(cmd).strip()
-            print cmd
-            subprocess.call(str(cmd).split())
+        self.engines = list()
+        for island in range(self.islands):
+            gid = None
+            if self.generation > 0:
+                gid = self.get_last_generation(island)
+            engine = Pollinator(self.get_engine_options(island), self.mydb)
+            if island > 0:
+                # Islands train and screen with one fitness surrogate
+                engine.surrogate = self.engines[0].surrogate
+            engine.setup()
+            if island > 0:
+                # Islands share one genome registry
+                engine.registry = self.engines[0].registry
+            if gid != None and self.steady_state:
+                engine.resume_steady_state(gid)
+            elif gid != None:
+                engine.resume(gid)
+            else:
+                engine.seed_population(self.population)
+                engine.start_generation()
+            if self.steady_state:
+                engine.start_steady_state(self.tournament_size)
+            self.engines.append(engine)
+        self.engine = self.engines[0]
+        self.generation = self.engine.nextgen - 1
+        self.ann_cache = self.engine.annotation_ids
         self.has_set_auto = False
         return
     
+    def get_last_generation(self, island):
+        """
+        Returns the latest generation of the given island with results in
+        the DB, or None.
+        """
+        query = "SELECT g.gid FROM generation g INNER JOIN chrom_gen cg "
+        query += "ON g.gid=cg.gid INNER JOIN chromosome c ON c.cid=cg.cid "
+        query += "WHERE cg.mid=%s AND cg.island=%s " % (self.manager_id,
+                                                         str(island))
+        if not self.greedy_search:
+            #query += "AND cg.final_fitness IS NOT NULL "
+            #else:
+            query += "AND c.accuracy<>-1 "
+        query += "ORDER BY g.gid DESC LIMIT 1"
+        self.cr.execute(query)
+        r = self.cr.fetchone()
+        if r != None:
+            return int(float(r[0]))
+        return None
+    
+    def get_engine_options(self, island):
+        """
+        Returns the options GA_Reproduce.py would be run with for the given
+        island of this manager, to hold its Pollinator in memory instead.
+        """
+        options = optparse.Values()
+        options.site = self.site
+        options.manager_id = self.manager_id
+        options.island = str(island)
+        options.generation = str(self.generation)
+        options.seed = str(self.population)
+        options.population = str(self.population)
+        options.mutation_rate = str(self.mutation_rate)
+        options.crossover = str(self.crossover)
+        options.survival_rate = str(self.survival_rate)
+        options.reproduction_rate = str(self.reproduction_rate)
+        options.seed_size = "10"
+        if self.seed_size != None:
+            options.seed_size = str(self.seed_size)
+        options.size_limit = self.size_limit
+        options.grid_size = self.grid_size
+        options.greedy_search = self.greedy_search
+        options.surrogate = self.surrogate
+        options.registry = None
+        if island == 0:
+            options.registry = self.registry
+        return options
+    
     def connect(self):
         self.xmpp.connect(self.username, self.password)
         return
@@ -227,53 +277,90 @@ class Manager:
         #    return
         self.work_this_gen += 1
         self.last_gen = datetime.datetime.now()
+        if self.steady_state:
+            self.sent = set()
+            self.running_jobs = 0
+            self.fill_jobs()
+            return
+        for island in range(len(self.engines)):
+            self.send_island(island)
+        if self.running_jobs == 0:
+            self.xmpp.callLater(1, self.next_generation)
+        return
+    
+    def send_island(self, island):
+        """
+        Sends the chromosomes of the given island still waiting for a result.
+        """
+        engine = self.engines[island]
         chroms = list()
         data_files = os.listdir(self.data_dir)
         data_files.sort()
         orig_files = os.listdir(self.orig_dir)
         orig_files.sort()
         
-        query = "SELECT c.genome "
-        query += "FROM (chromosome c INNER JOIN chrom_gen cg ON c.cid=cg.cid) "
-        query += "INNER JOIN generation g ON cg.gid=g.gid "
-        if self.greedy_search:
-            query += "WHERE cg.final_fitness IS NULL "
-        else:
-            query += "WHERE c.accuracy=-1 "
-        query += "AND g.gid=%s AND cg.mid=%s " % (str(self.generation), self.manager_id)
-        query += "LIMIT 10000"
-        self.cr.execute(query)
-        row = self.cr.fetchone()
-        while row != None:
-            chroms.append((str(row[0]).strip(),str(uuid.uuid4().hex).strip()))
-            row = self.cr.fetchone()
+        for genome in engine.get_waiting()[:10000]:
+            chroms.append((genome,str(uuid.uuid4().hex).strip()))
         
         print "sending jobs:",len(chroms)
         for (c,u) in chroms:
-            msg = "<job "
-            msg += "manager=\"%s\" " % str(self.username)
-            msg += "run_id=\"%s\" " % self.run_id
-            msg += "id=\"%s\" >" % str(u)
-            msg += "<chromosome_file "
-            msg += "filename=\"%s.xml\" >" % str(u)
-            msg += "<chromosome "
-            msg += "data=\"%s\" " % str(c)
-            msg += "fitness=\"-1\" "
-            msg += "generation=\"%s\" " % str(self.generation)
-            msg += "info=\"\" />"
-            msg += "</chromosome_file>"
-            msg += "<data_files>"
-            msg += ",".join(data_files)
-            msg += ",site.xml"
-            msg += "</data_files>"
-            msg += "<orig_files>"
-            msg += ",".join(orig_files)
-            msg += "</orig_files>"
-            msg += "</job>"
-            self.xmpp.send(msg, self.boss)
+            self.send_job(c, u, engine.nextgen - 1, data_files, orig_files)
+            self.running_jobs += 1
+        return
+    
+    def send_job(self, genome, job_id, generation, data_files, orig_files):
+        msg = "<job "
+        msg += "manager=\"%s\" " % str(self.username)
+        msg += "run_id=\"%s\" " % self.run_id
+        msg += "id=\"%s\" >" % str(job_id)
+        msg += "<chromosome_file "
+        msg += "filename=\"%s.xml\" >" % str(job_id)
+        msg += "<chromosome "
+        msg += "data=\"%s\" " % str(genome)
+        msg += "fitness=\"-1\" "
+        msg += "generation=\"%s\" " % str(generation)
+        msg += "info=\"\" />"
+        msg += "</chromosome_file>"
+        msg += "<data_files>"
+        msg += ",".join(data_files)
+        msg += ",site.xml"
+        msg += "</data_files>"
+        msg += "<orig_files>"
+        msg += ",".join(orig_files)
+        msg += "</orig_files>"
+        msg += "</job>"
+        self.xmpp.send(msg, self.boss)
+        return
+    
+    def fill_jobs(self):
+        """
+        Steady state: tops the jobs in flight back up to self.in_flight,
+        sending the chromosomes still waiting for a result first and then
+        new children.  Finishes once nothing is left in flight.
+        """
+        data_files = os.listdir(self.data_dir)
+        data_files.sort()
+        orig_files = os.listdir(self.orig_dir)
+        orig_files.sort()
+        waiting = [g for g in self.engine.get_waiting() if g not in self.sent]
+        stop = self.quit_on_generation
+        if self.max_generations != None:
+            if int(float(self.max_generations)) <= self.engine.get_next_gid():
+                stop = True
+        while self.running_jobs < self.in_flight:
+            if len(waiting) > 0:
+                genome = waiting.pop()
+            elif stop or len(self.engine.chromosomes) == 0:
+                break
+            else:
+                genome = self.engine.breed_one()
+                self.generation = self.engine.nextgen - 1
+            self.sent.add(genome)
+            self.send_job(genome, str(uuid.uuid4().hex).strip(),
+                          self.generation, data_files, orig_files)
             self.running_jobs += 1
         if self.running_jobs == 0:
-            self.xmpp.callLater(1, self.next_generation)
+            self.xmpp.callLater(1, self.finish)
         return
     
     def auto_refresh_jobs(self):
@@ -288,10 +375,21 @@ class Manager:
         if len(self.completed_jobs) > 0:
             (data,fitness,info,generation) = self.completed_jobs.popleft()
             print "\tM=%s\tG=%s\tF=%s" % (self.manager_id, generation, fitness)
-            query = "SELECT cid FROM chromosome WHERE genome='%s'" % str(data).strip()
-            self.cr.execute(query)
-            r = self.cr.fetchone()
-            cid = str(r[0]).strip()
+            islands = list()
+            cid = None
+            for k in range(len(self.engines)):
+                if str(data).strip() in self.engines[k].jobs:
+                    islands.append(k)
+                found = self.engines[k].record_result(str(data).strip(),
+                                                      fitness, info)
+                if found != None:
+                    cid = found
+            if cid == None:
+                # Result for an earlier generation, still worth recording
+                query = "SELECT cid FROM chromosome WHERE genome='%s'" % str(data).strip()
+                self.cr.execute(query)
+                r = self.cr.fetchone()
+                cid = str(r[0]).strip()
             if self.greedy_search:
                 #if str(fitness).strip() != "-1":
                 query = "UPDATE chrom_gen SET final_fitness=%s " % str(fitness).strip()
@@ -327,8 +425,17 @@ class Manager:
             self.mydb.commit()
             self.running_jobs -= 1
             print "running jobs:",self.running_jobs,"\t\t%d" % len(self.completed_jobs)
-            if self.running_jobs == 0:
-                self.xmpp.callLater(1, self.next_generation)
+            if self.steady_state:
+                self.sent.discard(str(data).strip())
+                self.fill_jobs()
+            else:
+                # Islands move on as soon as their own results are all in,
+                # a genome can be waited on by more than one of them
+                for island in islands:
+                    if len(self.engines[island].get_waiting()) == 0:
+                        self.evolve_island(island)
+                if self.running_jobs == 0:
+                    self.xmpp.callLater(1, self.next_generation)
             self.xmpp.callLater(0.000001, self.load_completed_jobs)
         else:
             self.xmpp.callLater(1, self.load_completed_jobs)
@@ -432,61 +539,62 @@ class Manager:
     
     def next_generation(self):
         found = 0
-        query = "SELECT count(*) "
-        query += "FROM (chromosome c INNER JOIN chrom_gen cg ON c.cid=cg.cid) "
-        query += "INNER JOIN generation g ON cg.gid=g.gid "
-        if self.greedy_search:
-            query += "WHERE cg.final_fitness IS NULL AND "
-        else:
-            query += "WHERE c.accuracy=-1 AND "
-        query += "g.gid=%s AND cg.mid=%s" % (str(self.generation), self.manager_id)
-        self.cr.execute(query)
-        row = self.cr.fetchone()
-        found = int(float(str(row[0]).strip()))
+        for engine in self.engines:
+            found += len(engine.get_waiting())
         if found > 0 and self.work_this_gen < self.max_work_per_gen:
             self.xmpp.callLater(1, self.do_work)
             return
         
+        for island in range(len(self.engines)):
+            self.evolve_island(island)
+        if self.running_jobs == 0:
+            self.xmpp.callLater(1, self.finish)
+        return
+    
+    def evolve_island(self, island):
+        """
+        Breeds the next generation of the given island and sends out its
+        jobs, taking in migrants every self.migration_interval generations.
+        """
+        engine = self.engines[island]
         if self.quit_on_generation:
-            self.xmpp.callLater(0, self.finish)
             return
-        self.generation += 1
         if self.max_generations != None:
-            if int(float(self.max_generations)) <= self.generation:
+            if int(float(self.max_generations)) <= engine.nextgen:
                 #if 4 <= self.generation:
-                self.xmpp.callLater(1, self.finish)
                 return
-        cmd = "%s GA_Reproduce.py " % str(self.pypath)
-        cmd += "--manager_id=%s " % str(self.manager_id)
-        cmd += "--site=%s " % str(self.site)
-        cmd += "--generation=%s " % str(self.generation)
-        cmd += "--random=%f " % random.random()
-        cmd += "--mutation_rate=%f " % self.mutation_rate
-        cmd += "--crossover=%s " % str(self.crossover)
-        cmd += "--survival_rate=%f " % self.survival_rate
-        cmd += "--reproduction_rate=%f " % self.reproduction_rate
-        cmd += "--population=%s " % str(self.population)
-        if self.seed_size != None:
-            cmd += "--seed_size=%s " % str(self.seed_size)
-        if self.size_limit != None:
-            cmd += "--size_limit=%s " % str(self.size_limit)
-        if self.greedy_search:
-            cmd += "--greedy_search "
-        cmd = str(cmd).strip()
-        print cmd
-        self.p = subprocess.Popen(str(cmd).split())
-        #subprocess.call(str(cmd).split())
-        self.xmpp.callLater(1, self.wait_next_generation)
+        engine.score_generation()
+        if len(self.engines) > 1:
+            if (engine.nextgen - 1) % self.migration_interval == 0:
+                self.migrate(island)
+        engine.breed_generation()
+        if island == 0:
+            self.generation = engine.nextgen - 1
+        self.work_this_gen = 0
+        self.send_island(island)
         return
     
-    def wait_next_generation(self):
-        if self.p.poll() == None:
-            self.xmpp.callLater(1, self.wait_next_generation)
-            return
-        self.p = None
-        self.running_jobs = 0
-        self.work_this_gen = 0
-        self.xmpp.callLater(1, self.do_work)
+    def migrate(self, island):
+        """
+        Moves copies of the self.migrants fittest chromosomes of the islands
+        self.migration_topology links to the given island into it.
+        """
+        others = list()
+        for k in range(len(self.engines)):
+            if k != island:
+                others.append(k)
+        if self.migration_topology == "ring":
+            sources = [(island - 1) % len(self.engines)]
+        elif self.migration_topology == "random":
+            sources = [random.choice(others)]
+        else:
+            sources = others
+        migrants = list()
+        for k in sources:
+            migrants.extend(self.engines[k].get_migrants(self.migrants))
+        print "island %d: %d migrants from %s" % (island, len(migrants),
+                                                  str(sources))
+        self.engines[island].receive_migrants(migrants)
         return
 
 
@@ -560,6 +668,37 @@ if __name__ == "__main__":
                       help="Perform greedy search on layout.",
                       action="store_true",
                       default=False)
+    parser.add_option("--steady_state",
+                      dest="steady_state",
+                      help="Breed a child as each result comes in instead of by generation.",
+                      action="store_true",
+                      default=False)
+    parser.add_option("--in_flight",
+                      dest="in_flight",
+                      help="Jobs to keep in flight in steady state, defaults to the population size.")
+    parser.add_option("--islands",
+                      dest="islands",
+                      help="Number of sub-populations to breed.",
+                      default="1")
+    parser.add_option("--migration_interval",
+                      dest="migration_interval",
+                      help="Generations between migrations to an island.",
+                      default="5")
+    parser.add_option("--migration_topology",
+                      dest="migration_topology",
+                      help="Islands migrants come from: ring, all or random.",
+                      default="ring")
+    parser.add_option("--migrants",
+                      dest="migrants",
+                      help="Chromosomes each source island sends.",
+                      default="2")
+    parser.add_option("--surrogate",
+                      dest="surrogate",
+                      help="Fraction of bred children to evaluate, those a learned fitness surrogate ranks best.")
+    parser.add_option("--tournament_size",
+                      dest="tournament_size",
+                      help="Chromosomes in each steady state tournament.",
+                      default="3")
     (options, args) = parser.parse_args()
     if None in [options.jid, options.password, options.dir, options.data, options.orig]:
         if options.jid == None:
@@ -574,6 +713,28 @@ if __name__ == "__main__":
             print "ERROR: Missing --orig"
         parser.print_help()
         sys.exit()
+    if options.steady_state and options.greedy_search:
+        print "ERROR: --steady_state can not be used with --greedy_search"
+        parser.print_help()
+        sys.exit()
+    if int(float(options.islands)) > 1:
+        if options.steady_state or options.greedy_search:
+            print "ERROR: --islands can not be used with --steady_state or --greedy_search"
+            parser.print_help()
+            sys.exit()
+    if options.migration_topology not in ["ring", "all", "random"]:
+        print "ERROR: --migration_topology must be ring, all or random"
+        parser.print_help()
+        sys.exit()
+    if int(float(options.migration_interval)) < 1:
+        print "ERROR: --migration_interval must be at least 1"
+        parser.print_help()
+        sys.exit()
+    if options.surrogate != None:
+        if not 0.0 < float(options.surrogate) <= 1.0:
+            print "ERROR: --surrogate must be more than 0 and at most 1"
+            parser.print_help()
+            sys.exit()
     
     if options.random == None:
         random.seed()
@@ -39,10 +39,21 @@ import time
 import uuid
 import xml.dom.minidom
 
+from CAMS_Emulator import StreamCache
+from GA_Fitness import Evaluator, format_info
+from GA_Reproduce import Chromosome
+
+
+# Bytes of emulated sensor streams cached by a worker, across all threads
+CACHE_BUDGET = 256*1024*1024
+# Time after which the Evaluator of a run with no jobs is closed
+RUN_IDLE = datetime.timedelta(hours=1)
+
 
 
 class Slave(threading.Thread):
-    def __init__(self, pypath, directory, tmp_dir, data_queue, msg_queue):
+    def __init__(self, pypath, directory, tmp_dir, data_queue, msg_queue,
+                 cache_budget=CACHE_BUDGET):
         threading.Thread.__init__(self)
         self.mailbox = data_queue
         self.send_msg = msg_queue
@@ -50,13 +61,40 @@ class Slave(threading.Thread):
         self.directory = directory
         self.tmp_dir = tmp_dir
         self.first_job = True
+        self.evaluators = dict()
+        self.last_used = dict()
+        self.stream_cache = StreamCache(cache_budget)
         return
     
+    def get_evaluator(self, run_id):
+        """
+        Returns the Evaluator for the given run, so the emulated sensor
+        streams of a run stay cached between that run's jobs.  Evaluators
+        of runs idle for RUN_IDLE are closed, along with their ar server.
+        """
+        now = datetime.datetime.now()
+        for rid in self.evaluators.keys():
+            if rid != run_id and now - self.last_used[rid] > RUN_IDLE:
+                self.evaluators.pop(rid).close()
+                del self.last_used[rid]
+        self.last_used[run_id] = now
+        if run_id not in self.evaluators:
+            ar_path = os.path.join(self.directory, "ar")
+            fov_cache = os.path.join(self.directory, "fov")
+            traces = os.path.join(self.directory, run_id, "traces")
+            self.evaluators[run_id] = Evaluator(self.tmp_dir, ar_path,
+                                                fov_cache=fov_cache,
+                                                traces=traces,
+                                                stream_cache=self.stream_cache)
+        return self.evaluators[run_id]
+    
     def run(self):
         print self, "Slave running!"
         while True:
             data = self.mailbox.get()
             if data == "quit":
+                for evaluator in self.evaluators.values():
+                    evaluator.close()
                 return
             if self.first_job:
                 self.first_job = False
@@ -101,59 +139,28 @@ class Slave(threading.Thread):
             if "site.xml" in job_files:
                 job_files.remove("site.xml")
             
-            emulated = list()
-            p = None
+            run_dir = os.path.join(self.directory, job_run_id)
+            file_site = os.path.join(run_dir, "site.xml")
+            movement = list()
             for df in job_files:
-                outFile = os.path.join(job_directory, "%s.xml" % str(uuid.uuid4().hex))
-                cmd = "%s CAMS_Emulator.py " % str(self.pypath)
-                cmd += "--site=%s " % os.path.join(self.directory,
-                                                   job_run_id,
-                                                   "site.xml")
-                cmd += "--movement=%s " % os.path.join(self.directory,
-                                                       job_run_id,
-                                                       df)
-                cmd += "--chromosome=%s " % os.path.join(job_directory,
-                                                         job_chromosome)
-                cmd += "--output=%s" % outFile
-                
-                p = subprocess.Popen(str(cmd).split())
-                emulated.append(outFile)
-                
-                while p.poll() == None:
-                    time.sleep(1)
-            
-            p = None
-            
-            cmd = "cp %s %s" % (os.path.join(self.directory, "ar"),
-                                os.path.join(job_directory, "ar"))
-            subprocess.call(str(cmd).split())
-            
-            cmd = "%s GA_Fitness.py " % str(self.pypath)
-            cmd += "--files=%s " % ",".join(emulated)
-            cmd += "--chromosome=%s " % os.path.join(job_directory,
-                                                     job_chromosome)
-            cmd += "--site=%s " % os.path.join(self.directory,
-                                               job_run_id,
-                                               "site.xml")
-            cmd += "--method=CookAr "
-            cmd += "--work=%s" % str(job_directory)
-            p = subprocess.Popen(str(cmd).split())
-            
-            while p.poll() == None:
-                time.sleep(1)
-            
-            p = None
-            emulated = None
-            
-            chrom_data = ""
-            if os.path.isfile(os.path.join(job_directory, job_chromosome)):
-                data = open(os.path.join(job_directory, job_chromosome))
-                info = data.readlines()
-                chrom_data = "".join(info)
-                data.close()
+                movement.append(os.path.join(run_dir, df))
+            origs = list()
+            for of in job_origs:
+                origs.append(os.path.join(run_dir, of))
             
-            if chrom_data != "":
-                chromosome_xml = chrom_data
+            dom = xml.dom.minidom.parse(file_site)
+            site = dom.getElementsByTagName("site")
+            max_width = int(float(site[0].getAttribute("max_width")))
+            max_height = int(float(site[0].getAttribute("max_height")))
+            dom = None
+            chrom = Chromosome(os.path.join(job_directory, job_chromosome),
+                               max_width, max_height)
+            evaluator = self.get_evaluator(job_run_id)
+            (fitness, calc) = evaluator.evaluate(file_site, movement, origs,
+                                                 chrom.get_text())
+            chrom.fitness = fitness
+            chrom.info = format_info(calc)
+            chromosome_xml = str(chrom)
             
             shutil.rmtree(job_directory)
         except:
@@ -209,7 +216,8 @@ class Worker:
         self.valid_files = list()
         for x in range(self.numThreads):
             s = Slave(self.pypath, self.directory, self.tmp_dir,
-                      self.queue_job, self.queue_msg)
+                      self.queue_job, self.queue_msg,
+                      CACHE_BUDGET / self.numThreads)
             self.workers.append(s)
             s.start()
         return
@@ -358,6 +366,10 @@ class Worker:
                                                    df)
             cmd += "--chromosome=%s " % os.path.join(self.job_directory,
                                                      self.job_chromosome)
+            cmd += "--fov_cache=%s " % os.path.join(self.directory, "fov")
+            cmd += "--traces=%s " % os.path.join(self.directory,
+                                                 self.job_run_id,
+                                                 "traces")
             cmd += "--output=%s" % outFile
             self.tasks.append(str(cmd))
             #self.p.append(subprocess.Popen(str(cmd).split()))
@@ -31,7 +31,6 @@ import matplotlib.cm as cm
 import matplotlib.pyplot as plt
 import ConfigParser
 import copy
-import datetime
 import math
 import optparse
 import os
@@ -40,40 +39,11 @@ import re
 import sys
 import xml.dom.minidom
 
-from CAMS_Emulator import PersonEvent
+from CAMS_Emulator import HOLD_OFF, PersonEvent
+from CAMS_Time import SECOND
 
 
 
-def get_datetime(newVal):
-    """
-    Takes the given string in format of YYYY-MM-DD HH:MM:SS.ms and converts it
-    to a datetime.datetime() object.  The ms field is optional.
-    
-    newVal - string to convert to a datetime.datetime() object.
-    """
-    stuff = re.split('\s+', newVal)
-    date = re.split('-', stuff[0])
-    time = re.split(':', stuff[1])
-    sec = []
-    try:
-        if re.search('\.', time[2]) == None:
-            sec.append(time[2])
-            sec.append("0")
-        else:
-            sec = re.split('\.', time[2])
-    except:
-        print newVal
-        z = int("45.2")
-    dt = datetime.datetime(int(date[0]),
-                           int(date[1]),
-                           int(date[2]),
-                           int(time[0]),
-                           int(time[1]),
-                           int(sec[0]),
-                           int(sec[1]))
-    return dt
-
-
 
 ###############################################################################
 #### Space class
@@ -156,7 +126,7 @@ class MotionSensor(Sensor):
             self.last_motion = pevent.dt
         else:
             if self.state == "ON":
-                if (pevent.dt - self.last_motion) >= datetime.timedelta(0,2.5):
+                if (pevent.dt - self.last_motion) >= HOLD_OFF:
                     self.state = "OFF"
                     self.add_event(pevent.dt, self.id, self.state, pevent)
         return
@@ -307,8 +277,8 @@ class AnnViewer:
         totalTicks = 0
         for mf in range(len(self.moves)):
             activeAnn = re.sub('-begin|-end', '', self.moves[mf][0].annotation)
-            step = copy.deepcopy(self.moves[mf][0].dt)
-            stepper = datetime.timedelta(seconds=0.1)
+            step = self.moves[mf][0].dt
+            stepper = SECOND / 10
             t = 0
             while t < len(self.moves[mf]):
                 if self.moves[mf][t].annotation != "":
@@ -87,15 +87,29 @@ CREATE TABLE chrom_gen(
     cid integer NOT NULL, 
     gid integer NOT NULL, 
     mid integer NOT NULL, 
-    final_fitness numeric);
+    final_fitness numeric,
+    seq bigint NOT NULL,
+    island integer NOT NULL DEFAULT 0,
+    predicted numeric);
 
-ALTER TABLE ONLY chrom_gen ADD CONSTRAINT chrom_gen_pkey PRIMARY KEY (cid, gid, mid);
+CREATE SEQUENCE chrom_gen_seq_seq
+    START WITH 1
+    INCREMENT BY 1
+    NO MAXVALUE
+    NO MINVALUE
+    CACHE 1;
+
+ALTER SEQUENCE chrom_gen_seq_seq OWNED BY chrom_gen.seq;
+ALTER TABLE chrom_gen ALTER COLUMN seq SET DEFAULT nextval('chrom_gen_seq_seq'::regclass);
+
+ALTER TABLE ONLY chrom_gen ADD CONSTRAINT chrom_gen_pkey PRIMARY KEY (cid, gid, mid, island);
 ALTER TABLE ONLY chrom_gen ADD CONSTRAINT chrom_gen_cid_fkey FOREIGN KEY (cid) REFERENCES chromosome(cid) ON UPDATE CASCADE ON DELETE CASCADE;
 ALTER TABLE ONLY chrom_gen ADD CONSTRAINT chrom_gen_gid_fkey FOREIGN KEY (gid) REFERENCES generation(gid) ON UPDATE CASCADE ON DELETE CASCADE;
 ALTER TABLE ONLY chrom_gen ADD CONSTRAINT chrom_gen_mid_fkey FOREIGN KEY (mid) REFERENCES manager(mid) ON UPDATE CASCADE ON DELETE CASCADE;
 
 CREATE INDEX genome_index ON chromosome USING btree (genome);
 CREATE INDEX manager_index ON chrom_gen USING btree (mid);
+CREATE INDEX chrom_gen_seq_index ON chrom_gen USING btree (mid, seq);
 
 
 